@@ -1,10 +1,14 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, g, request, jsonify, render_template, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
+import json
 import os
+import threading
+import time
 from werkzeug.utils import secure_filename
-from backend.document_processor import DocumentProcessor
-from backend.vector_store import VectorStore
-from backend.rag_chain import RAGChain
+from backend.admission import AdmissionRejected, get_all_stats
+from backend import blocking, metrics, profiling
+from backend.config import Config
+from backend.lazy import Lazy
 
 app = Flask(__name__, 
            template_folder='frontend',
@@ -15,15 +19,99 @@ CORS(app)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
 
-# Initialize components
-# The vector store is now initialized in the gunicorn.conf.py `on_starting` hook.
-document_processor = DocumentProcessor()
-vector_store = VectorStore()
-rag_chain = RAGChain()
+# Components are created on first use (or by warm_up) so importing the app stays cheap;
+# LangChain, chromadb and the Gemini SDK are only imported here.
+# The vector store is indexed in the gunicorn.conf.py `on_starting` hook.
+def _create_document_processor():
+    from backend.document_processor import DocumentProcessor
+    return DocumentProcessor()
+
+def _create_vector_store():
+    from backend.vector_store import open_vector_store
+    return open_vector_store()
+
+def _create_rag_chain():
+    from backend.rag_chain import RAGChain
+    # Share the app's vector store rather than opening a second Chroma client
+    return RAGChain(vector_store=vector_store.get())
+
+document_processor = Lazy(_create_document_processor)
+vector_store = Lazy(_create_vector_store)
+rag_chain = Lazy(_create_rag_chain)
+
+def warm_up():
+    """Create all components now instead of on the first request that needs them"""
+    start = time.perf_counter()
+    try:
+        rag_chain.get()
+        document_processor.get()
+        print(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"Warm-up failed, components will be created on first use: {str(e)}")
+        return
+    if Config.PREWARM_TOP_N > 0:
+        # Serve the most asked questions from the caches from the start
+        from backend.query_log import start_prewarming
+        start_prewarming(rag_chain.get())
+
+if Config.WARM_UP == "eager":
+    warm_up()
+elif Config.WARM_UP == "background":
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# With index snapshots each request reads one index version from start to finish,
+# however many searches it makes and whatever is published meanwhile
+serving_snapshots = Config.INDEX_SNAPSHOTS and not Config.INDEX_ARTIFACT_PATH
+if serving_snapshots:
+    @app.before_request
+    def pin_index_version():
+        if vector_store.initialized:
+            vector_store.get().pin()
+
+    @app.teardown_request
+    def release_index_version(error=None):
+        if vector_store.initialized:
+            vector_store.get().release()
+
+# Per-request profiling hooks are only installed when profiling is configured
+if profiling.profiling_enabled():
+    @app.before_request
+    def start_profiling():
+        profiling.request_started()
+        if not request.path.startswith('/api/profiles'):
+            g.profiler = profiling.maybe_start(request.headers.get('X-Profile-Token'), f"{request.method} {request.path}")
+
+    @app.after_request
+    def finish_profiling(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+
+        def stop():
+            try:
+                profiler.stop(response.status_code)
+            except Exception as e:
+                print(f"Error writing profile {profiler.id}: {str(e)}")
+
+        response.headers['X-Profile-Id'] = profiler.id
+        if response.is_streamed:
+            # A streamed body (/api/query-batch) is produced after this hook; profile until it is sent
+            response.call_on_close(stop)
+        else:
+            stop()
+        return response
+
+    @app.teardown_request
+    def abandon_profiling(error=None):
+        profiling.request_finished()
+        # A request that failed before producing a response still releases the profiler
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop(500)
+
 @app.route('/')
 def index():
     """Serve the main page"""
@@ -37,7 +125,51 @@ def serve_js():
 @app.route('/api/health')
 def health():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "message": "Indian Legal RAG Chatbot API"})
+    return jsonify({"status": "healthy", "message": "Indian Legal RAG Chatbot API", "ready": rag_chain.initialized})
+
+@app.route('/api/stats')
+def stats():
+    """Runtime statistics for this worker"""
+    return jsonify({
+        "pid": os.getpid(),
+        "ready": rag_chain.initialized,
+        "coalescing": rag_chain.get().get_coalescing_stats() if rag_chain.initialized else None,
+        "session_cache": rag_chain.get().get_session_cache_stats() if rag_chain.initialized else None,
+        "query_cache": rag_chain.get().get_query_cache_stats() if rag_chain.initialized else None,
+        "admission": get_all_stats(),
+        "blocking": blocking.get_stats(),
+        "index_snapshot": vector_store.get().get_snapshot_stats() if serving_snapshots and vector_store.initialized else None
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus metrics aggregated across all gunicorn workers"""
+    if not Config.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled. Set METRICS_ENABLED=true."}), 404
+    body, content_type = metrics.render()
+    return Response(body, mimetype=content_type)
+
+@app.route('/api/profiles')
+def list_profiles():
+    """Recent request profiles (requires the X-Profile-Token header)"""
+    if not Config.PROFILING_TOKEN:
+        return jsonify({"error": "Profiling is disabled. Set PROFILING_TOKEN."}), 404
+    if not profiling.authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({"error": "Invalid profiling token"}), 403
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    return jsonify({"profiles": profiling.list_profiles(limit)})
+
+@app.route('/api/profiles/<profile_id>/<filename>')
+def download_profile(profile_id, filename):
+    """Download one file of a profile, e.g. profile.pstats or allocations.txt"""
+    if not Config.PROFILING_TOKEN:
+        return jsonify({"error": "Profiling is disabled. Set PROFILING_TOKEN."}), 404
+    if not profiling.authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({"error": "Invalid profiling token"}), 403
+    path = profiling.profile_file(profile_id, filename)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=f"{profile_id}-{filename}")
 
 @app.route('/api/upload-documents', methods=['POST'])
 def upload_documents():
@@ -64,19 +196,21 @@ def upload_documents():
                 uploaded_files.append(file_path)
         
         # Process documents
-        documents = document_processor.process_documents(uploaded_files)
+        documents = document_processor.get().process_documents(uploaded_files)
         
         if not documents:
             return jsonify({"error": "No documents could be processed"}), 400
         
         # Add to vector store
-        vector_store.add_documents(documents)
+        vector_store.get().add_documents(documents)
         
         return jsonify({
             "message": f"Successfully processed {len(documents)} document chunks from {len(uploaded_files)} files",
             "files_processed": [os.path.basename(f) for f in uploaded_files]
         })
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         return jsonify({"error": f"Error processing documents: {str(e)}"}), 500
 
@@ -93,22 +227,44 @@ def query_documents():
         if not question:
             return jsonify({"error": "Question cannot be empty"}), 400
         
-        # Handle session management
-        session_id = data.get('session_id')
-        if session_id:
-            rag_chain.load_conversation(session_id)
-        
-        result = rag_chain.query(question)
+        # Each request is answered in its own session; follow-ups hit the in-memory session cache
+        result = rag_chain.get().query(question, data.get('session_id'))
         return jsonify(result)
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         return jsonify({"error": f"Error processing query: {str(e)}"}), 500
 
+@app.route('/api/query-batch', methods=['POST'])
+def query_batch():
+    """Answer many questions at once, streaming one JSON result per line as each finishes"""
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('questions'), list):
+            return jsonify({"error": "A list of questions is required"}), 400
+        
+        questions = [str(q).strip() for q in data['questions']]
+        if not questions or not all(questions):
+            return jsonify({"error": "Questions cannot be empty"}), 400
+        if len(questions) > Config.BATCH_MAX_QUESTIONS:
+            return jsonify({"error": f"At most {Config.BATCH_MAX_QUESTIONS} questions per batch"}), 400
+        
+        results = rag_chain.get().query_batch(questions)
+        lines = (json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+        
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Error processing batch query: {str(e)}"}), 500
+
 @app.route('/api/new-conversation', methods=['POST'])
 def start_new_conversation():
     """Start a new conversation session"""
     try:
-        session_id = rag_chain.start_new_conversation()
+        session_id = rag_chain.get().start_new_conversation()
         return jsonify({
             "session_id": session_id,
             "message": "New conversation started"
@@ -120,8 +276,8 @@ def start_new_conversation():
 def get_conversation_history(session_id):
     """Get conversation history for a session"""
     try:
-        if rag_chain.load_conversation(session_id):
-            history = rag_chain.get_conversation_history()
+        history = rag_chain.get().get_conversation_history(session_id)
+        if history is not None:
             return jsonify({
                 "session_id": session_id,
                 "history": history
@@ -135,12 +291,24 @@ def get_conversation_history(session_id):
 def get_recent_sessions():
     """Get list of recent conversation sessions"""
     try:
-        limit = request.args.get('limit', 10, type=int)
-        sessions = rag_chain.get_recent_sessions(limit)
-        return jsonify({"sessions": sessions})
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        sessions = rag_chain.get().get_recent_sessions(limit, offset)
+        return jsonify({"sessions": sessions, "limit": limit, "offset": offset})
     except Exception as e:
         return jsonify({"error": f"Error getting recent sessions: {str(e)}"}), 500
 
+@app.route('/api/hot-questions', methods=['GET'])
+def get_hot_questions():
+    """Most asked question clusters over the query-log window"""
+    try:
+        from backend.query_log import QueryLog
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        clusters = QueryLog(rag_chain.get().sessions.store).hot_clusters(limit)
+        return jsonify({"clusters": clusters, "window_hours": Config.QUERY_LOG_WINDOW_HOURS})
+    except Exception as e:
+        return jsonify({"error": f"Error getting hot questions: {str(e)}"}), 500
+
 @app.route('/api/initialize-with-existing-pdfs', methods=['POST'])
 def initialize_with_existing_pdfs():
     """Initialize the system with PDFs in the current directory"""
@@ -162,23 +330,36 @@ def initialize_with_existing_pdfs():
         if not pdf_files:
             return jsonify({"message": "No PDF files found in current directory or uploads folder"})
         
+        # Only files not yet (fully) indexed; a partial one resumes from its last checkpoint
+        pdf_files = vector_store.get().pending_files(pdf_files)
+        if not pdf_files:
+            return jsonify({"message": "All PDF files are already indexed", "files_processed": []})
+        
         # Process the PDF files
-        documents = document_processor.process_documents(pdf_files)
+        documents = document_processor.get().process_documents(pdf_files)
         
         if not documents:
             return jsonify({"error": "No documents could be processed"}), 400
         
         # Add to vector store
-        vector_store.add_documents(documents)
+        vector_store.get().add_documents(documents)
         
         return jsonify({
             "message": f"Successfully initialized with {len(documents)} document chunks from {len(pdf_files)} files",
             "files_processed": [os.path.basename(f) for f in pdf_files]
         })
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         return jsonify({"error": f"Error initializing system: {str(e)}"}), 500
 
+@app.errorhandler(AdmissionRejected)
+def overloaded(e):
+    response = jsonify({"error": "Server is busy, please retry shortly.", "retry_after": e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
 @app.errorhandler(413)
 def too_large(e):
     return jsonify({"error": "File too large. Maximum size is 50MB."}), 413
@@ -0,0 +1,238 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List
+
+from backend import metrics
+from backend.config import Config
+from backend.deadline import wait_timeout
+
+# Lower value = served first
+INTERACTIVE = 0
+INGESTION = 1
+
+_current_priority = contextvars.ContextVar("admission_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int):
+    """Run upstream calls made inside this block at the given priority"""
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a limiter's wait queue is full or the wait timed out"""
+
+    def __init__(self, limiter_name: str, retry_after: int, reason: str):
+        super().__init__(f"{limiter_name} is overloaded ({reason}), retry after {retry_after}s")
+        self.limiter_name = limiter_name
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("wake", "granted", "cancelled")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+class ConcurrencyLimiter:
+    """Bounded concurrency with a bounded, priority-ordered wait queue.
+
+    At most max_concurrent callers hold a slot; up to max_queue more wait,
+    interactive callers ahead of ingestion. Anyone beyond that is rejected
+    immediately with AdmissionRejected so callers can answer 429 instead of
+    piling up until the worker timeout. Sync and async callers share the
+    same slots and queue.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._waiters: List[tuple] = []
+        self._sequence = itertools.count()
+        # Counters for stats
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._total_hold = 0.0
+        self._released = 0
+
+    def _try_admit(self) -> bool:
+        """Take a free slot if one is available; must hold the lock. Rejects when the queue is full."""
+        if self._active < self.max_concurrent and not self._queued:
+            self._active += 1
+            return True
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            metrics.record_admission_rejected(self.name, "queue_full")
+            raise AdmissionRejected(self.name, self._retry_after(), "queue full")
+        return False
+
+    def _enqueue(self, level: int, wake) -> _Waiter:
+        waiter = _Waiter(wake)
+        heapq.heappush(self._waiters, (level, next(self._sequence), waiter))
+        self._queued += 1
+        metrics.set_admission_queue_depth(self.name, self._queued)
+        return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Give up waiting; returns True if the slot was granted in the meantime"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self._queued -= 1
+            self.rejected += 1
+            metrics.set_admission_queue_depth(self.name, self._queued)
+            metrics.record_admission_rejected(self.name, "queue_timeout")
+            return False
+
+    def _record_admission(self, waited: float):
+        with self._lock:
+            self.admitted += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        metrics.observe_admission_wait(self.name, waited)
+
+    def _retry_after(self) -> int:
+        """Estimate seconds until a queued request would get a slot"""
+        average_hold = self._total_hold / self._released if self._released else 1.0
+        return max(1, math.ceil(average_hold * (self._queued + 1) / self.max_concurrent))
+
+    def acquire(self, level: int = None):
+        """Block until a slot is available (or raise AdmissionRejected)"""
+        level = _current_priority.get() if level is None else level
+        start = time.monotonic()
+        with self._lock:
+            if self._try_admit():
+                waiter = None
+            else:
+                event = threading.Event()
+                waiter = self._enqueue(level, event.set)
+
+        # Never queue past the request's deadline
+        if waiter is not None and not event.wait(wait_timeout(self.queue_timeout)):
+            if not self._abandon(waiter):
+                raise AdmissionRejected(self.name, self._retry_after(), "queue timeout")
+
+        self._record_admission(time.monotonic() - start)
+        return time.monotonic()
+
+    async def acquire_async(self, level: int = None):
+        """Async version of acquire() that waits without blocking the event loop"""
+        level = _current_priority.get() if level is None else level
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_admit():
+                waiter = None
+            else:
+                future = loop.create_future()
+
+                def wake():
+                    loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+                waiter = self._enqueue(level, wake)
+
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), wait_timeout(self.queue_timeout))
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise AdmissionRejected(self.name, self._retry_after(), "queue timeout")
+            except BaseException:
+                # Cancelled while queued: hand back the slot if it was already granted
+                if self._abandon(waiter):
+                    self.release()
+                raise
+
+        self._record_admission(time.monotonic() - start)
+        return time.monotonic()
+
+    def release(self, acquired_at: float = None):
+        """Release a slot, handing it directly to the best waiting caller"""
+        with self._lock:
+            if acquired_at is not None:
+                self._total_hold += time.monotonic() - acquired_at
+                self._released += 1
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._queued -= 1
+                metrics.set_admission_queue_depth(self.name, self._queued)
+                waiter.wake()
+                return
+            self._active -= 1
+
+    @contextmanager
+    def slot(self, level: int = None):
+        acquired_at = self.acquire(level)
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+    @asynccontextmanager
+    async def aslot(self, level: int = None):
+        acquired_at = await self.acquire_async(level)
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "queue_depth": self._queued,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_wait_seconds": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+                "max_wait_seconds": round(self.max_wait, 4)
+            }
+
+
+_limiters: Dict[str, ConcurrencyLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> ConcurrencyLimiter:
+    """Get the per-worker limiter for an upstream ("llm" or "embedding")"""
+    with _limiters_lock:
+        if name not in _limiters:
+            if name == "llm":
+                max_concurrent, max_queue = Config.LLM_MAX_CONCURRENCY, Config.LLM_MAX_QUEUE
+            else:
+                max_concurrent, max_queue = Config.EMBEDDING_MAX_CONCURRENCY, Config.EMBEDDING_MAX_QUEUE
+            _limiters[name] = ConcurrencyLimiter(name, max_concurrent, max_queue, Config.ADMISSION_QUEUE_TIMEOUT)
+        return _limiters[name]
+
+
+def get_all_stats() -> Dict[str, Dict]:
+    """Stats for every limiter created in this worker"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.get_stats() for limiter in limiters}
@@ -0,0 +1,187 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional
+
+from backend.config import Config
+
+# True inside a call that already runs on a native pool thread
+_offloaded = contextvars.ContextVar("blocking_offloaded", default=False)
+
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "in_flight": 0, "timeouts": 0, "self_check": None}
+
+# Bounded waits outside gevent run the call here, so the caller can stop waiting for it
+_timeout_executor: Optional[ThreadPoolExecutor] = None
+_timeout_executor_lock = threading.Lock()
+
+
+class BlockingTimeout(Exception):
+    """A blocking call outlasted the time it was given; it is abandoned and finishes on its thread"""
+
+
+def gevent_active() -> bool:
+    """Whether gevent has patched threading in this process (gunicorn gevent workers)"""
+    try:
+        from gevent import monkey
+        return monkey.is_module_patched("threading")
+    except ImportError:
+        return False
+
+
+def _call_offloaded(fn: Callable, args: tuple, kwargs: dict) -> Any:
+    _offloaded.set(True)
+    return fn(*args, **kwargs)
+
+
+def run_blocking(fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call (Gemini gRPC, Chroma, SQLite, PyPDF) without stalling the worker.
+
+    gevent can only switch greenlets at Python-level I/O it has patched; a
+    call that waits or computes inside C code holds the whole worker. Under
+    gevent the call runs on the hub's native thread pool (BLOCKING_POOL_SIZE
+    threads) while the calling greenlet waits cooperatively. Elsewhere (sync
+    workers, FastAPI's to_thread, calls already offloaded) it runs inline.
+    The caller's context variables (deadline, admission priority) go with it.
+    """
+    if Config.BLOCKING_POOL_SIZE <= 0 or _offloaded.get() or not gevent_active():
+        return fn(*args, **kwargs)
+    import gevent
+    pool = gevent.get_hub().threadpool
+    if pool.maxsize != Config.BLOCKING_POOL_SIZE:
+        pool.maxsize = Config.BLOCKING_POOL_SIZE
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["in_flight"] += 1
+    try:
+        return pool.spawn(contextvars.copy_context().run, _call_offloaded, fn, args, kwargs).get()
+    finally:
+        with _stats_lock:
+            _stats["in_flight"] -= 1
+
+
+def _get_timeout_executor() -> ThreadPoolExecutor:
+    global _timeout_executor
+    with _timeout_executor_lock:
+        if _timeout_executor is None:
+            _timeout_executor = ThreadPoolExecutor(
+                max_workers=max(1, Config.BLOCKING_POOL_SIZE), thread_name_prefix="blocking-timeout"
+            )
+        return _timeout_executor
+
+
+def run_blocking_timeout(timeout: float, fn: Callable, *args, **kwargs) -> Any:
+    """run_blocking, giving up on the call after timeout seconds with BlockingTimeout.
+
+    A native call cannot be interrupted, only stopped waiting for: it runs on
+    a pool thread (gevent's, or a small executor elsewhere) and is left to
+    finish there. Calls already on a pool thread, and calls in a gevent worker
+    with BLOCKING_POOL_SIZE=0, run inline and unbounded.
+    """
+    in_gevent = gevent_active()
+    if _offloaded.get() or (in_gevent and Config.BLOCKING_POOL_SIZE <= 0):
+        return fn(*args, **kwargs)
+    context = contextvars.copy_context()
+    if in_gevent:
+        import gevent
+        pool = gevent.get_hub().threadpool
+        if pool.maxsize != Config.BLOCKING_POOL_SIZE:
+            pool.maxsize = Config.BLOCKING_POOL_SIZE
+        with _stats_lock:
+            _stats["calls"] += 1
+            _stats["in_flight"] += 1
+        try:
+            return pool.spawn(context.run, _call_offloaded, fn, args, kwargs).get(timeout=max(0.0, timeout))
+        except gevent.Timeout:
+            with _stats_lock:
+                _stats["timeouts"] += 1
+            raise BlockingTimeout(f"{getattr(fn, '__name__', fn)} did not return within {timeout:.1f}s")
+        finally:
+            with _stats_lock:
+                _stats["in_flight"] -= 1
+    future = _get_timeout_executor().submit(context.run, _call_offloaded, fn, args, kwargs)
+    try:
+        return future.result(timeout=max(0.0, timeout))
+    except FutureTimeout:
+        with _stats_lock:
+            _stats["timeouts"] += 1
+        raise BlockingTimeout(f"{getattr(fn, '__name__', fn)} did not return within {timeout:.1f}s")
+
+
+def iterate_blocking(iterator, timeout: Optional[Callable[[], float]] = None):
+    """Iterate a blocking iterator (e.g. a streamed LLM response), fetching each item with run_blocking.
+
+    With timeout (a callable giving the seconds left, e.g. a deadline's
+    remaining), each wait for the next item is bounded and BlockingTimeout
+    ends the iteration; the iterator is then abandoned, not closed, since its
+    pending next() may still be running on a pool thread.
+    """
+    done = object()
+    while True:
+        if timeout is None:
+            item = run_blocking(next, iterator, done)
+        else:
+            item = run_blocking_timeout(timeout(), next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+def self_check(probe_seconds: float = 0.2) -> Dict:
+    """Measure how long a native blocking call stalls other greenlets, inline and through run_blocking.
+
+    The inline figure shows what an un-offloaded SDK call costs every other
+    request on the worker; the offloaded figure should stay near zero.
+    """
+    if not gevent_active():
+        result = {"gevent": False, "ok": True}
+    else:
+        import gevent
+        from gevent import monkey
+        native_sleep = monkey.get_original("time", "sleep")
+        tick = 0.01
+
+        def max_stall(call: Callable) -> float:
+            gaps = []
+            running = [True]
+
+            def ticker():
+                last = time.perf_counter()
+                while running[0]:
+                    gevent.sleep(tick)
+                    now = time.perf_counter()
+                    gaps.append(now - last)
+                    last = now
+
+            greenlet = gevent.spawn(ticker)
+            gevent.sleep(0)
+            call()
+            running[0] = False
+            greenlet.join()
+            return max(0.0, max(gaps, default=0.0) - tick)
+
+        inline = max_stall(lambda: native_sleep(probe_seconds))
+        offloaded = max_stall(lambda: run_blocking(native_sleep, probe_seconds))
+        result = {
+            "gevent": True,
+            "pool_size": Config.BLOCKING_POOL_SIZE,
+            "inline_stall_ms": round(inline * 1000, 1),
+            "offloaded_stall_ms": round(offloaded * 1000, 1),
+            "ok": offloaded < probe_seconds / 2
+        }
+        if result["ok"]:
+            print(f"Blocking self-check passed: a {probe_seconds * 1000:.0f}ms native call stalls the worker "
+                  f"{result['offloaded_stall_ms']}ms through the pool ({result['inline_stall_ms']}ms inline)")
+        else:
+            print(f"WARNING: blocking self-check failed: native calls stall every request on this worker "
+                  f"({result['offloaded_stall_ms']}ms for a {probe_seconds * 1000:.0f}ms call); "
+                  f"check BLOCKING_POOL_SIZE (currently {Config.BLOCKING_POOL_SIZE})")
+    with _stats_lock:
+        _stats["self_check"] = result
+    return result
+
+
+def get_stats() -> Dict:
+    with _stats_lock:
+        return dict(_stats, gevent=gevent_active(), pool_size=Config.BLOCKING_POOL_SIZE)
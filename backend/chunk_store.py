@@ -0,0 +1,165 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.blocking import run_blocking
+
+
+class ChunkStore:
+    """Chunk bodies keyed by chunk id, zlib-compressed in a SQLite database (WAL mode).
+
+    The vector index keeps only embeddings and small metadata; text is read
+    from here for the few chunks that end up in a prompt. The same database
+    records indexing progress per source file, so an interrupted indexing
+    run can resume where it stopped, and facts about the index as a whole
+    (such as the embedding backend that built it).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chunks (
+            chunk_id TEXT PRIMARY KEY,
+            body BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS indexing_progress (
+            file_hash TEXT PRIMARY KEY,
+            file_name TEXT NOT NULL,
+            total_chunks INTEGER NOT NULL,
+            indexed_chunks INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            parent_chunks INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS index_info (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str, read_only: bool = False):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        if read_only:
+            # Immutable files (index artifacts) need no locking or journal
+            self._conn = sqlite3.connect(f"file:{db_path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Let SQLite read pages straight from the OS page cache
+        self._conn.execute("PRAGMA mmap_size=268435456")
+        if not read_only:
+            self._conn.executescript(self.SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(indexing_progress)")}
+        if "parent_chunks" not in columns:
+            try:
+                # Rows written before parents were counted keep NULL: their parent count is unknown
+                self._conn.execute("ALTER TABLE indexing_progress ADD COLUMN parent_chunks INTEGER")
+            except sqlite3.OperationalError:
+                # Another process added it first
+                pass
+
+    def _write(self, rows: List[Tuple[str, bytes]]):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks (chunk_id, body) VALUES (?, ?)", rows)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def put_many(self, chunks: Iterable[Tuple[str, str]]):
+        """Insert or replace (chunk_id, text) pairs in one transaction"""
+        rows = [(chunk_id, zlib.compress(text.encode("utf-8"), 6)) for chunk_id, text in chunks]
+        with self._lock:
+            run_blocking(self._write, rows)
+
+    def _read(self, chunk_ids: List[str]) -> Dict[str, str]:
+        texts = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT chunk_id, body FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            texts.update((chunk_id, zlib.decompress(body).decode("utf-8")) for chunk_id, body in rows)
+        return texts
+
+    def get_many(self, chunk_ids: List[str]) -> Dict[str, str]:
+        """Texts for the ids that are present"""
+        if not chunk_ids:
+            return {}
+        # Only the SQLite work runs on the blocking pool; the lock stays with the calling greenlet
+        with self._lock:
+            return run_blocking(self._read, chunk_ids)
+
+    def _execute(self, sql: str, params=(), fetch: bool = False):
+        """One statement on the blocking pool, like the chunk reads and writes"""
+        def run():
+            cursor = self._conn.execute(sql, params)
+            return cursor.fetchall() if fetch else None
+        with self._lock:
+            return run_blocking(run)
+
+    def delete_many(self, chunk_ids: List[str]):
+        rows = [(chunk_id,) for chunk_id in chunk_ids]
+        with self._lock:
+            run_blocking(self._conn.executemany, "DELETE FROM chunks WHERE chunk_id = ?", rows)
+
+    def ids_with_prefix(self, prefix: str) -> List[str]:
+        """Ids of the chunks whose id starts with prefix"""
+        rows = self._execute(
+            "SELECT chunk_id FROM chunks WHERE chunk_id >= ? AND chunk_id < ?", (prefix, prefix + "\uffff"), fetch=True
+        )
+        return [row[0] for row in rows]
+
+    def get_progress(self, file_hashes: Optional[List[str]] = None) -> Dict[str, Tuple[int, int, Optional[int]]]:
+        """(total_chunks, indexed_chunks, parent_chunks) per recorded file, for the given hashes or all files.
+
+        parent_chunks is None for rows recorded before parents were counted.
+        """
+        rows = self._execute(
+            "SELECT file_hash, total_chunks, indexed_chunks, parent_chunks FROM indexing_progress", fetch=True
+        )
+        wanted = set(file_hashes) if file_hashes is not None else None
+        return {file_hash: (total, indexed, parents) for file_hash, total, indexed, parents in rows
+                if wanted is None or file_hash in wanted}
+
+    def set_progress(self, file_hash: str, file_name: str, total_chunks: int, indexed_chunks: int,
+                     parent_chunks: int = 0):
+        """Record that the first indexed_chunks chunks of a file, and its parent_chunks parents, are in the index"""
+        self._execute(
+            "INSERT OR REPLACE INTO indexing_progress "
+            "(file_hash, file_name, total_chunks, indexed_chunks, updated_at, parent_chunks) VALUES (?, ?, ?, ?, ?, ?)",
+            (file_hash, file_name, total_chunks, indexed_chunks, time.time(), parent_chunks)
+        )
+
+    def get_info(self, key: str) -> Optional[Any]:
+        """A JSON value recorded for the whole index, or None"""
+        try:
+            rows = self._execute("SELECT value FROM index_info WHERE key = ?", (key,), fetch=True)
+        except sqlite3.OperationalError:
+            # Read-only stores written before the table existed
+            return None
+        return json.loads(rows[0][0]) if rows else None
+
+    def set_info(self, key: str, value: Any):
+        self._execute("INSERT OR REPLACE INTO index_info (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def seal(self):
+        """Fold the WAL back into a single database file, e.g. before shipping it read-only"""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("PRAGMA journal_mode=DELETE")
+            self._conn.execute("VACUUM")
+
+    def count(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM chunks", fetch=True)[0][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -9,12 +9,132 @@ class Config:
     CHUNK_SIZE = 8000
     CHUNK_OVERLAP = 1000
     
+    # Chunking: "standard" embeds the CHUNK_SIZE chunks themselves; "parent_child" stores them as parents
+    # and embeds CHILD_CHUNK_SIZE children of each, so search matches single provisions and the best
+    # PARENT_CHUNKS_IN_PROMPT parents go into the prompt. Indexes record their mode; switching needs a rebuild
+    CHUNKING_MODE = os.getenv("CHUNKING_MODE", "standard").lower()
+    CHILD_CHUNK_SIZE = int(os.getenv("CHILD_CHUNK_SIZE", "400"))
+    CHILD_CHUNK_OVERLAP = int(os.getenv("CHILD_CHUNK_OVERLAP", "50"))
+    PARENT_CHUNKS_IN_PROMPT = int(os.getenv("PARENT_CHUNKS_IN_PROMPT", "4"))
+    # Child hits are precise enough that fewer query variations are searched against a parent-child index
+    PARENT_CHILD_QUERY_VARIATIONS = int(os.getenv("PARENT_CHILD_QUERY_VARIATIONS", "2"))
+    
     # Gemini model configuration
     GEMINI_MODEL = "gemini-2.0-flash-thinking-exp-01-21"
     EMBEDDING_MODEL = "models/embedding-001"
     
+    # Embedding backend: "gemini" (EMBEDDING_MODEL through the API), "local" (a sentence-transformers
+    # model in LOCAL_EMBEDDING_MODEL_PATH, batched on the CPU, works offline) or "hashing"
+    # (deterministic, for tests and benchmarks). Indexes record their backend; switching needs a rebuild
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini").lower()
+    LOCAL_EMBEDDING_MODEL_PATH = os.getenv("LOCAL_EMBEDDING_MODEL_PATH", "")
+    LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+    HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "384"))
+    
     # Vector DB settings
     COLLECTION_NAME = "indian_legal_docs"
     
-    if not GOOGLE_API_KEY:
-        raise ValueError("GOOGLE_API_KEY environment variable is required")
\ No newline at end of file
+    # Conversation history backend: "sqlite" (context_history/sessions.db) or "json" (one file per session)
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite").lower()
+    # Loaded sessions kept in memory per worker (least recently used are evicted)
+    SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1000"))
+    # A cached session is checked against the store (for exchanges other workers added) at most
+    # this often; between checks it is served from memory and may be up to this many seconds behind
+    SESSION_CACHE_REVALIDATE = float(os.getenv("SESSION_CACHE_REVALIDATE", "2"))
+    # Write-behind session log: exchanges are queued in memory, appended to a JSONL log
+    # by a background flusher and compacted into the session backend periodically.
+    # SESSION_LOG_FSYNC: "batch" (every flush), "interval" (every 10 flush intervals) or "off"
+    SESSION_WRITE_BEHIND = os.getenv("SESSION_WRITE_BEHIND", "true").lower() == "true"
+    SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.5"))
+    SESSION_FLUSH_BATCH = int(os.getenv("SESSION_FLUSH_BATCH", "64"))
+    SESSION_LOG_FSYNC = os.getenv("SESSION_LOG_FSYNC", "batch").lower()
+    SESSION_COMPACT_INTERVAL = float(os.getenv("SESSION_COMPACT_INTERVAL", "30"))
+    SESSION_SEGMENT_MAX_BYTES = int(os.getenv("SESSION_SEGMENT_MAX_BYTES", str(4 * 1024 * 1024)))
+    
+    # Share one retrieval + generation among concurrent identical context-free questions
+    QUERY_COALESCING = os.getenv("QUERY_COALESCING", "true").lower() == "true"
+    
+    # Adaptive retrieval: skip extra query variations when the original question's
+    # hits are already similar enough and cover the question's terms
+    ADAPTIVE_RETRIEVAL = os.getenv("ADAPTIVE_RETRIEVAL", "true").lower() == "true"
+    ADAPTIVE_CONFIDENCE_THRESHOLD = float(os.getenv("ADAPTIVE_CONFIDENCE_THRESHOLD", "0.75"))
+    
+    # Follow-up questions reuse the previous answer's chunks and search only for new terms
+    FOLLOW_UP_REUSE = os.getenv("FOLLOW_UP_REUSE", "true").lower() == "true"
+    FOLLOW_UP_DELTA_K = int(os.getenv("FOLLOW_UP_DELTA_K", "4"))
+    
+    # Serve a read-only index artifact built by build_index.py instead of the Chroma index in CHROMA_DB_PATH
+    INDEX_ARTIFACT_PATH = os.getenv("INDEX_ARTIFACT_PATH", "")
+    
+    # Versioned index snapshots: uploads build the next version off to the side and workers switch
+    # to it between requests; an index already in CHROMA_DB_PATH becomes the first version
+    INDEX_SNAPSHOTS = os.getenv("INDEX_SNAPSHOTS", "true").lower() == "true"
+    INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", "./index_snapshots")
+    
+    # Per-query time budget in seconds (0 disables), kept below gunicorn's 120s worker timeout.
+    # When time runs short the pipeline sheds work: fewer query variations and a smaller k once less
+    # than twice DEADLINE_GENERATION_RESERVE is left, a compressed context below the reserve, and a
+    # retrieval-only answer (sources and excerpts) below DEADLINE_MIN_GENERATION.
+    QUERY_DEADLINE = float(os.getenv("QUERY_DEADLINE", "90"))
+    DEADLINE_GENERATION_RESERVE = float(os.getenv("DEADLINE_GENERATION_RESERVE", "25"))
+    DEADLINE_MIN_GENERATION = float(os.getenv("DEADLINE_MIN_GENERATION", "8"))
+    
+    # Per-worker caches for context-free questions (entries expire after QUERY_CACHE_TTL seconds)
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+    RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+    QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+    
+    # Query-log analytics: the hottest question clusters of the last QUERY_LOG_WINDOW_HOURS
+    # are pre-computed into the caches at start-up and every PREWARM_INTERVAL seconds (0 = start-up only).
+    # Only their embeddings and retrievals unless PREWARM_ANSWERS, which spends a Gemini generation
+    # per question in every worker
+    QUERY_LOG_WINDOW_HOURS = float(os.getenv("QUERY_LOG_WINDOW_HOURS", "168"))
+    QUERY_CLUSTER_SIMILARITY = float(os.getenv("QUERY_CLUSTER_SIMILARITY", "0.6"))
+    PREWARM_TOP_N = int(os.getenv("PREWARM_TOP_N", "20"))
+    PREWARM_ANSWERS = os.getenv("PREWARM_ANSWERS", "false").lower() == "true"
+    PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", "0"))
+    
+    # Batch queries (/api/query-batch)
+    BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+    BATCH_MAX_PARALLEL = int(os.getenv("BATCH_MAX_PARALLEL", "4"))
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+    
+    # Admission control for upstream Gemini calls (per worker)
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+    EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "16"))
+    EMBEDDING_MAX_QUEUE = int(os.getenv("EMBEDDING_MAX_QUEUE", "64"))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "20"))
+    
+    # Prometheus metrics at /metrics; gunicorn workers share METRICS_DIR
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    METRICS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "./prometheus_multiproc")
+    
+    # Per-request profiling: requests carrying `X-Profile-Token: <PROFILING_TOKEN>` (and a
+    # PROFILE_SAMPLE_RATE fraction of all requests) are profiled into PROFILE_DIR/<id>/;
+    # PROFILE_MODE is "cprofile" (deterministic), "sampling" (wall-clock stack samples of the request's
+    # greenlet or thread) or "auto" (sampling under gevent, where cProfile sees every greenlet, else cprofile)
+    PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_MODE = os.getenv("PROFILE_MODE", "auto").lower()
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+    PROFILE_ALLOCATIONS = os.getenv("PROFILE_ALLOCATIONS", "true").lower() == "true"
+    PROFILE_ALLOCATION_FRAMES = int(os.getenv("PROFILE_ALLOCATION_FRAMES", "10"))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+    PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+    
+    # Native threads that run blocking SDK calls (Gemini gRPC, Chroma, SQLite, PyPDF) under
+    # gevent workers, so one slow call does not stall every request (0 = call inline);
+    # the default covers LLM_MAX_CONCURRENCY + EMBEDDING_MAX_CONCURRENCY calls in flight
+    BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "24"))
+    BLOCKING_SELF_CHECK = os.getenv("BLOCKING_SELF_CHECK", "true").lower() == "true"
+    
+    # Component start-up: "lazy" (on first use), "background" (warm up after boot) or "eager" (at import)
+    WARM_UP = os.getenv("WARM_UP", "background").lower()
+    
+    @classmethod
+    def validate(cls):
+        """Check settings needed before talking to Gemini"""
+        if not cls.GOOGLE_API_KEY:
+            raise ValueError("GOOGLE_API_KEY environment variable is required")
\ No newline at end of file
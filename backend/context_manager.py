@@ -1,16 +1,25 @@
-import json
+import asyncio
 import os
+import threading
 from datetime import datetime
 from typing import List, Dict, Optional
 import uuid
 
+from backend import metrics
+from backend.session_store import get_session_store
+
 class ContextManager:
-    def __init__(self, context_dir: str = "context_history"):
+    def __init__(self, context_dir: str = "context_history", store=None):
         self.context_dir = context_dir
         self.current_session_id = None
         self.current_context = []
         self.max_context_length = 10  # Keep last 10 exchanges
-        self.ensure_context_directory()
+        # Serializes exchanges from concurrent requests in the same session
+        self.lock = threading.Lock()
+        if store is None:
+            self.ensure_context_directory()
+            store = get_session_store(context_dir)
+        self.store = store
     
     def ensure_context_directory(self):
         """Ensure context directory exists"""
@@ -18,36 +27,48 @@ class ContextManager:
             os.makedirs(self.context_dir)
             print(f"Created context directory: {self.context_dir}")
     
-    def start_new_session(self) -> str:
+    def start_new_session(self, session_id: str = None) -> str:
         """Start a new conversation session"""
-        self.current_session_id = str(uuid.uuid4())
+        self.current_session_id = session_id or str(uuid.uuid4())
         self.current_context = []
         print(f"Started new session: {self.current_session_id}")
         return self.current_session_id
     
-    def add_exchange(self, user_question: str, assistant_response: str, sources: List[Dict] = None):
+    def add_exchange(self, user_question: str, assistant_response: str, sources: List[Dict] = None,
+                     retrieved_chunks: List[Dict] = None):
         """Add a question-answer exchange to current context"""
         if not self.current_session_id:
             self.start_new_session()
         
-        exchange = {
-            "timestamp": datetime.now().isoformat(),
-            "user_question": user_question,
-            "assistant_response": assistant_response,
-            "sources": sources or [],
-            "exchange_id": len(self.current_context) + 1
-        }
-        
-        self.current_context.append(exchange)
-        
-        # Keep only recent exchanges to avoid context overflow
-        if len(self.current_context) > self.max_context_length:
-            self.current_context = self.current_context[-self.max_context_length:]
-        
-        # Save to file
-        self.save_session()
+        with self.lock:
+            exchange = {
+                "timestamp": datetime.now().isoformat(),
+                "user_question": user_question,
+                "assistant_response": assistant_response,
+                "sources": sources or [],
+                "retrieved_chunks": retrieved_chunks or [],
+                "exchange_id": len(self.current_context) + 1
+            }
+            
+            self.current_context.append(exchange)
+            
+            # Keep only recent exchanges to avoid context overflow
+            if len(self.current_context) > self.max_context_length:
+                self.current_context = self.current_context[-self.max_context_length:]
+            
+            # Persist just the new exchange
+            try:
+                with metrics.stage("session_save"):
+                    self.store.append_exchange(self.current_session_id, exchange, self.current_context)
+            except Exception as e:
+                print(f"Error saving session: {str(e)}")
         print(f"Added exchange {exchange['exchange_id']} to session {self.current_session_id}")
     
+    async def aadd_exchange(self, user_question: str, assistant_response: str, sources: List[Dict] = None,
+                            retrieved_chunks: List[Dict] = None):
+        """Async version of add_exchange that writes to the session store in a worker thread"""
+        await asyncio.to_thread(self.add_exchange, user_question, assistant_response, sources, retrieved_chunks)
+    
     def get_context_summary(self) -> str:
         """Get a summary of recent conversation for context awareness"""
         if not self.current_context:
@@ -120,97 +141,51 @@ class ContextManager:
         return any(indicator in question_lower for indicator in follow_up_indicators)
     
     def save_session(self):
-        """Save current session to JSON file"""
+        """Save the current session to the session store"""
         if not self.current_session_id or not self.current_context:
             return
         
-        session_data = {
-            "session_id": self.current_session_id,
-            "created_at": self.current_context[0]["timestamp"] if self.current_context else datetime.now().isoformat(),
-            "last_updated": datetime.now().isoformat(),
-            "total_exchanges": len(self.current_context),
-            "exchanges": self.current_context
-        }
-        
-        file_path = os.path.join(self.context_dir, f"session_{self.current_session_id}.json")
-        
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(session_data, f, indent=2, ensure_ascii=False)
+            with metrics.stage("session_save"):
+                self.store.save(self.current_session_id, self.current_context)
         except Exception as e:
             print(f"Error saving session: {str(e)}")
     
     def load_session(self, session_id: str) -> bool:
         """Load an existing session"""
-        file_path = os.path.join(self.context_dir, f"session_{session_id}.json")
-        
-        if not os.path.exists(file_path):
-            return False
-        
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                session_data = json.load(f)
+            exchanges = self.store.load(session_id, self.max_context_length)
+            if exchanges is None:
+                return False
             
-            self.current_session_id = session_data["session_id"]
-            self.current_context = session_data["exchanges"]
+            self.current_session_id = session_id
+            self.current_context = exchanges
             print(f"Loaded session {session_id} with {len(self.current_context)} exchanges")
             return True
         except Exception as e:
             print(f"Error loading session: {str(e)}")
             return False
     
-    def get_recent_sessions(self, limit: int = 10) -> List[Dict]:
-        """Get list of recent sessions"""
-        sessions = []
-        
-        if not os.path.exists(self.context_dir):
-            return sessions
-        
+    async def aload_session(self, session_id: str) -> bool:
+        """Async version of load_session"""
+        return await asyncio.to_thread(self.load_session, session_id)
+    
+    def get_recent_sessions(self, limit: int = 10, offset: int = 0) -> List[Dict]:
+        """Get a page of recent sessions, most recently updated first"""
         try:
-            for filename in os.listdir(self.context_dir):
-                if filename.startswith("session_") and filename.endswith(".json"):
-                    file_path = os.path.join(self.context_dir, filename)
-                    
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        session_data = json.load(f)
-                    
-                    sessions.append({
-                        "session_id": session_data["session_id"],
-                        "created_at": session_data["created_at"],
-                        "last_updated": session_data["last_updated"],
-                        "total_exchanges": session_data["total_exchanges"],
-                        "preview": session_data["exchanges"][0]["user_question"][:100] if session_data["exchanges"] else "Empty session"
-                    })
-            
-            # Sort by last updated
-            sessions.sort(key=lambda x: x["last_updated"], reverse=True)
-            return sessions[:limit]
-        
+            return self.store.list_recent(limit, offset)
         except Exception as e:
             print(f"Error getting recent sessions: {str(e)}")
             return []
     
     def clear_old_sessions(self, days_old: int = 30):
         """Clear sessions older than specified days"""
-        if not os.path.exists(self.context_dir):
-            return
-        
         from datetime import timedelta
         cutoff_date = datetime.now() - timedelta(days=days_old)
         
         try:
-            for filename in os.listdir(self.context_dir):
-                if filename.startswith("session_") and filename.endswith(".json"):
-                    file_path = os.path.join(self.context_dir, filename)
-                    
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        session_data = json.load(f)
-                    
-                    last_updated = datetime.fromisoformat(session_data["last_updated"])
-                    
-                    if last_updated < cutoff_date:
-                        os.remove(file_path)
-                        print(f"Removed old session: {filename}")
-        
+            removed = self.store.delete_older_than(cutoff_date)
+            if removed:
+                print(f"Removed {removed} old sessions")
         except Exception as e:
             print(f"Error clearing old sessions: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,57 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+from backend import metrics
+
+_current_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class Deadline:
+    """Time budget of one query, and the work the pipeline shed to stay within it"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.degradations: List[str] = []
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def degrade(self, name: str):
+        """Record a degradation (once per request)"""
+        if name not in self.degradations:
+            self.degradations.append(name)
+            metrics.increment(f"degradation_{name}")
+            print(f"Deadline: {name} ({self.remaining():.1f}s of {self.seconds:g}s left)")
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Give the pipeline code inside this block a time budget (none when seconds <= 0).
+
+    The deadline is carried in a context variable, like admission priority,
+    so it reaches expansion, retrieval, limiter waits and generation
+    (including coroutines and asyncio.to_thread calls) without being passed
+    through every signature.
+    """
+    current = Deadline(seconds) if seconds and seconds > 0 else None
+    token = _current_deadline.set(current)
+    try:
+        yield current
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def wait_timeout(timeout: float) -> float:
+    """timeout, capped by the time left on the current deadline"""
+    current = _current_deadline.get()
+    return min(timeout, current.remaining()) if current is not None else timeout
@@ -1,10 +1,21 @@
+import hashlib
 import os
+import uuid
 from typing import List
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.schema import Document
+from backend.blocking import run_blocking
 from backend.config import Config
 
+def file_sha256(path: str) -> str:
+    """Content hash of a file; chunk ids and indexing checkpoints are keyed by it"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
 class DocumentProcessor:
     def __init__(self):
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -13,12 +24,22 @@ class DocumentProcessor:
             length_function=len,
             separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
         )
+        self.parent_child = Config.CHUNKING_MODE == "parent_child"
+        if self.parent_child:
+            self.child_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=Config.CHILD_CHUNK_SIZE,
+                chunk_overlap=Config.CHILD_CHUNK_OVERLAP,
+                length_function=len,
+                separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+            )
     
     def load_pdf(self, file_path: str) -> List[Document]:
         """Load and process PDF documents"""
         try:
             loader = PyPDFLoader(file_path)
-            documents = loader.load()
+            # Long CPU-bound parse: on the pool it shares the GIL with other requests instead of holding the worker
+            documents = run_blocking(loader.load)
+            file_hash = run_blocking(file_sha256, file_path)
             
             # Add metadata to identify document type
             doc_name = os.path.basename(file_path).lower()
@@ -72,6 +93,7 @@ class DocumentProcessor:
                     "source": file_path,
                     "document_type": doc_type,
                     "file_name": os.path.basename(file_path),
+                    "file_hash": file_hash,
                     "page_number": i + 1,
                     "chunk_id": f"{os.path.basename(file_path)}_page_{i+1}"
                 })
@@ -85,22 +107,62 @@ class DocumentProcessor:
         """Split documents into chunks"""
         chunks = self.text_splitter.split_documents(documents)
         
-        # Add chunk-specific metadata
+        # Add chunk-specific metadata; chunk text lives in the chunk store, not in metadata.
+        # file_chunk_index is the position within the source file, part of the chunk's stable id
+        file_positions = {}
         for i, chunk in enumerate(chunks):
+            file_hash = chunk.metadata.get("file_hash")
+            position = file_positions.get(file_hash, 0)
+            file_positions[file_hash] = position + 1
             chunk.metadata.update({
                 "chunk_index": i,
-                "content_preview": chunk.page_content[:100].replace('\n', ' ')
+                "file_chunk_index": position
             })
         
+        if self.parent_child:
+            return self.split_children(chunks)
         return chunks
     
+    def split_children(self, parents: List[Document]) -> List[Document]:
+        """Parent-child chunking: the parents, marked chunk_role "parent", followed by their small children.
+        
+        Only children are embedded and searched; each carries its parent's
+        parent_id, under which the parent text is stored for the prompt.
+        Children are numbered per file like standard chunks, so they get
+        stable ids and indexing checkpoints the same way.
+        """
+        children = []
+        file_positions = {}
+        for parent in parents:
+            file_hash = parent.metadata.get("file_hash")
+            parent_id = (f"{file_hash[:16]}-p{parent.metadata['file_chunk_index']}" if file_hash
+                         else str(uuid.uuid4()))
+            parent.metadata.update({"chunk_role": "parent", "parent_id": parent_id})
+            for text in self.child_splitter.split_text(parent.page_content):
+                position = file_positions.get(file_hash, 0)
+                file_positions[file_hash] = position + 1
+                children.append(Document(page_content=text, metadata=dict(
+                    parent.metadata, chunk_role="child", chunk_index=len(children), file_chunk_index=position
+                )))
+        
+        print(f"Split {len(parents)} parent chunks into {len(children)} child chunks")
+        return parents + children
+    
     def process_documents(self, file_paths: List[str]) -> List[Document]:
         """Process multiple PDF files"""
         all_documents = []
+        seen_hashes = set()
         
         for file_path in file_paths:
             if os.path.exists(file_path) and file_path.endswith('.pdf'):
                 documents = self.load_pdf(file_path)
+                if documents:
+                    # The same PDF in the project root and uploads/ would give the same chunk ids twice
+                    file_hash = documents[0].metadata["file_hash"]
+                    if file_hash in seen_hashes:
+                        print(f"Skipping duplicate of an already processed file: {file_path}")
+                        continue
+                    seen_hashes.add(file_hash)
                 all_documents.extend(documents)
             else:
                 print(f"File not found or not a PDF: {file_path}")
@@ -0,0 +1,120 @@
+import hashlib
+import math
+import os
+import re
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from backend.config import Config
+
+EMBEDDING_BACKENDS = ("gemini", "local", "hashing")
+
+# Indexes written before the backend was recorded were all embedded with Gemini
+LEGACY_IDENTITY = {"backend": "gemini", "model": Config.EMBEDDING_MODEL, "dimension": None}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Feature-hashing bag-of-words embedder: same text, same vector, on any machine"""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    @property
+    def identity(self) -> Dict:
+        return {"backend": "hashing", "model": "blake2b-bag-of-words", "dimension": self.dimension}
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        for token in _TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class LocalEmbeddings(Embeddings):
+    """sentence-transformers model loaded from a local directory, run in batches on the CPU.
+
+    No network access: the model files must already be in model_path
+    (e.g. saved with SentenceTransformer(...).save(path)).
+    """
+
+    def __init__(self, model_path: str, batch_size: int = 32, device: str = "cpu"):
+        if not os.path.isdir(model_path):
+            raise ValueError(f"Local embedding model directory {model_path!r} does not exist")
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND=local needs the sentence-transformers package") from e
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_path, device=device)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    @property
+    def identity(self) -> Dict:
+        return {"backend": "local", "model": os.path.basename(os.path.normpath(self.model_path)), "dimension": self.dimension}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        vectors = self.model.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False
+        )
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def create_embeddings(backend: Optional[str] = None) -> Embeddings:
+    """The embedder selected by EMBEDDING_BACKEND (or backend)"""
+    backend = (backend or Config.EMBEDDING_BACKEND).lower()
+    if backend == "gemini":
+        Config.validate()
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(model=Config.EMBEDDING_MODEL, google_api_key=Config.GOOGLE_API_KEY)
+    if backend == "local":
+        if not Config.LOCAL_EMBEDDING_MODEL_PATH:
+            raise ValueError("EMBEDDING_BACKEND=local needs LOCAL_EMBEDDING_MODEL_PATH")
+        return LocalEmbeddings(Config.LOCAL_EMBEDDING_MODEL_PATH, batch_size=Config.LOCAL_EMBEDDING_BATCH_SIZE)
+    if backend == "hashing":
+        return HashingEmbeddings(Config.HASHING_EMBEDDING_DIM)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r} (expected one of {', '.join(EMBEDDING_BACKENDS)})")
+
+
+def embedding_identity(embeddings: Embeddings) -> Dict:
+    """Backend, model and (when known without an embedding call) dimension of an embedder"""
+    identity = getattr(embeddings, "identity", None)
+    if identity is not None:
+        return dict(identity)
+    if type(embeddings).__name__ == "GoogleGenerativeAIEmbeddings":
+        return {"backend": "gemini", "model": embeddings.model, "dimension": None}
+    return {"backend": type(embeddings).__name__, "model": getattr(embeddings, "model", None), "dimension": None}
+
+
+def describe(identity: Dict) -> str:
+    text = f"{identity.get('backend')} ({identity.get('model')}"
+    if identity.get("dimension"):
+        text += f", {identity['dimension']} dimensions"
+    return text + ")"
+
+
+def check_compatible(recorded: Dict, current: Dict, where: str):
+    """Raise ValueError if an index built with recorded cannot be searched or extended with current"""
+    same_model = recorded.get("backend") == current.get("backend") and recorded.get("model") == current.get("model")
+    dimensions = (recorded.get("dimension"), current.get("dimension"))
+    if not same_model or (all(dimensions) and dimensions[0] != dimensions[1]):
+        raise ValueError(f"{where} was embedded with {describe(recorded)}, but the embedding backend is "
+                         f"{describe(current)}; rebuild the index or set EMBEDDING_BACKEND to match")
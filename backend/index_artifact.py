@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from backend.blocking import run_blocking
+from backend.chunk_store import ChunkStore
+from backend.config import Config
+from backend.embeddings import check_compatible
+from backend.vector_store import VectorStore
+
+# Layout of an index artifact directory (see build_index.py)
+ARTIFACT_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"     # float32 [chunks, dimension]
+NORMS_FILE = "norms.npy"         # float32 squared L2 norm of each vector
+IDS_FILE = "ids.json"
+METADATA_FILE = "metadata.json"
+CHUNKS_FILE = "chunks.db"        # ChunkStore, sealed into a single file
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(path: str) -> Dict:
+    with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_artifact(output_dir: str, ids: List[str], texts: List[str], metadatas: List[Dict],
+                   embeddings: List[List[float]], embedding_model: str, sources: List[Dict] = None,
+                   force: bool = False, embedding_backend: str = "gemini",
+                   parent_texts: Optional[Dict[str, str]] = None) -> Dict:
+    """Write an index artifact directory and return its manifest.
+
+    With parent-child chunking the ids, texts and vectors are the children's;
+    parent_texts maps their parent_ids to the parent text for the prompt.
+
+    The artifact is assembled in a staging directory next to output_dir and
+    renamed into place, so a half-written artifact is never visible.
+    """
+    if os.path.exists(output_dir) and not force:
+        raise FileExistsError(f"{output_dir} already exists (use force to replace it)")
+    staging = f"{output_dir.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+    np.save(os.path.join(staging, VECTORS_FILE), vectors)
+    np.save(os.path.join(staging, NORMS_FILE), np.einsum("ij,ij->i", vectors, vectors))
+    with open(os.path.join(staging, IDS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(ids, f)
+    with open(os.path.join(staging, METADATA_FILE), 'w', encoding='utf-8') as f:
+        json.dump(metadatas, f, ensure_ascii=False)
+    chunk_store = ChunkStore(os.path.join(staging, CHUNKS_FILE))
+    chunk_store.put_many(zip(ids, texts))
+    if parent_texts:
+        chunk_store.put_many(parent_texts.items())
+    chunk_store.seal()
+    chunk_store.close()
+
+    files = {
+        name: {"sha256": _sha256(os.path.join(staging, name)), "bytes": os.path.getsize(os.path.join(staging, name))}
+        for name in (VECTORS_FILE, NORMS_FILE, IDS_FILE, METADATA_FILE, CHUNKS_FILE)
+    }
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        # Content-addressed: the same chunks and vectors always give the same version
+        "version": hashlib.sha256("".join(files[name]["sha256"] for name in sorted(files)).encode()).hexdigest()[:16],
+        "created_at": datetime.now().isoformat(),
+        "embedding_backend": embedding_backend,
+        "embedding_model": embedding_model,
+        "dimension": int(vectors.shape[1]) if len(ids) else 0,
+        "chunks": len(ids),
+        "chunk_size": Config.CHUNK_SIZE,
+        "chunk_overlap": Config.CHUNK_OVERLAP,
+        "chunking": "parent_child" if parent_texts else "standard",
+        "parents": len(parent_texts or {}),
+        "sources": sources or [],
+        "files": files
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.rename(staging, output_dir)
+    return manifest
+
+
+def verify_artifact(path: str) -> List[str]:
+    """Problems found checking an artifact against its manifest (empty if it is intact)"""
+    try:
+        manifest = read_manifest(path)
+    except (OSError, ValueError) as e:
+        return [f"unreadable manifest: {str(e)}"]
+    problems = []
+    if manifest.get("format") != ARTIFACT_FORMAT:
+        problems.append(f"unsupported format {manifest.get('format')} (expected {ARTIFACT_FORMAT})")
+    for name, expected in manifest.get("files", {}).items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            problems.append(f"{name}: missing")
+        elif os.path.getsize(file_path) != expected["bytes"]:
+            problems.append(f"{name}: size {os.path.getsize(file_path)} != {expected['bytes']}")
+        elif _sha256(file_path) != expected["sha256"]:
+            problems.append(f"{name}: checksum mismatch")
+    return problems
+
+
+class ArtifactVectorStore(VectorStore):
+    """Read-only vector store over an index artifact built by build_index.py.
+
+    Mounting does no per-boot processing: the vector matrix and norms are
+    memory-mapped, chunk text is read from the artifact's SQLite file opened
+    immutable, and only the chunk ids and metadata are parsed. Search is an
+    exact scan over the mapped matrix returning Chroma's squared L2
+    distances, so similarities mean the same as with the Chroma index.
+    """
+
+    def __init__(self, artifact_path: str, embeddings: Optional[Embeddings] = None):
+        self.artifact_path = artifact_path
+        self.manifest = read_manifest(artifact_path)
+        if self.manifest["format"] != ARTIFACT_FORMAT:
+            raise ValueError(f"Unsupported index artifact format {self.manifest['format']} in {artifact_path}")
+        super().__init__(embeddings=embeddings, persist_directory=artifact_path)
+
+    def setup_vector_store(self):
+        """Map the artifact's files; nothing is copied or rebuilt"""
+        path = self.artifact_path
+        self.vector_store = None
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        self.norms = np.load(os.path.join(path, NORMS_FILE), mmap_mode="r")
+        with open(os.path.join(path, IDS_FILE), 'r', encoding='utf-8') as f:
+            self.ids = json.load(f)
+        with open(os.path.join(path, METADATA_FILE), 'r', encoding='utf-8') as f:
+            self.metadatas = json.load(f)
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        self.chunk_store = ChunkStore(os.path.join(path, CHUNKS_FILE), read_only=True)
+        print(f"Mounted index artifact {self.manifest['version']} ({len(self.ids)} chunks) from {path}")
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def check_embeddings(self) -> Optional[Dict]:
+        # Artifacts built before the backend was recorded were embedded with Gemini
+        recorded = {
+            "backend": self.manifest.get("embedding_backend", "gemini"),
+            "model": self.manifest["embedding_model"],
+            "dimension": self.manifest["dimension"] or None
+        }
+        check_compatible(recorded, self.embeddings.identity, f"Index artifact {self.artifact_path}")
+        return recorded
+
+    def check_chunking(self) -> str:
+        return self.manifest.get("chunking", "standard")
+
+    def _rows(self, positions: List[int], include: List[str]) -> Dict:
+        rows = {"ids": [self.ids[i] for i in positions]}
+        if "metadatas" in include:
+            rows["metadatas"] = [self.metadatas[i] for i in positions]
+        if "embeddings" in include:
+            rows["embeddings"] = [np.asarray(self.vectors[i]) for i in positions]
+        if "documents" in include:
+            texts = self.chunk_store.get_many(rows["ids"])
+            rows["documents"] = [texts.get(chunk_id) for chunk_id in rows["ids"]]
+        return rows
+
+    def _distances(self, queries: np.ndarray) -> np.ndarray:
+        # Squared L2 distance, as Chroma's default space: |q|^2 + |v|^2 - 2 q.v
+        return self.norms[None, :] + np.einsum("ij,ij->i", queries, queries)[:, None] - 2 * (queries @ self.vectors.T)
+
+    def _query_collection(self, query_embeddings: List[List[float]], n_results: int, include: List[str]) -> Dict:
+        results = {key: [] for key in ["ids", "distances"] + list(include)}
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        n = min(n_results, len(self.ids))
+        if n == 0:
+            for key in results:
+                results[key] = [[] for _ in query_embeddings]
+            return results
+        # The scan reads the mapped matrix (page faults, BLAS) on the blocking pool
+        distances = run_blocking(self._distances, queries)
+        for row in distances:
+            nearest = np.argpartition(row, n - 1)[:n]
+            nearest = nearest[np.argsort(row[nearest])]
+            for key, values in self._rows(nearest.tolist(), include).items():
+                results[key].append(values)
+            results["distances"].append(row[nearest].tolist())
+        return results
+
+    def _get_collection(self, ids: List[str], include: List[str]) -> Dict:
+        return self._rows([self._positions[chunk_id] for chunk_id in ids if chunk_id in self._positions], include)
+
+    def pending_files(self, file_paths: List[str]) -> List[str]:
+        return []
+
+    def add_documents(self, documents: List[Document]):
+        raise RuntimeError(f"Index artifact {self.artifact_path} is read-only; rebuild it with build_index.py")
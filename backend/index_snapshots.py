@@ -0,0 +1,431 @@
+import contextlib
+import contextvars
+import fcntl
+import functools
+import inspect
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from backend.blocking import run_blocking
+from backend.config import Config
+from backend.vector_store import VectorStore
+
+# Layout of INDEX_SNAPSHOT_DIR:
+#   CURRENT             number of the version readers use, replaced atomically
+#   versions/v000003/   one complete Chroma index + chunks.db per version, never modified once published
+#   building-v000004/   the next version while it is written (kept after a crash, so the build resumes)
+#   leases/<pid>.json   versions each worker process still has open
+#   .writer.lock        serializes writers across processes
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+LEASES_DIR = "leases"
+LOCK_FILE = ".writer.lock"
+
+# Snapshot version the running request reads from, set by SnapshotVectorStore.pin()
+_pinned = contextvars.ContextVar("index_snapshot_version", default=None)
+
+
+def version_path(root: str, version: int) -> str:
+    return os.path.join(root, VERSIONS_DIR, f"v{version:06d}")
+
+
+def _building_path(root: str, version: int) -> str:
+    return os.path.join(root, f"building-v{version:06d}")
+
+
+def read_current(root: str) -> int:
+    """Version readers should use (0 before the first snapshot exists)"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def _write_atomic(path: str, text: str, durable: bool = True):
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _write_current(root: str, version: int):
+    _write_atomic(os.path.join(root, CURRENT_FILE), f"{version}\n")
+    # Make the rename itself survive a crash
+    fd = os.open(root, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _copy_index(source: str, target: str, exclude: Optional[str] = None):
+    """Copy an index directory; SQLite files go through the backup API, so the copy is consistent"""
+    os.makedirs(target, exist_ok=True)
+    if not os.path.isdir(source):
+        return
+    for name in os.listdir(source):
+        src, dst = os.path.join(source, name), os.path.join(target, name)
+        if exclude is not None and os.path.abspath(src) == exclude:
+            continue
+        if os.path.isdir(src):
+            _copy_index(src, dst, exclude)
+        elif name.endswith(("-wal", "-shm", "-journal")):
+            continue
+        elif name.endswith((".sqlite3", ".db")):
+            with contextlib.closing(sqlite3.connect(src)) as src_conn, contextlib.closing(sqlite3.connect(dst)) as dst_conn:
+                src_conn.backup(dst_conn)
+        else:
+            shutil.copy2(src, dst)
+
+
+@contextlib.contextmanager
+def _writer_lock(root: str, blocking: bool = True):
+    """Cross-process writer lock; yields False instead of waiting when blocking is off and it is taken"""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), 'a') as f:
+        try:
+            # flock waits in the kernel, where gevent cannot switch away
+            run_blocking(fcntl.flock, f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            locked = True
+        except BlockingIOError:
+            locked = False
+        try:
+            yield locked
+        finally:
+            if locked:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_lease(root: str, versions: Set[int]):
+    leases = os.path.join(root, LEASES_DIR)
+    os.makedirs(leases, exist_ok=True)
+    path = os.path.join(leases, f"{os.getpid()}.json")
+    if versions:
+        _write_atomic(path, json.dumps(sorted(versions)), durable=False)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def bootstrap(root: str):
+    """Create version 1 if there is no snapshot yet, from the index in CHROMA_DB_PATH if it has one"""
+    if read_current(root):
+        return
+    with _writer_lock(root):
+        if read_current(root):
+            return
+        staging = _building_path(root, 1)
+        shutil.rmtree(staging, ignore_errors=True)
+        # The snapshot directory may live inside CHROMA_DB_PATH (e.g. on the same persistent disk)
+        snapshot_root = os.path.abspath(root)
+        legacy = Config.CHROMA_DB_PATH
+        if os.path.isdir(legacy) and any(os.path.abspath(os.path.join(legacy, name)) != snapshot_root
+                                         for name in os.listdir(legacy)):
+            print(f"Copying the index in {legacy} into index snapshot version 1...")
+        run_blocking(_copy_index, legacy, staging, snapshot_root)
+        target = version_path(root, 1)
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.rename(staging, target)
+        _write_current(root, 1)
+
+
+def collect_garbage(root: str) -> List[int]:
+    """Delete versions older than CURRENT that no live process holds; returns the deleted versions"""
+    with _writer_lock(root, blocking=False) as locked:
+        if not locked:
+            # A writer is busy and collects when it has published
+            return []
+        current = read_current(root)
+        held = set()
+        leases = os.path.join(root, LEASES_DIR)
+        for name in os.listdir(leases) if os.path.isdir(leases) else []:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(leases, name)
+            if not _pid_alive(int(name[:-len(".json")])):
+                os.remove(path)
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    held.update(json.load(f))
+            except (OSError, ValueError):
+                continue
+        deleted = []
+        versions = os.path.join(root, VERSIONS_DIR)
+        for name in sorted(os.listdir(versions)) if os.path.isdir(versions) else []:
+            version = int(name[1:])
+            if version < current and version not in held:
+                run_blocking(shutil.rmtree, os.path.join(versions, name), ignore_errors=True)
+                deleted.append(version)
+        if deleted:
+            print(f"Deleted unused index versions {deleted}")
+        return deleted
+
+
+class SnapshotWriter:
+    """Builds the next index version next to the current one and publishes it atomically.
+
+    The new version starts as a copy of the current one and documents are
+    added to the copy with add_documents' per-batch checkpoints, so a build
+    that crashed resumes on the next call. CURRENT is switched only once the
+    copy is complete. Writers in all processes take turns through a file lock.
+    """
+
+    def __init__(self, root: str, embeddings: Optional[Embeddings] = None):
+        self.root = root
+        self.embeddings = embeddings
+        bootstrap(root)
+
+    def open_store(self, path: str) -> VectorStore:
+        store = run_blocking(VectorStore, embeddings=self.embeddings, persist_directory=path)
+        # Later stores share the wrapped embeddings (limiter and query cache)
+        self.embeddings = store.embeddings
+        return store
+
+    def pending_files(self, file_paths: List[str]) -> List[str]:
+        """Files the current version does not fully contain"""
+        store = self.open_store(version_path(self.root, read_current(self.root)))
+        try:
+            return store.pending_files(file_paths)
+        finally:
+            store.close()
+
+    def add_documents(self, documents: List[Document]) -> int:
+        """Add documents in a new version and make it current; returns the number of chunks added"""
+        if not documents:
+            print("No documents to add")
+            return 0
+        with _writer_lock(self.root):
+            version = read_current(self.root) + 1
+            staging = _building_path(self.root, version)
+            if os.path.isdir(staging):
+                print(f"Resuming the interrupted build of index version {version}")
+            else:
+                # Builds on top of an older version are of no use any more
+                for name in os.listdir(self.root):
+                    if name.startswith("building-"):
+                        shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                # Copied under another name first, so a half-finished copy is never resumed
+                run_blocking(_copy_index, version_path(self.root, version - 1), f"{staging}.copy")
+                os.rename(f"{staging}.copy", staging)
+            store = self.open_store(staging)
+            try:
+                added = store.add_documents(documents)
+            finally:
+                store.close()
+            if not added:
+                # Everything was already indexed; keep serving the current version
+                shutil.rmtree(staging, ignore_errors=True)
+                return 0
+            os.rename(staging, version_path(self.root, version))
+            _write_current(self.root, version)
+            print(f"Published index version {version} ({added} new chunks)")
+        collect_garbage(self.root)
+        return added
+
+
+class SnapshotVectorStore:
+    """The current index snapshot, used like a VectorStore.
+
+    Attribute access goes to the version pinned for the running request
+    (pin() before, release() after each request). Outside of one, each
+    method call pins the newest version for its own duration, so a version
+    is never closed under a caller that did not pin it. A version published by any process is opened in
+    the background and served from the next request on. A version is closed
+    once the last request pinned to it has finished, and deleted from disk
+    once no process holds it. add_documents publishes a new version through
+    SnapshotWriter, so searches never see a half-written batch or wait on
+    the writer's SQLite locks.
+    """
+
+    def __init__(self, root: str, embeddings: Optional[Embeddings] = None):
+        self.root = root
+        self.writer = SnapshotWriter(root, embeddings)
+        self._lock = threading.Lock()
+        self._stores: Dict[int, VectorStore] = {}
+        self._refs: Dict[int, int] = {}
+        self._latest = 0
+        # (inode, mtime) of CURRENT when it was last followed
+        self._seen = None
+        self._opening = False
+        for _ in range(3):
+            if self._open(read_current(root)):
+                break
+        else:
+            raise RuntimeError(f"Could not open the current index snapshot in {root}")
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if _pinned.get() is not None:
+            return getattr(self.current(), name)
+        with self.pinned():
+            value = getattr(self.current(), name)
+        if not callable(value):
+            return value
+        if inspect.iscoroutinefunction(value):
+            @functools.wraps(value)
+            async def call_async(*args, **kwargs):
+                with self.pinned():
+                    return await getattr(self.current(), name)(*args, **kwargs)
+            return call_async
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            with self.pinned():
+                return getattr(self.current(), name)(*args, **kwargs)
+        return call
+
+    def _open(self, version: int) -> bool:
+        with self._lock:
+            # Leased before opening, so a collector cannot delete it meanwhile
+            _write_lease(self.root, set(self._stores) | {version})
+        if not os.path.isdir(version_path(self.root, version)):
+            # Collected before the lease landed: a newer version is current by now
+            with self._lock:
+                _write_lease(self.root, set(self._stores))
+            return False
+        store = self.writer.open_store(version_path(self.root, version))
+        with self._lock:
+            self._stores[version] = store
+            self._refs.setdefault(version, 0)
+            self._latest = max(self._latest, version)
+        print(f"Serving index version {version}")
+        self._release_unused()
+        return True
+
+    def _open_in_background(self, version: int, seen: Tuple[int, int]):
+        try:
+            if self._open(version):
+                self._seen = seen
+        except Exception as e:
+            print(f"Error opening index version {version}: {str(e)}")
+        finally:
+            self._opening = False
+
+    def _refresh(self):
+        """Start opening a newer version if CURRENT has moved (one stat per call)"""
+        try:
+            stat = os.stat(os.path.join(self.root, CURRENT_FILE))
+        except FileNotFoundError:
+            return
+        seen = (stat.st_ino, stat.st_mtime_ns)
+        if seen == self._seen or self._opening:
+            return
+        version = read_current(self.root)
+        with self._lock:
+            if self._opening:
+                return
+            if version <= self._latest:
+                self._seen = seen
+                return
+            self._opening = True
+        # Requests keep using the open version while the new one is opened
+        threading.Thread(
+            target=self._open_in_background, args=(version, seen), name="index-snapshot-open", daemon=True
+        ).start()
+
+    def _release_unused(self):
+        with self._lock:
+            unused = [v for v in self._stores if v != self._latest and self._refs.get(v, 0) == 0]
+            closed = []
+            for version in unused:
+                closed.append(self._stores.pop(version))
+                self._refs.pop(version, None)
+            if unused:
+                _write_lease(self.root, set(self._stores))
+        for store in closed:
+            store.close()
+        if unused:
+            collect_garbage(self.root)
+
+    def _resolve(self) -> Tuple[int, VectorStore]:
+        version = _pinned.get()
+        if version is None:
+            self._refresh()
+        with self._lock:
+            version = version if version is not None else self._latest
+            return version, self._stores[version]
+
+    def current(self) -> VectorStore:
+        """The version pinned for this request, or the newest one"""
+        return self._resolve()[1]
+
+    def pin(self) -> int:
+        """Serve the running request from the newest open version until release()"""
+        self._refresh()
+        with self._lock:
+            version = self._latest
+            self._refs[version] += 1
+        _pinned.set(version)
+        return version
+
+    def release(self):
+        version = _pinned.get()
+        if version is None:
+            return
+        _pinned.set(None)
+        with self._lock:
+            self._refs[version] -= 1
+        self._release_unused()
+
+    @contextlib.contextmanager
+    def pinned(self):
+        """Serve the enclosed block from one version: the request's pinned one, or the newest, pinned until it ends"""
+        if _pinned.get() is not None:
+            yield
+            return
+        self.pin()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @property
+    def generation(self):
+        """Distinct per version, so caches keyed by it never mix versions"""
+        with self.pinned():
+            version, store = self._resolve()
+            return (version, store.generation)
+
+    def add_documents(self, documents: List[Document]) -> int:
+        added = self.writer.add_documents(documents)
+        # Follow the new version now rather than on the next request's check
+        self._refresh()
+        return added
+
+    def get_snapshot_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "version": self._latest,
+                "open_versions": {str(v): self._refs.get(v, 0) for v in sorted(self._stores)}
+            }
+
+    def close(self):
+        with self._lock:
+            stores = list(self._stores.values())
+            self._stores.clear()
+            _write_lease(self.root, set())
+        for store in stores:
+            store.close()
@@ -0,0 +1,24 @@
+import threading
+from typing import Any, Callable
+
+
+class Lazy:
+    """A component created by factory on first use, exactly once even when first requests race"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._created = False
+
+    @property
+    def initialized(self) -> bool:
+        return self._created
+
+    def get(self) -> Any:
+        if not self._created:
+            with self._lock:
+                if not self._created:
+                    self._value = self._factory()
+                    self._created = True
+        return self._value
@@ -1,12 +1,15 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+import asyncio
 import os
 import shutil
-from document_processor import DocumentProcessor
-from vector_store import VectorStore
-from rag_chain import RAGChain
+from backend.document_processor import DocumentProcessor
+from backend.vector_store import open_vector_store
+from backend.index_snapshots import SnapshotVectorStore
+from backend.rag_chain import RAGChain
+from backend.admission import AdmissionRejected
 
 app = FastAPI(title="Indian Legal RAG Chatbot", version="1.0.0")
 
@@ -21,15 +24,29 @@ app.add_middleware(
 
 # Initialize components
 document_processor = DocumentProcessor()
-vector_store = VectorStore()
-rag_chain = RAGChain()
+vector_store = open_vector_store()
+rag_chain = RAGChain(vector_store=vector_store)
+
+# With index snapshots each request reads one index version from start to finish,
+# however many searches it makes and whatever is published meanwhile
+if isinstance(vector_store, SnapshotVectorStore):
+    @app.middleware("http")
+    async def pin_index_version(request: Request, call_next):
+        vector_store.pin()
+        try:
+            return await call_next(request)
+        finally:
+            # Closing a version no request uses any more touches disk
+            await asyncio.to_thread(vector_store.release)
 
 class QueryRequest(BaseModel):
     question: str
+    session_id: Optional[str] = None
 
 class QueryResponse(BaseModel):
     answer: str
     sources: List[dict]
+    degradations: List[str] = []
 
 @app.get("/")
 async def root():
@@ -54,20 +71,22 @@ async def upload_documents(files: List[UploadFile] = File(...)):
                 shutil.copyfileobj(file.file, buffer)
             uploaded_files.append(file_path)
         
-        # Process documents
-        documents = document_processor.process_documents(uploaded_files)
+        # Process documents in a worker thread so queries keep being served
+        documents = await asyncio.to_thread(document_processor.process_documents, uploaded_files)
         
         if not documents:
             raise HTTPException(status_code=400, detail="No documents could be processed")
         
         # Add to vector store
-        vector_store.add_documents(documents)
+        await asyncio.to_thread(vector_store.add_documents, documents)
         
         return {
             "message": f"Successfully processed {len(documents)} document chunks from {len(uploaded_files)} files",
             "files_processed": [os.path.basename(f) for f in uploaded_files]
         }
         
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing documents: {str(e)}")
 
@@ -78,9 +97,11 @@ async def query_documents(request: QueryRequest):
         if not request.question.strip():
             raise HTTPException(status_code=400, detail="Question cannot be empty")
         
-        result = rag_chain.query(request.question)
+        result = await rag_chain.aquery(request.question, request.session_id)
         return QueryResponse(**result)
         
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
@@ -95,19 +116,21 @@ async def initialize_with_existing_pdfs():
             return {"message": "No PDF files found in current directory"}
         
         # Process the PDF files
-        documents = document_processor.process_documents(pdf_files)
+        documents = await asyncio.to_thread(document_processor.process_documents, pdf_files)
         
         if not documents:
             raise HTTPException(status_code=400, detail="No documents could be processed")
         
         # Add to vector store
-        vector_store.add_documents(documents)
+        await asyncio.to_thread(vector_store.add_documents, documents)
         
         return {
             "message": f"Successfully initialized with {len(documents)} document chunks from {len(pdf_files)} files",
             "files_processed": pdf_files
         }
         
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error initializing system: {str(e)}")
 
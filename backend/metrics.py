@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from backend.config import Config
+
+# Histogram buckets in seconds, from sub-millisecond searches up to the gunicorn timeout
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_lock = threading.Lock()
+_prometheus = None
+_observers: List[Callable[[str, float], None]] = []
+# Fast flag checked on every hot-path call; true when Prometheus is enabled or an observer is attached
+_active = Config.METRICS_ENABLED
+
+
+class _NullTimer:
+    """Shared no-op timer returned when instrumentation is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def _metrics() -> Dict:
+    """Create the Prometheus metric objects on first use"""
+    global _prometheus
+    if _prometheus is None:
+        with _lock:
+            if _prometheus is None:
+                from prometheus_client import Counter, Gauge, Histogram
+                _prometheus = {
+                    "stage": Histogram(
+                        "rag_stage_duration_seconds", "Time spent in each query pipeline stage",
+                        ["stage"], buckets=LATENCY_BUCKETS
+                    ),
+                    "counter": Counter(
+                        "rag_events", "Query pipeline counters (documents retrieved, prompt size, ...)",
+                        ["event"]
+                    ),
+                    "admission_wait": Histogram(
+                        "rag_admission_wait_seconds", "Time spent queued for an upstream slot",
+                        ["limiter"], buckets=LATENCY_BUCKETS
+                    ),
+                    "admission_rejected": Counter(
+                        "rag_admission_rejected", "Requests rejected by admission control",
+                        ["limiter", "reason"]
+                    ),
+                    "admission_queue": Gauge(
+                        "rag_admission_queue_depth", "Callers waiting for an upstream slot",
+                        ["limiter"], multiprocess_mode="livesum"
+                    ),
+                    "coalescing": Counter(
+                        "rag_coalesced_queries", "Context-free queries by single-flight role",
+                        ["role"]
+                    )
+                }
+    return _prometheus
+
+
+def enabled() -> bool:
+    return _active
+
+
+def stage(name: str):
+    """Context manager timing one pipeline stage"""
+    if not _active:
+        return _NULL_TIMER
+    return _StageTimer(name)
+
+
+def observe_stage(name: str, seconds: float):
+    """Record a stage duration measured by the caller"""
+    if not _active:
+        return
+    if Config.METRICS_ENABLED:
+        _metrics()["stage"].labels(name).observe(seconds)
+    for observer in _observers:
+        observer(name, seconds)
+
+
+def increment(event: str, amount: float = 1):
+    """Increment a pipeline counter such as documents_retrieved or prompt_characters"""
+    if Config.METRICS_ENABLED:
+        _metrics()["counter"].labels(event).inc(amount)
+
+
+def observe_admission_wait(limiter: str, seconds: float):
+    if Config.METRICS_ENABLED:
+        _metrics()["admission_wait"].labels(limiter).observe(seconds)
+
+
+def record_admission_rejected(limiter: str, reason: str):
+    if Config.METRICS_ENABLED:
+        _metrics()["admission_rejected"].labels(limiter, reason).inc()
+
+
+def set_admission_queue_depth(limiter: str, depth: int):
+    if Config.METRICS_ENABLED:
+        _metrics()["admission_queue"].labels(limiter).set(depth)
+
+
+def record_coalescing(role: str):
+    if Config.METRICS_ENABLED:
+        _metrics()["coalescing"].labels(role).inc()
+
+
+def add_observer(observer: Callable[[str, float], None]):
+    """Receive every stage duration in-process (used by the benchmarks)"""
+    global _active
+    with _lock:
+        _observers.append(observer)
+        _active = True
+
+
+def remove_observer(observer: Callable[[str, float], None]):
+    global _active
+    with _lock:
+        _observers.remove(observer)
+        _active = Config.METRICS_ENABLED or bool(_observers)
+
+
+def render() -> Tuple[bytes, str]:
+    """Render all metrics in Prometheus text format, aggregated across gunicorn workers"""
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    _metrics()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Drop a dead worker's live gauges (called from the gunicorn child_exit hook)"""
+    if Config.METRICS_ENABLED and os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
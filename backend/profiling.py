@@ -0,0 +1,270 @@
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from backend.blocking import gevent_active
+from backend.config import Config
+
+# Profile ids are generated here; anything else in a URL is rejected
+_PROFILE_ID = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]+-[0-9a-f]{8}$')
+_PROFILE_FILES = {"profile.pstats", "profile.txt", "profile.folded", "allocations.txt",
+                  "allocations.tracemalloc", "meta.json"}
+
+# One profiled request at a time per worker: cProfile and tracemalloc are process-wide
+_busy = threading.Lock()
+
+# Requests in flight in this worker and started so far, to tell how many overlapped a profile
+_requests_lock = threading.Lock()
+_requests = {"in_flight": 0, "started": 0}
+
+
+def profiling_enabled() -> bool:
+    return bool(Config.PROFILING_TOKEN) or Config.PROFILE_SAMPLE_RATE > 0
+
+
+def authorized(token: Optional[str]) -> bool:
+    return bool(Config.PROFILING_TOKEN) and bool(token) and hmac.compare_digest(token, Config.PROFILING_TOKEN)
+
+
+def request_started():
+    with _requests_lock:
+        _requests["in_flight"] += 1
+        _requests["started"] += 1
+
+
+def request_finished():
+    with _requests_lock:
+        _requests["in_flight"] = max(0, _requests["in_flight"] - 1)
+
+
+def profile_mode() -> str:
+    """PROFILE_MODE, with "auto" resolved: sampling under gevent, where cProfile would record
+    every greenlet the worker interleaves with the request, cprofile otherwise"""
+    if Config.PROFILE_MODE == "auto":
+        return "sampling" if gevent_active() else "cprofile"
+    return Config.PROFILE_MODE
+
+
+def _os_thread_primitives():
+    """(get_ident, start_new_thread, allocate_lock, sleep) of real OS threads, also when gevent has patched them"""
+    import _thread
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched("threading"):
+            return tuple(monkey.get_original(module, name) for module, name in (
+                ("_thread", "get_ident"), ("_thread", "start_new_thread"), ("_thread", "allocate_lock"), ("time", "sleep")
+            ))
+    except ImportError:
+        pass
+    return _thread.get_ident, _thread.start_new_thread, _thread.allocate_lock, time.sleep
+
+
+class _StackSampler:
+    """Wall-clock sampling of one request's stack (time spent waiting on Gemini or disk included).
+
+    Under gevent the request is a greenlet: while it is suspended its
+    stack is read from the greenlet, while it runs from its OS thread.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        get_ident, self._start_new_thread, allocate_lock, self._sleep = _os_thread_primitives()
+        self._thread_id = get_ident()
+        try:
+            import greenlet
+            self._greenlet = greenlet.getcurrent()
+        except ImportError:
+            self._greenlet = None
+        self._stopped = False
+        # Held while the sampler runs
+        self._running = allocate_lock()
+
+    def _frame(self):
+        if self._greenlet is not None and self._greenlet.gr_frame is not None:
+            return self._greenlet.gr_frame
+        return sys._current_frames().get(self._thread_id)
+
+    def _run(self):
+        try:
+            while not self._stopped:
+                frame = self._frame()
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[";".join(reversed(stack))] += 1
+                self._sleep(self.interval)
+        finally:
+            self._running.release()
+
+    def start(self):
+        self._running.acquire()
+        self._start_new_thread(self._run, ())
+
+    def stop(self):
+        self._stopped = True
+        if self._running.acquire(timeout=1.0):
+            self._running.release()
+
+    def write(self, directory: str):
+        # Collapsed stacks, for flamegraph.pl / speedscope
+        with open(os.path.join(directory, "profile.folded"), 'w', encoding='utf-8') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+        total = sum(self.stacks.values()) or 1
+        inclusive: Counter = Counter()
+        for stack, count in self.stacks.items():
+            for name in set(stack.split(";")):
+                inclusive[name] += count
+        with open(os.path.join(directory, "profile.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"{total} samples every {self.interval * 1000:.0f}ms; share of wall time per function (inclusive)\n\n")
+            for name, count in inclusive.most_common(60):
+                f.write(f"{100 * count / total:6.1f}%  {name}\n")
+
+
+class RequestProfiler:
+    """Profiles one request (cProfile or stack sampling) plus a tracemalloc snapshot of its allocations.
+
+    Output goes to PROFILE_DIR/<profile id>/: profile.pstats or profile.folded,
+    a profile.txt summary, allocations.txt / allocations.tracemalloc, meta.json.
+    """
+
+    def __init__(self, label: str, trigger: str):
+        self.id = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.label = label
+        self.trigger = trigger
+        self.mode = profile_mode()
+        self.directory = os.path.join(Config.PROFILE_DIR, self.id)
+        self._profile = None
+        self._sampler = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if Config.PROFILE_ALLOCATIONS and not tracemalloc.is_tracing():
+            tracemalloc.start(Config.PROFILE_ALLOCATION_FRAMES)
+            self._started_tracemalloc = True
+        self._started_at = datetime.now().isoformat()
+        self._start = time.perf_counter()
+        with _requests_lock:
+            # This request is already counted in flight
+            self._overlapping = max(0, _requests["in_flight"] - 1)
+            self._started_before = _requests["started"]
+        if self.mode == "sampling":
+            self._sampler = _StackSampler(Config.PROFILE_SAMPLE_INTERVAL)
+            self._sampler.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self, status: int = None) -> str:
+        """Stop profiling and write the results; returns the profile id"""
+        try:
+            if self._profile is not None:
+                self._profile.disable()
+            if self._sampler is not None:
+                self._sampler.stop()
+            duration = time.perf_counter() - self._start
+            with _requests_lock:
+                concurrent = self._overlapping + _requests["started"] - self._started_before
+            warning = None
+            if self._profile is not None and concurrent and gevent_active():
+                warning = (f"cProfile ran while {concurrent} other request(s) were served by this gevent worker; "
+                           "their greenlets are in the profile too (PROFILE_MODE=sampling profiles only this request)")
+                print(f"Profile {self.id}: {warning}")
+            snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+            os.makedirs(self.directory, exist_ok=True)
+            if self._profile is not None:
+                self._profile.dump_stats(os.path.join(self.directory, "profile.pstats"))
+                summary = io.StringIO()
+                pstats.Stats(self._profile, stream=summary).sort_stats("cumulative").print_stats(60)
+                with open(os.path.join(self.directory, "profile.txt"), 'w', encoding='utf-8') as f:
+                    f.write(summary.getvalue())
+            if self._sampler is not None:
+                self._sampler.write(self.directory)
+            if snapshot is not None:
+                snapshot.dump(os.path.join(self.directory, "allocations.tracemalloc"))
+                with open(os.path.join(self.directory, "allocations.txt"), 'w', encoding='utf-8') as f:
+                    for stat in snapshot.statistics("lineno")[:40]:
+                        f.write(f"{stat}\n")
+            with open(os.path.join(self.directory, "meta.json"), 'w', encoding='utf-8') as f:
+                json.dump({
+                    "id": self.id, "request": self.label, "trigger": self.trigger, "mode": self.mode,
+                    "started_at": self._started_at, "duration_seconds": round(duration, 4), "status": status,
+                    "concurrent_requests": concurrent, "warning": warning,
+                    "files": sorted(name for name in os.listdir(self.directory) if name in _PROFILE_FILES)
+                }, f, indent=2)
+            print(f"Profile {self.id} of {self.label} written ({duration:.2f}s)")
+            _prune()
+            return self.id
+        finally:
+            _busy.release()
+
+
+def maybe_start(token: Optional[str], label: str) -> Optional[RequestProfiler]:
+    """Start profiling this request if it carries the profiling token or is sampled"""
+    if authorized(token):
+        trigger = "header"
+    elif Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE:
+        trigger = "sample"
+    else:
+        return None
+    if not _busy.acquire(blocking=False):
+        print(f"Not profiling {label}: another request is being profiled")
+        return None
+    profiler = RequestProfiler(label, trigger)
+    try:
+        profiler.start()
+    except Exception:
+        _busy.release()
+        raise
+    return profiler
+
+
+def _prune():
+    """Keep only the newest PROFILE_KEEP profiles"""
+    profiles = sorted(name for name in os.listdir(Config.PROFILE_DIR) if _PROFILE_ID.match(name))
+    for name in profiles[:-Config.PROFILE_KEEP] if Config.PROFILE_KEEP > 0 else []:
+        shutil.rmtree(os.path.join(Config.PROFILE_DIR, name), ignore_errors=True)
+
+
+def list_profiles(limit: int = 50) -> List[Dict]:
+    """Metadata of the most recent profiles written by any worker"""
+    if not os.path.isdir(Config.PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted((name for name in os.listdir(Config.PROFILE_DIR) if _PROFILE_ID.match(name)), reverse=True):
+        try:
+            with open(os.path.join(Config.PROFILE_DIR, name, "meta.json"), 'r', encoding='utf-8') as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # still being written
+        if len(profiles) >= limit:
+            break
+    return profiles
+
+
+def profile_file(profile_id: str, filename: str) -> Optional[str]:
+    """Path of one file of a profile, or None if there is no such file"""
+    if not _PROFILE_ID.match(profile_id) or filename not in _PROFILE_FILES:
+        return None
+    path = os.path.join(Config.PROFILE_DIR, profile_id, filename)
+    return path if os.path.isfile(path) else None
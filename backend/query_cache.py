@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from backend import metrics
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire ttl seconds after they were stored.
+
+    One instance per worker process; hits and misses are counted per cache
+    (`<name>_cache_hit` / `<name>_cache_miss`) in the pipeline counters.
+    """
+
+    def __init__(self, name: str, capacity: int, ttl: float = None):
+        self.name = name
+        self.capacity = capacity
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """The cached value, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        metrics.increment(f"{self.name}_cache_{'miss' if entry is None else 'hit'}")
+        return entry[1] if entry is not None else None
+
+    def contains(self, key: Hashable) -> bool:
+        """Whether a live entry exists, without counting a lookup"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not (self.ttl and time.monotonic() - entry[0] > self.ttl)
+
+    def put(self, key: Hashable, value: Any):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,111 @@
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Set
+
+from backend.config import Config
+from backend.singleflight import STOPWORDS, normalize_question
+
+
+def question_terms(question: str) -> Set[str]:
+    """Content terms of a question, used to group rephrasings of the same question"""
+    return {term for term in re.findall(r'[a-z0-9]+', question.lower()) if term not in STOPWORDS}
+
+
+class QueryLog:
+    """Hot-question analytics over the conversation history in the session store.
+
+    Questions asked within the last QUERY_LOG_WINDOW_HOURS are normalized
+    (case, whitespace, trailing punctuation) and grouped; groups whose content
+    terms overlap by at least QUERY_CLUSTER_SIMILARITY (Jaccard) are merged
+    into one cluster, represented by its most frequently asked phrasing.
+    """
+
+    def __init__(self, store, window_hours: float = None, similarity: float = None):
+        self.store = store
+        self.window_hours = window_hours if window_hours is not None else Config.QUERY_LOG_WINDOW_HOURS
+        self.similarity = similarity if similarity is not None else Config.QUERY_CLUSTER_SIMILARITY
+
+    def recent_questions(self, now: datetime = None) -> List[tuple]:
+        """(timestamp, question) pairs inside the sliding window"""
+        since = (now or datetime.now()) - timedelta(hours=self.window_hours)
+        return self.store.recent_questions(since)
+
+    def clusters(self, now: datetime = None) -> List[Dict]:
+        """Question clusters in the window, hottest first"""
+        groups: Dict[str, Dict] = {}
+        for timestamp, question in self.recent_questions(now):
+            key = normalize_question(question or "")
+            if not key:
+                continue
+            group = groups.setdefault(key, {"count": 0, "phrasings": Counter(), "last_asked": timestamp})
+            group["count"] += 1
+            group["phrasings"][question.strip()] += 1
+            group["last_asked"] = max(group["last_asked"], timestamp)
+
+        clusters: List[Dict] = []
+        by_term: Dict[str, List[int]] = {}
+        # Most asked groups first, so they seed the clusters their rephrasings join
+        for key, group in sorted(groups.items(), key=lambda item: item[1]["count"], reverse=True):
+            terms = question_terms(key)
+            candidates = {index for term in terms for index in by_term.get(term, [])}
+            match = None
+            for index in sorted(candidates):
+                cluster_terms = clusters[index]["terms"]
+                if len(terms & cluster_terms) / len(terms | cluster_terms) >= self.similarity:
+                    match = clusters[index]
+                    break
+            if match is None:
+                match = {"terms": terms, "count": 0, "variants": 0, "phrasings": Counter(), "last_asked": group["last_asked"]}
+                clusters.append(match)
+                for term in terms:
+                    by_term.setdefault(term, []).append(len(clusters) - 1)
+            match["count"] += group["count"]
+            match["variants"] += 1
+            match["phrasings"].update(group["phrasings"])
+            match["last_asked"] = max(match["last_asked"], group["last_asked"])
+
+        clusters.sort(key=lambda cluster: (cluster["count"], cluster["last_asked"]), reverse=True)
+        return [
+            {
+                "question": cluster["phrasings"].most_common(1)[0][0],
+                "count": cluster["count"],
+                "variants": cluster["variants"],
+                "last_asked": cluster["last_asked"]
+            }
+            for cluster in clusters
+        ]
+
+    def hot_clusters(self, limit: int = 20, now: datetime = None) -> List[Dict]:
+        return self.clusters(now)[:limit]
+
+
+def prewarm_hot_questions(rag_chain, limit: int = None) -> int:
+    """Pre-compute the hottest questions into rag_chain's caches; returns the number of questions warmed"""
+    start = time.perf_counter()
+    hot = QueryLog(rag_chain.sessions.store).hot_clusters(limit or Config.PREWARM_TOP_N)
+    if not hot:
+        return 0
+    warmed = rag_chain.prewarm([cluster["question"] for cluster in hot])
+    what = "answers" if Config.PREWARM_ANSWERS else "retrievals"
+    print(f"Pre-warmed {what} of {warmed} of {len(hot)} hot questions in {time.perf_counter() - start:.2f}s")
+    return warmed
+
+
+def start_prewarming(rag_chain) -> threading.Thread:
+    """Pre-warm now in the background, then every PREWARM_INTERVAL seconds if set"""
+    def run():
+        while True:
+            try:
+                prewarm_hot_questions(rag_chain)
+            except Exception as e:
+                print(f"Error pre-warming hot questions: {str(e)}")
+            if Config.PREWARM_INTERVAL <= 0:
+                return
+            time.sleep(Config.PREWARM_INTERVAL)
+
+    thread = threading.Thread(target=run, name="prewarm", daemon=True)
+    thread.start()
+    return thread
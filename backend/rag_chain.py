@@ -1,37 +1,71 @@
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
-from backend.vector_store import VectorStore
+from langchain_core.language_models import BaseChatModel
+from backend.vector_store import VectorStore, open_vector_store
 from backend.config import Config
 from backend.context_manager import ContextManager
-from typing import List, Dict, Set
+from backend.session_cache import SessionCache
+from backend import metrics
+from backend.admission import AdmissionRejected, INGESTION, get_limiter, priority
+from backend.blocking import BlockingTimeout, iterate_blocking
+from backend.singleflight import STOPWORDS, SingleFlight, normalize_question
+from backend.query_cache import TTLCache
+from backend.deadline import current_deadline, deadline
+from typing import Iterator, List, Dict, Set, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import contextlib
+import contextvars
 import re
+import time
+
+# Words ignored when measuring how well retrieved chunks cover a question: the shared stopwords,
+# plus legal terms that appear in nearly every question and chunk of this corpus
+_STOPWORDS = STOPWORDS | {"section", "article", "act", "law", "laws", "india", "indian"}
+
+# Words that make a question a follow-up without naming anything new to search for
+_FOLLOW_UP_WORDS = {
+    "more", "details", "detail", "further", "elaborate", "else", "also", "additionally", "furthermore",
+    "moreover", "similarly", "related", "case", "information", "addition", "then", "it", "its", "you",
+    "me", "please", "give", "say", "said", "mentioned", "above", "same", "one", "those", "these"
+}
 
 class RAGChain:
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model=Config.GEMINI_MODEL,
-            google_api_key=Config.GOOGLE_API_KEY,
-            temperature=0.8,
-            convert_system_message_to_human=True
-        )
+    # Context kept when a deadline forces a compressed prompt
+    COMPRESSED_CONTEXT_DOCS = 4
+    COMPRESSED_CHUNK_CHARS = 2000
+    
+    def __init__(self, llm: Optional[BaseChatModel] = None, vector_store: Optional[VectorStore] = None,
+                 sessions: Optional[SessionCache] = None):
+        if llm is None:
+            Config.validate()
+            llm = ChatGoogleGenerativeAI(
+                model=Config.GEMINI_MODEL,
+                google_api_key=Config.GOOGLE_API_KEY,
+                temperature=0.8,
+                convert_system_message_to_human=True
+            )
+        self.llm = llm
         
-        self.vector_store = VectorStore()
-        self.context_manager = ContextManager()
-        self.chain = None
-        self.setup_chain()
+        self.vector_store = vector_store or open_vector_store()
+        self.sessions = sessions or SessionCache()
+        self.single_flight = SingleFlight()
+        # Context-free questions: merged retrieval results (chunk ids, no text) and finished answers
+        self.retrieval_cache = TTLCache("retrieval", Config.RETRIEVAL_CACHE_SIZE, Config.QUERY_CACHE_TTL)
+        self.answer_cache = TTLCache("answer", Config.ANSWER_CACHE_SIZE, Config.QUERY_CACHE_TTL)
+        self.llm_limiter = get_limiter("llm")
     
-    def generate_query_variations(self, original_query: str) -> List[str]:
+    def generate_query_variations(self, original_query: str, session: Optional[ContextManager] = None) -> List[str]:
         """Generate multiple query variations to capture comprehensive information"""
         variations = [original_query]
         
-        # Add contextual variations based on conversation history
-        contextual_variations = self.context_manager.get_contextual_query_variations(original_query)
-        variations.extend(contextual_variations)
-        
-        # Add contextual variations based on conversation history
-        contextual_variations = self.context_manager.get_contextual_query_variations(original_query)
-        variations.extend(contextual_variations)
+        if session is not None:
+            # Add contextual variations based on conversation history
+            contextual_variations = session.get_contextual_query_variations(original_query)
+            variations.extend(contextual_variations)
+            
+            # Add contextual variations based on conversation history
+            contextual_variations = session.get_contextual_query_variations(original_query)
+            variations.extend(contextual_variations)
         
         # Convert to lowercase for analysis
         query_lower = original_query.lower()
@@ -111,249 +145,893 @@ class RAGChain:
                 seen.add(variation.lower())
                 unique_variations.append(variation)
         
-        return unique_variations[:5]  # Limit to 5 focused variations for speed
+        return unique_variations[:self._variation_limit()]
     
-    def setup_chain(self):
-        """Setup the RAG chain with custom prompt"""
-        
-        prompt_template = """You are an expert legal assistant specializing in Indian Constitution and Bharatiya Nyaya Sanhita (BNS). 
-        Use the following context from multiple legal documents to answer the user's question accurately and comprehensively.
-
-        Context: {context}
-
-        Question: {question}
-
-        Instructions:
-        1. Analyze ALL provided context from different documents (Constitution, Bharatiya Nyaya Sanhita, etc.)
-        2. For criminal law questions (like rape, theft, murder), focus on Bharatiya Nyaya Sanhita sections and provisions
-        3. For constitutional questions, focus on constitutional articles, fundamental rights, and directive principles
-        4. Combine information from multiple sources when relevant
-        5. Provide detailed explanations with proper structure using headings and bullet points
-        6. Include specific section/article numbers and quote the exact legal text when available
-        7. If information spans multiple documents, clearly organize by source
-        8. Always specify which document (Constitution vs BNS) each provision comes from
-        9. Provide practical implications, penalties, and legal significance
-        10. If context is insufficient, clearly state what information is missing
-
-        Format your response with:
-        ## Main Topic
-        ### From Indian Constitution (if applicable)
-        - Article numbers and provisions
-        ### From Bharatiya Nyaya Sanhita (if applicable)  
-        - Section numbers and provisions
-        ### Key Provisions
-        - Direct quotes from legal text
-        ### Penalties and Punishments (if applicable)
-        ### Practical Implications
-
-        Answer:"""
-        
-        PROMPT = PromptTemplate(
-            template=prompt_template,
-            input_variables=["context", "question"]
-        )
-        
-        retriever = self.vector_store.get_retriever(k=12)
-        
-        self.chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=retriever,
-            chain_type_kwargs={"prompt": PROMPT},
-            return_source_documents=True
-        )
+    def _variation_limit(self) -> int:
+        """Limit to 5 focused variations for speed; child chunks of a parent-child index match precisely enough with fewer"""
+        if self._parent_child():
+            return max(1, Config.PARENT_CHILD_QUERY_VARIATIONS)
+        return 5
+    
+    def _parent_child(self) -> bool:
+        return getattr(self.vector_store, "chunking", "standard") == "parent_child"
     
-    def multi_query_retrieval(self, question: str) -> List[Dict]:
+    def multi_query_retrieval(self, question: str, session: Optional[ContextManager] = None) -> List[Dict]:
         """Perform multiple queries to gather comprehensive information"""
         print(f"Starting multi-query retrieval for: {question}")
+        cache_key, cached, query_variations, k = self._plan_retrieval(question, session)
+        if cached is not None:
+            return cached
         
-        # Generate query variations
-        query_variations = self.generate_query_variations(question)
-        print(f"Generated {len(query_variations)} query variations")
-        
-        all_documents = []
-        seen_content = set()
+        results = []
+        if Config.ADAPTIVE_RETRIEVAL:
+            # Search the original question first and stop there if the hits are convincing
+            scored_docs = self.vector_store.similarity_search_with_similarity(question, k=k)
+            query_variations = self._adaptive_first_search(question, scored_docs, query_variations, results)
         
         for i, query in enumerate(query_variations):
+            if i < len(results):
+                continue
+            if i > 0 and self._retrieval_time_exhausted():
+                query_variations = query_variations[:i]
+                break
             try:
                 print(f"Executing query {i+1}/{len(query_variations)}: {query}")
                 
                 # Retrieve documents for this query variation
-                docs = self.vector_store.similarity_search(query, k=8)
-                
-                # Add unique documents
-                for doc in docs:
-                    # Create a hash of the content to avoid duplicates
-                    content_hash = hash(doc.page_content[:500])  # Use first 500 chars for uniqueness
-                    
-                    if content_hash not in seen_content:
-                        seen_content.add(content_hash)
-                        all_documents.append({
-                            'content': doc.page_content,
-                            'metadata': doc.metadata,
-                            'query_used': query,
-                            'relevance_score': i  # Lower index = higher relevance
-                        })
-                
+                results.append(self.vector_store.similarity_search(query, k=k))
+            except AdmissionRejected:
+                raise
             except Exception as e:
-                print(f"Error in query variation {i+1}: {str(e)}")
-                continue
+                results.append(self._failed_search(i, e))
         
+        return self._finish_retrieval(cache_key, query_variations, results)
+    
+    async def amulti_query_retrieval(self, question: str, session: Optional[ContextManager] = None) -> List[Dict]:
+        """Async multi-query retrieval that runs all query variations concurrently"""
+        print(f"Starting async multi-query retrieval for: {question}")
+        cache_key, cached, query_variations, k = self._plan_retrieval(question, session)
+        if cached is not None:
+            return cached
+        
+        results = []
+        if Config.ADAPTIVE_RETRIEVAL:
+            scored_docs = await self.vector_store.asimilarity_search_with_similarity(question, k=k)
+            query_variations = self._adaptive_first_search(question, scored_docs, query_variations, results)
+        
+        searched = await self._gather_searches(
+            [self.vector_store.asimilarity_search(query, k=k) for query in query_variations[len(results):]]
+        )
+        for i, result in enumerate(searched, len(results)):
+            if isinstance(result, AdmissionRejected):
+                raise result
+            results.append(self._failed_search(i, result) if isinstance(result, Exception) else result)
+        
+        return self._finish_retrieval(cache_key, query_variations, results)
+    
+    def _plan_retrieval(self, question: str, session: Optional[ContextManager]
+                        ) -> Tuple[Optional[Tuple], Optional[List[Dict]], List[str], int]:
+        """Cache key, cached documents (if any), and the query variations and k that fit the deadline"""
+        cache_key = self._retrieval_cache_key(question, session)
+        cached = self._cached_retrieval(cache_key)
+        if cached is not None:
+            return cache_key, cached, [], 0
+        with metrics.stage("query_expansion"):
+            query_variations = self.generate_query_variations(question, session)
+        print(f"Generated {len(query_variations)} query variations")
+        query_variations, k = self._retrieval_budget(query_variations)
+        return cache_key, None, query_variations, k
+    
+    def _adaptive_first_search(self, question: str, scored_docs: List[tuple], query_variations: List[str],
+                               results: List[list]) -> List[str]:
+        """Record the original question's hits in results; only it is searched when they are convincing"""
+        if not scored_docs:
+            return query_variations
+        results.append([doc for doc, _ in scored_docs])
+        if self._is_confident(question, scored_docs, len(query_variations)):
+            return query_variations[:1]
+        return query_variations
+    
+    @staticmethod
+    def _failed_search(i: int, error: Exception) -> list:
+        print(f"Error in query variation {i+1}: {str(error)}")
+        return []
+    
+    def _finish_retrieval(self, cache_key: Optional[Tuple], query_variations: List[str], results: List[list]) -> List[Dict]:
+        all_documents = self._merge_retrieval_results(query_variations, results)
         print(f"Retrieved {len(all_documents)} unique documents from multi-query search")
+        self._cache_retrieval(cache_key, all_documents)
+        return all_documents
+    
+    def _retrieval_budget(self, query_variations: List[str]) -> Tuple[List[str], int]:
+        """Query variations and k that fit in the time left on the request's deadline"""
+        current = current_deadline()
+        if current is None or current.remaining() >= 2 * Config.DEADLINE_GENERATION_RESERVE:
+            return query_variations, 8
+        if len(query_variations) > 1:
+            current.degrade("fewer_variations")
+        current.degrade("smaller_k")
+        return query_variations[:1], 4
+    
+    def _retrieval_time_exhausted(self) -> bool:
+        """Whether further searches would eat into the time reserved for generation"""
+        current = current_deadline()
+        if current is None or current.remaining() >= Config.DEADLINE_GENERATION_RESERVE:
+            return False
+        current.degrade("fewer_variations")
+        return True
+    
+    async def _gather_searches(self, searches: List) -> list:
+        """Run searches concurrently; under a deadline, searches still running when only the
+        generation reserve is left are cancelled and count as empty"""
+        current = current_deadline()
+        if current is None:
+            return await asyncio.gather(*searches, return_exceptions=True)
+        tasks = [asyncio.ensure_future(search) for search in searches]
+        if not tasks:
+            return []
+        done, pending = await asyncio.wait(tasks, timeout=max(0.0, current.remaining() - Config.DEADLINE_GENERATION_RESERVE))
+        for task in pending:
+            task.cancel()
+        if pending:
+            current.degrade("fewer_variations")
+        return [(task.exception() or task.result()) if task in done else [] for task in tasks]
+    
+    def _retrieval_cache_key(self, question: str, session: Optional[ContextManager]) -> Optional[Tuple]:
+        """Cache key for a context-free retrieval; None when conversation context shapes the search"""
+        if session is not None and session.current_context:
+            return None
+        return (self.vector_store.generation, normalize_question(question))
+    
+    @staticmethod
+    def _copy_documents(documents: List[Dict]) -> List[Dict]:
+        # Callers sort, trim and hydrate the list in place
+        return [dict(doc, metadata=dict(doc['metadata'])) for doc in documents]
+    
+    def _cached_retrieval(self, cache_key: Optional[Tuple]) -> Optional[List[Dict]]:
+        if cache_key is None:
+            return None
+        cached = self.retrieval_cache.get(cache_key)
+        if cached is None:
+            return None
+        print(f"Retrieval cache hit: {len(cached)} documents")
+        return self._copy_documents(cached)
+    
+    def _cache_retrieval(self, cache_key: Optional[Tuple], documents: List[Dict]):
+        current = current_deadline()
+        if current is not None and current.degradations:
+            # Results cut short by a deadline are not the question's real results
+            return
+        if cache_key is not None and documents:
+            # Cache ids and metadata only; text is hydrated again for the prompt
+            self.retrieval_cache.put(cache_key, [dict(doc, content="") if doc['metadata'].get('chunk_id') else doc
+                                                 for doc in self._copy_documents(documents)])
+    
+    def _is_confident(self, question: str, scored_docs: List[tuple], variation_count: int) -> bool:
+        """Decide whether the original question's hits are good enough to skip the other variations"""
+        if not scored_docs:
+            return False
+        
+        # How similar the best chunks are to the question
+        top_scores = sorted((score for _, score in scored_docs), reverse=True)[:3]
+        similarity = sum(top_scores) / len(top_scores)
+        
+        # How many of the question's content terms the hits actually contain
+        terms = self._content_terms(question)
+        retrieved_text = " ".join(doc.page_content.lower() for doc, _ in scored_docs)
+        coverage = sum(1 for term in terms if term in retrieved_text) / len(terms) if terms else 0.0
+        
+        confidence = (similarity + coverage) / 2
+        confident = confidence >= Config.ADAPTIVE_CONFIDENCE_THRESHOLD
+        metrics.increment("adaptive_early_exit" if confident else "adaptive_full_retrieval")
+        print(f"Adaptive retrieval: confidence {confidence:.2f} (similarity {similarity:.2f}, term coverage {coverage:.2f}) "
+              f"{'>=' if confident else '<'} {Config.ADAPTIVE_CONFIDENCE_THRESHOLD:.2f}, "
+              f"{'skipping' if confident else 'running'} {variation_count - 1} more variations")
+        return confident
+    
+    @staticmethod
+    def _content_terms(text: str) -> Set[str]:
+        return {term for term in re.findall(r'[a-z0-9]+', text.lower())
+                if len(term) > 2 and term not in _STOPWORDS}
+    
+    def _previous_chunks(self, session: Optional[ContextManager]) -> List[Dict]:
+        """Chunks that answered the session's last exchange (exchanges saved before they were recorded have none)"""
+        if session is None or not session.current_context:
+            return []
+        return session.current_context[-1].get("retrieved_chunks") or []
+    
+    def _new_terms(self, question: str, session: ContextManager) -> Set[str]:
+        """Content terms of a follow-up that the recent questions did not already cover"""
+        previous_questions = " ".join(exchange["user_question"] for exchange in session.current_context[-3:]).lower()
+        return {term for term in self._content_terms(question)
+                if term not in _FOLLOW_UP_WORDS and term not in previous_questions}
+    
+    def _reuse_previous_chunks(self, previous: List[Dict], docs: List) -> List:
+        """Restore each reused chunk's recorded score"""
+        scores = {chunk["chunk_id"]: chunk["score"] for chunk in previous}
+        for doc in docs:
+            doc.metadata["similarity"] = scores.get(doc.metadata["chunk_id"], 0.0)
+        return docs
+    
+    def follow_up_retrieval(self, question: str, session: ContextManager) -> Optional[List[Dict]]:
+        """Answer a follow-up from the previous exchange's chunks plus a small search for new terms only.
+
+        Returns None when the previous exchange has no reusable chunks, so the caller
+        falls back to full multi-query retrieval.
+        """
+        previous = self._previous_chunks(session)
+        if not previous:
+            return None
+        docs = self.vector_store.get_by_ids([chunk["chunk_id"] for chunk in previous])
+        if not docs:
+            return None
+        new_terms = self._new_terms(question, session)
+        delta = self.vector_store.similarity_search(question, k=Config.FOLLOW_UP_DELTA_K) if new_terms else None
+        return self._merge_follow_up(question, session, previous, docs, new_terms, delta)
+    
+    async def afollow_up_retrieval(self, question: str, session: ContextManager) -> Optional[List[Dict]]:
+        """Async version of follow_up_retrieval"""
+        previous = self._previous_chunks(session)
+        if not previous:
+            return None
+        docs = await self.vector_store.aget_by_ids([chunk["chunk_id"] for chunk in previous])
+        if not docs:
+            return None
+        new_terms = self._new_terms(question, session)
+        delta = await self.vector_store.asimilarity_search(question, k=Config.FOLLOW_UP_DELTA_K) if new_terms else None
+        return self._merge_follow_up(question, session, previous, docs, new_terms, delta)
+    
+    def _merge_follow_up(self, question: str, session: ContextManager, previous: List[Dict], docs: List,
+                         new_terms: Set[str], delta: Optional[list]) -> List[Dict]:
+        """The delta search's hits (if any) ahead of the reused chunks"""
+        queries, results = [], []
+        if delta is not None:
+            # New terms come first so they survive the top-document cut
+            queries.append(question)
+            results.append(delta)
+            metrics.increment("follow_up_delta_search")
+        queries.append(session.current_context[-1]["user_question"])
+        results.append(self._reuse_previous_chunks(previous, docs))
+        
+        metrics.increment("follow_up_reuse")
+        print(f"Follow-up retrieval: reused {len(docs)} chunks, "
+              f"{'delta search for ' + ', '.join(sorted(new_terms)) if new_terms else 'no new terms to search'}")
+        return self._merge_retrieval_results(queries, results)
+    
+    def _merge_retrieval_results(self, query_variations: List[str], results: List[list]) -> List[Dict]:
+        """Merge per-variation search results into a de-duplicated document list"""
+        all_documents = []
+        seen_chunks = set()
+        
+        for i, (query, docs) in enumerate(zip(query_variations, results)):
+            # Add unique documents
+            for doc in docs:
+                # Hits carry their chunk id (text is loaded later); fall back to the first 500 chars
+                chunk_key = doc.metadata.get('chunk_id') or hash(doc.page_content[:500])
+                
+                if chunk_key not in seen_chunks:
+                    seen_chunks.add(chunk_key)
+                    all_documents.append({
+                        'content': doc.page_content,
+                        'metadata': doc.metadata,
+                        'query_used': query,
+                        'relevance_score': i  # Lower index = higher relevance
+                    })
+        
         return all_documents
     
-    def query(self, question: str) -> dict:
-        """Process user query with multi-query retrieval and return comprehensive response"""
+    def query(self, question: str, session_id: Optional[str] = None) -> dict:
+        """Process user query with multi-query retrieval and return comprehensive response.
+
+        The question is answered in the context of session_id (a new session when
+        omitted or unknown); each request works on its own session object. The
+        pipeline runs within QUERY_DEADLINE seconds; work shed to meet it is
+        listed in the response's "degradations".
+        """
+        start = time.perf_counter()
+        try:
+            with deadline(Config.QUERY_DEADLINE):
+                return self._query(question, session_id)
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"Error in comprehensive query processing: {str(e)}")
+            return self._error_response(e)
+        finally:
+            metrics.observe_stage("query_total", time.perf_counter() - start)
+    
+    def _query(self, question: str, session_id: Optional[str]) -> dict:
+        session = self.sessions.get_or_create(session_id)
+        
+        # Get conversation context
+        conversation_context = session.get_context_summary()
+        is_follow_up = session.is_follow_up_question(question)
+        
+        if self._can_coalesce(session):
+            # Context-free answers are cached; identical questions in flight share one retrieval + generation
+            result = self.answer_cache.get(self._answer_cache_key(question))
+            if result is None:
+                result = self.single_flight.do(
+                    self._coalescing_key(question),
+                    lambda: self._generate_answer(question, conversation_context, is_follow_up, session),
+                    timeout=self._follower_wait(), accept=self._shareable
+                )
+                self._cache_answer(question, result)
+        else:
+            result = self._generate_answer(question, conversation_context, is_follow_up, session)
+        
+        if result is None:
+            return self._no_results_response()
+        
+        # Save this exchange to context history
+        session.add_exchange(question, result["answer"], result["sources"], result["retrieved_chunks"])
+        
+        return {
+            "answer": result["answer"],
+            "sources": result["sources"],
+            "session_id": session.current_session_id,
+            "is_follow_up": is_follow_up,
+            "degradations": result.get("degradations", [])
+        }
+    
+    async def aquery(self, question: str, session_id: Optional[str] = None) -> dict:
+        """Async version of query() that never blocks the event loop"""
+        start = time.perf_counter()
         try:
+            with deadline(Config.QUERY_DEADLINE):
+                return await self._aquery(question, session_id)
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"Error in comprehensive query processing: {str(e)}")
+            return self._error_response(e)
+        finally:
+            metrics.observe_stage("query_total", time.perf_counter() - start)
+    
+    async def _aquery(self, question: str, session_id: Optional[str]) -> dict:
+        session = await self.sessions.aget_or_create(session_id)
+        conversation_context = session.get_context_summary()
+        is_follow_up = session.is_follow_up_question(question)
+        
+        if self._can_coalesce(session):
+            result = self.answer_cache.get(self._answer_cache_key(question))
+            if result is None:
+                result = await self.single_flight.ado(
+                    self._coalescing_key(question),
+                    lambda: self._agenerate_answer(question, conversation_context, is_follow_up, session),
+                    timeout=self._follower_wait(), accept=self._shareable
+                )
+                self._cache_answer(question, result)
+        else:
+            result = await self._agenerate_answer(question, conversation_context, is_follow_up, session)
+        
+        if result is None:
+            return self._no_results_response()
+        
+        # Session persistence runs in a worker thread
+        await session.aadd_exchange(question, result["answer"], result["sources"], result["retrieved_chunks"])
+        
+        return {
+            "answer": result["answer"],
+            "sources": result["sources"],
+            "session_id": session.current_session_id,
+            "is_follow_up": is_follow_up,
+            "degradations": result.get("degradations", [])
+        }
+    
+    def _generate_answer(self, question: str, conversation_context: str, is_follow_up: bool,
+                         session: Optional[ContextManager] = None) -> Optional[Dict]:
+        """Run retrieval and generation; returns None when nothing relevant was found"""
+        retrieved_docs = None
+        if is_follow_up and Config.FOLLOW_UP_REUSE and session is not None:
+            retrieved_docs = self.follow_up_retrieval(question, session)
+        if retrieved_docs is None:
             # Perform multi-query retrieval
-            retrieved_docs = self.multi_query_retrieval(question)
-            
-            if not retrieved_docs:
-                return {
-                    "answer": "I apologize, but I couldn't find relevant information for your question in the available documents.",
-                    "sources": []
-                }
-            
-            # Sort documents by relevance and limit to top results
-            retrieved_docs.sort(key=lambda x: x['relevance_score'])
-            top_docs = retrieved_docs[:10]  # Use top 10 most relevant documents for focused response
-            
-            # Combine all content for comprehensive context
-            combined_context = "\n\n---DOCUMENT SEPARATOR---\n\n".join([
-                f"[Source: {doc['metadata'].get('file_name', 'Unknown')} - {doc['metadata'].get('document_type', 'Unknown')}]\n{doc['content']}"
-                for doc in top_docs
-            ])
-            
-            # Get conversation context
-            conversation_context = self.context_manager.get_context_summary()
-            is_follow_up = self.context_manager.is_follow_up_question(question)
-            
-            # Create engaging, story-like structured prompt with context awareness
-            comprehensive_prompt = f"""You are a knowledgeable legal storyteller who explains Indian law in an engaging, narrative style. 
-            You specialize in Constitution, Criminal Law (Bharatiya Nyaya Sanhita), and Income Tax Law.
-            Transform complex legal information into an interesting story that people can easily understand and remember.
+            retrieved_docs = self.multi_query_retrieval(question, session)
+        return self._answer_from_documents(question, retrieved_docs, conversation_context, is_follow_up)
+    
+    def _answer_from_documents(self, question: str, retrieved_docs: List[Dict], conversation_context: str,
+                               is_follow_up: bool) -> Optional[Dict]:
+        """Generate an answer from retrieved documents; returns None when there are none"""
+        metrics.increment("documents_retrieved", len(retrieved_docs))
+        
+        if not retrieved_docs:
+            return None
+        
+        top_docs = self._hydrate(self._select_top_docs(retrieved_docs))
+        prompt, top_docs = self._plan_generation(question, top_docs, conversation_context, is_follow_up)
+        if prompt is None:
+            return self._retrieval_only_result(top_docs)
+        
+        # Generate response using LLM
+        try:
+            with self.llm_limiter.slot():
+                response_text = self._stream_llm(prompt)
+        except AdmissionRejected as e:
+            response_text = self._rejected_generation(e)
+        return self._finish_answer(response_text, top_docs)
+    
+    async def _aanswer_from_documents(self, question: str, retrieved_docs: List[Dict], conversation_context: str,
+                                      is_follow_up: bool) -> Optional[Dict]:
+        """Async version of _answer_from_documents"""
+        metrics.increment("documents_retrieved", len(retrieved_docs))
+        
+        if not retrieved_docs:
+            return None
+        
+        top_docs = await asyncio.to_thread(self._hydrate, self._select_top_docs(retrieved_docs))
+        prompt, top_docs = self._plan_generation(question, top_docs, conversation_context, is_follow_up)
+        if prompt is None:
+            return self._retrieval_only_result(top_docs)
+        
+        try:
+            async with self.llm_limiter.aslot():
+                response_text = await self._astream_llm(prompt)
+        except AdmissionRejected as e:
+            response_text = self._rejected_generation(e)
+        return self._finish_answer(response_text, top_docs)
+    
+    def _plan_generation(self, question: str, top_docs: List[Dict], conversation_context: str,
+                         is_follow_up: bool) -> Tuple[Optional[str], List[Dict]]:
+        """The prompt for the time left (None: answer retrieval-only) and the documents it uses"""
+        mode = self._generation_mode()
+        if mode == "retrieval_only":
+            return None, top_docs
+        if mode == "compressed":
+            top_docs = self._compress_context(top_docs)
+        with metrics.stage("context_build"):
+            prompt = self._build_prompt(question, top_docs, conversation_context, is_follow_up)
+        self._record_prompt_size(prompt)
+        return prompt, top_docs
+    
+    def _rejected_generation(self, error: AdmissionRejected) -> str:
+        """An LLM slot was refused: propagate, unless the deadline leaves no time to retry anyway"""
+        if not self._deadline_exhausted():
+            raise error
+        return ""
+    
+    def _finish_answer(self, response_text: str, top_docs: List[Dict]) -> Dict:
+        response_text = self._clean_response(response_text)
+        if not response_text.strip() and self._deadline_exhausted():
+            return self._retrieval_only_result(top_docs)
+        return self._result(response_text, top_docs)
+    
+    def query_batch(self, questions: List[str], max_parallel: Optional[int] = None) -> Iterator[Dict]:
+        """Answer many context-free questions, sharing expansion, embedding and search work across them.
+
+        Query variations are de-duplicated across the batch, embedded in batched
+        calls and searched together before this returns (so admission rejections
+        surface to the caller up front). The returned iterator then generates
+        answers with at most max_parallel LLM calls in flight, at ingestion
+        priority, and yields {"index", "question", "answer", "sources"} (or
+        "error") in completion order. Batch answers are not saved to any session.
+        """
+        start = time.perf_counter()
+        
+        # Identical questions in the batch are answered once
+        unique_questions: Dict[str, str] = {}
+        for question in questions:
+            unique_questions.setdefault(normalize_question(question), question)
+        
+        with metrics.stage("query_expansion"):
+            variations = {key: self.generate_query_variations(question) for key, question in unique_questions.items()}
+        unique_variations = list(dict.fromkeys(v for vs in variations.values() for v in vs))
+        print(f"Batch of {len(questions)} questions: {len(unique_questions)} unique, "
+              f"{sum(len(vs) for vs in variations.values())} query variations, {len(unique_variations)} unique")
+        
+        with priority(INGESTION):
+            hits = self.vector_store.batch_similarity_search(unique_variations, k=8)
+        retrieved = {
+            key: self._merge_retrieval_results(variations[key], [hits.get(v, []) for v in variations[key]])
+            for key in unique_questions
+        }
+        metrics.observe_stage("batch_retrieval", time.perf_counter() - start)
+        
+        return self._generate_batch(questions, unique_questions, retrieved, max_parallel or Config.BATCH_MAX_PARALLEL)
+    
+    def _generate_batch(self, questions: List[str], unique_questions: Dict[str, str], retrieved: Dict[str, List[Dict]],
+                        max_parallel: int) -> Iterator[Dict]:
+        """Generate batch answers with bounded parallelism, yielding each as it finishes"""
+        indexes: Dict[str, List[int]] = {}
+        for index, question in enumerate(questions):
+            indexes.setdefault(normalize_question(question), []).append(index)
+        
+        def answer(key: str) -> Dict:
+            with priority(INGESTION):
+                result = self._answer_from_documents(unique_questions[key], retrieved[key], "", False)
+            return result or self._no_results_response()
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as pool:
+            # Each answer runs in a copy of this context, so it reads the index version the request pinned
+            futures = {pool.submit(contextvars.copy_context().run, answer, key): key for key in unique_questions}
+            try:
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        answered = future.result()
+                        result = {"answer": answered["answer"], "sources": answered["sources"]}
+                    except Exception as e:
+                        print(f"Error answering batch question: {str(e)}")
+                        result = {"error": str(e)}
+                    for index in indexes[key]:
+                        yield {"index": index, "question": questions[index], **result}
+            finally:
+                # A consumer that stops early (e.g. a disconnected client) does not pay for the rest
+                for future in futures:
+                    future.cancel()
+    
+    async def _agenerate_answer(self, question: str, conversation_context: str, is_follow_up: bool,
+                                session: Optional[ContextManager] = None) -> Optional[Dict]:
+        """Async version of _generate_answer"""
+        retrieved_docs = None
+        if is_follow_up and Config.FOLLOW_UP_REUSE and session is not None:
+            retrieved_docs = await self.afollow_up_retrieval(question, session)
+        if retrieved_docs is None:
+            retrieved_docs = await self.amulti_query_retrieval(question, session)
+        return await self._aanswer_from_documents(question, retrieved_docs, conversation_context, is_follow_up)
+    
+    def _stream_llm(self, prompt: str) -> str:
+        """Stream the LLM response, recording time to first token and total generation time.
+
+        Under a deadline the answer is cut off at the first chunk that arrives after it, or when
+        the wait for the next chunk runs past it.
+        """
+        current = current_deadline()
+        start = time.perf_counter()
+        parts = []
+        # Each chunk is awaited on the blocking pool: the Gemini stream is a blocking gRPC iterator.
+        # Under a deadline every wait (first token included) is bounded, so a stalled stream is abandoned
+        try:
+            for chunk in iterate_blocking(iter(self.llm.stream(prompt)),
+                                          timeout=current.remaining if current is not None else None):
+                if not parts:
+                    metrics.observe_stage("llm_first_token", time.perf_counter() - start)
+                parts.append(chunk.content)
+                if current is not None and current.expired():
+                    current.degrade("truncated_answer")
+                    break
+        except BlockingTimeout:
+            current.degrade("truncated_answer")
+        metrics.observe_stage("llm_total", time.perf_counter() - start)
+        return "".join(parts)
+    
+    async def _astream_llm(self, prompt: str) -> str:
+        """Async version of _stream_llm; under a deadline, waiting for the next chunk is also bounded"""
+        current = current_deadline()
+        start = time.perf_counter()
+        parts = []
+        stream = self.llm.astream(prompt).__aiter__()
+        try:
+            while True:
+                try:
+                    if current is None:
+                        chunk = await stream.__anext__()
+                    else:
+                        chunk = await asyncio.wait_for(stream.__anext__(), current.remaining())
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    current.degrade("truncated_answer")
+                    break
+                if not parts:
+                    metrics.observe_stage("llm_first_token", time.perf_counter() - start)
+                parts.append(chunk.content)
+        finally:
+            await stream.aclose()
+        metrics.observe_stage("llm_total", time.perf_counter() - start)
+        return "".join(parts)
+    
+    def _generation_mode(self) -> str:
+        """How much generation fits in the time left: full, compressed or retrieval_only"""
+        current = current_deadline()
+        if current is None:
+            return "full"
+        if current.remaining() < Config.DEADLINE_MIN_GENERATION:
+            current.degrade("retrieval_only")
+            return "retrieval_only"
+        if current.remaining() < Config.DEADLINE_GENERATION_RESERVE:
+            current.degrade("compressed_context")
+            return "compressed"
+        return "full"
+    
+    @staticmethod
+    def _deadline_exhausted() -> bool:
+        current = current_deadline()
+        return current is not None and current.remaining() < Config.DEADLINE_MIN_GENERATION
+    
+    def _compress_context(self, top_docs: List[Dict]) -> List[Dict]:
+        """Fewer, shorter chunks so the prompt is generated within the time left"""
+        return [dict(doc, content=doc['content'][:self.COMPRESSED_CHUNK_CHARS])
+                for doc in top_docs[:self.COMPRESSED_CONTEXT_DOCS]]
+    
+    def _result(self, answer: str, top_docs: List[Dict]) -> Dict:
+        current = current_deadline()
+        return {"answer": answer, "sources": self._format_sources(top_docs),
+                "retrieved_chunks": self._chunk_refs(top_docs),
+                "degradations": list(current.degradations) if current is not None else []}
+    
+    def _retrieval_only_result(self, top_docs: List[Dict]) -> Dict:
+        """Answer with the most relevant passages when there is no time left to generate"""
+        current = current_deadline()
+        if current is not None:
+            current.degrade("retrieval_only")
+        excerpts = []
+        for i, doc in enumerate(top_docs[:5], 1):
+            excerpt = doc['content'][:400].replace('\n', ' ').strip()
+            excerpts.append(f"**{i}. {doc['metadata'].get('file_name', 'Unknown')}** "
+                            f"(page {doc['metadata'].get('page_number', 'N/A')}): {excerpt}...")
+        answer = ("There was not enough time to write a full answer, so here are the most relevant "
+                  "passages found for your question:\n\n" + "\n\n".join(excerpts))
+        return self._result(answer, top_docs)
+    
+    def _record_prompt_size(self, prompt: str):
+        metrics.increment("prompt_characters", len(prompt))
+        # Roughly 4 characters per token for English legal text; avoids a count_tokens round trip
+        metrics.increment("prompt_tokens_estimated", len(prompt) // 4)
+    
+    def _can_coalesce(self, session: ContextManager) -> bool:
+        """Only context-free questions produce answers that can be shared across users"""
+        return Config.QUERY_COALESCING and not session.current_context
+    
+    @staticmethod
+    def _follower_wait() -> Optional[float]:
+        """How long a coalesced follower waits for the leader: long enough that, if the leader stalls,
+        the follower still has the generation reserve to answer on its own"""
+        current = current_deadline()
+        if current is None:
+            return None
+        return max(0.0, current.remaining() - Config.DEADLINE_GENERATION_RESERVE)
+    
+    @staticmethod
+    def _shareable(result: Optional[Dict]) -> bool:
+        # Degraded to meet the leader's deadline; a follower with time left answers in full itself
+        return result is None or not result.get("degradations")
+    
+    def _coalescing_key(self, question: str) -> str:
+        return f"context-free:{normalize_question(question)}"
+    
+    def _answer_cache_key(self, question: str) -> Tuple:
+        return (self.vector_store.generation, self._coalescing_key(question))
+    
+    def _cache_answer(self, question: str, result: Optional[Dict]):
+        # An answer degraded to meet one request's deadline is not reused for others
+        if result is not None and not result.get("degradations"):
+            self.answer_cache.put(self._answer_cache_key(question), result)
+    
+    def prewarm(self, questions: List[str], answers: Optional[bool] = None) -> int:
+        """Pre-compute query embeddings and retrieval results of context-free questions into the caches,
+        and their answers too when answers (default: PREWARM_ANSWERS); returns the number warmed"""
+        if answers is None:
+            answers = Config.PREWARM_ANSWERS
+        warmed = 0
+        # Pre-warming waits behind interactive queries for the Gemini limiters
+        with priority(INGESTION):
+            for question in questions:
+                # Each question is warmed against one index version, like a request
+                with self._index_pinned():
+                    if not answers:
+                        if self.retrieval_cache.contains(self._retrieval_cache_key(question, None)):
+                            continue
+                        try:
+                            warmed += bool(self.multi_query_retrieval(question))
+                        except AdmissionRejected:
+                            print("Pre-warming stopped: upstream limiter is saturated")
+                            break
+                        except Exception as e:
+                            print(f"Error pre-warming question '{question}': {str(e)}")
+                        continue
+                    if self.answer_cache.contains(self._answer_cache_key(question)):
+                        continue
+                    try:
+                        result = self.single_flight.do(
+                            self._coalescing_key(question),
+                            lambda: self._generate_answer(question, "", False)
+                        )
+                        self._cache_answer(question, result)
+                        warmed += result is not None
+                    except AdmissionRejected:
+                        print("Pre-warming stopped: upstream limiter is saturated")
+                        break
+                    except Exception as e:
+                        print(f"Error pre-warming question '{question}': {str(e)}")
+        return warmed
+    
+    def _index_pinned(self):
+        """Read one index version for the enclosed block (index snapshots); a no-op for other stores"""
+        pinned = getattr(self.vector_store, "pinned", None)
+        return pinned() if pinned is not None else contextlib.nullcontext()
+    
+    def get_query_cache_stats(self) -> Dict:
+        """Get query embedding, retrieval and answer cache counters"""
+        return {
+            "query_embedding": self.vector_store.embeddings.query_cache.get_stats(),
+            "retrieval": self.retrieval_cache.get_stats(),
+            "answer": self.answer_cache.get_stats()
+        }
+    
+    def get_coalescing_stats(self) -> Dict:
+        """Get request coalescing counters"""
+        return self.single_flight.get_stats()
+    
+    def _no_results_response(self) -> dict:
+        return {
+            "answer": "I apologize, but I couldn't find relevant information for your question in the available documents.",
+            "sources": []
+        }
+    
+    def _error_response(self, error: Exception) -> dict:
+        return {
+            "answer": f"I apologize, but I encountered an error while processing your question: {str(error)}",
+            "sources": []
+        }
+    
+    def _chunk_refs(self, top_docs: List[Dict]) -> List[Dict]:
+        """Chunk ids and query similarities of the documents an answer was built from"""
+        return [
+            {"chunk_id": doc['metadata']['chunk_id'], "score": round(doc['metadata'].get('similarity', 0.0), 4)}
+            for doc in top_docs if doc['metadata'].get('chunk_id')
+        ]
+    
+    def _select_top_docs(self, retrieved_docs: List[Dict]) -> List[Dict]:
+        """Sort documents by relevance and limit to top results"""
+        retrieved_docs.sort(key=lambda x: x['relevance_score'])
+        if any(doc['metadata'].get('parent_id') for doc in retrieved_docs):
+            return self._select_parents(retrieved_docs)
+        return retrieved_docs[:10]  # Use top 10 most relevant documents for focused response
+    
+    def _select_parents(self, retrieved_docs: List[Dict]) -> List[Dict]:
+        """Child hits grouped by parent: the PARENT_CHUNKS_IN_PROMPT parents with the best child hit
+        (more matching children first among equals), each standing for its parent text in the prompt"""
+        best, matches = {}, {}
+        for position, doc in enumerate(retrieved_docs):
+            parent_key = doc['metadata'].get('parent_id') or doc['metadata'].get('chunk_id') or position
+            matches[parent_key] = matches.get(parent_key, 0) + 1
+            best.setdefault(parent_key, doc)
+        ranked = sorted(best, key=lambda key: (best[key]['relevance_score'], -matches[key]))
+        # The best child keeps its chunk_id (follow-ups reuse it); emptied content is hydrated from the parent
+        return [dict(best[key], content="" if best[key]['metadata'].get('parent_id') else best[key]['content'])
+                for key in ranked[:Config.PARENT_CHUNKS_IN_PROMPT]]
+    
+    @staticmethod
+    def _text_id(doc: Dict) -> Optional[str]:
+        """Id of the text that goes into the prompt: the parent's for a child hit, else the chunk's own"""
+        return doc['metadata'].get('parent_id') or doc['metadata'].get('chunk_id')
+    
+    def _hydrate(self, top_docs: List[Dict]) -> List[Dict]:
+        """Load chunk text for the documents going into the prompt; search hits carry only ids"""
+        missing = [self._text_id(doc) for doc in top_docs if not doc['content'] and self._text_id(doc)]
+        if missing:
+            texts = self.vector_store.get_texts(list(dict.fromkeys(missing)))
+            for doc in top_docs:
+                if not doc['content']:
+                    doc['content'] = texts.get(self._text_id(doc), "")
+        return top_docs
+    
+    def _build_prompt(self, question: str, top_docs: List[Dict], conversation_context: str, is_follow_up: bool) -> str:
+        """Build the story-style prompt from retrieved documents and conversation context"""
+        # Combine all content for comprehensive context
+        combined_context = "\n\n---DOCUMENT SEPARATOR---\n\n".join([
+            f"[Source: {doc['metadata'].get('file_name', 'Unknown')} - {doc['metadata'].get('document_type', 'Unknown')}]\n{doc['content']}"
+            for doc in top_docs
+        ])
+        
+        # Create engaging, story-like structured prompt with context awareness
+        return f"""You are a knowledgeable legal storyteller who explains Indian law in an engaging, narrative style. 
+        You specialize in Constitution, Criminal Law (Bharatiya Nyaya Sanhita), and Income Tax Law.
+        Transform complex legal information into an interesting story that people can easily understand and remember.
 
-            {conversation_context}
+        {conversation_context}
 
-            Current Context: {combined_context}
+        Current Context: {combined_context}
 
-            Question: {question}
-            
-            {"[NOTE: This appears to be a follow-up question to our previous conversation. Please reference relevant previous topics when appropriate.]" if is_follow_up else ""}
+        Question: {question}
+        
+        {"[NOTE: This appears to be a follow-up question to our previous conversation. Please reference relevant previous topics when appropriate.]" if is_follow_up else ""}
 
-            RESPONSE FORMAT (tell it like a story using this structure):
+        RESPONSE FORMAT (tell it like a story using this structure):
 
-            **{question}**
+        **{question}**
 
-            **🎯 The Story Begins:**
-            [Start with an engaging 2-3 sentence narrative that sets the context. For tax queries: "In the world of Indian taxation, this provision tells an interesting story..." For criminal law: "In the landscape of criminal justice..." For constitutional law: "When our Constitution makers envisioned..."]
+        **🎯 The Story Begins:**
+        [Start with an engaging 2-3 sentence narrative that sets the context. For tax queries: "In the world of Indian taxation, this provision tells an interesting story..." For criminal law: "In the landscape of criminal justice..." For constitutional law: "When our Constitution makers envisioned..."]
 
-            **⚖️ The Legal Framework:**
-            • **Section/Article [Number]:** [Tell what this law does in story form - "This provision acts as a guardian that..." or "This section serves as a bridge between..."]
-            • **Section/Article [Number]:** [Continue the narrative style]
+        **⚖️ The Legal Framework:**
+        • **Section/Article [Number]:** [Tell what this law does in story form - "This provision acts as a guardian that..." or "This section serves as a bridge between..."]
+        • **Section/Article [Number]:** [Continue the narrative style]
 
-            **📖 How It Works in Real Life:**
-            [Explain the law like you're telling someone a story about how it actually works in practice. 
-            For tax: "Here's what happens during tax season...", "When you file your returns..."
-            For criminal law: "When someone commits this offense...", "The legal process unfolds like this..."
-            For constitutional law: "In everyday life, this right protects you by..."]
+        **📖 How It Works in Real Life:**
+        [Explain the law like you're telling someone a story about how it actually works in practice. 
+        For tax: "Here's what happens during tax season...", "When you file your returns..."
+        For criminal law: "When someone commits this offense...", "The legal process unfolds like this..."
+        For constitutional law: "In everyday life, this right protects you by..."]
 
-            **⚠️ The Consequences:**
-            [Tell the story of consequences:
-            For tax: "Those who don't comply face a journey through tax penalties...", "The tax department responds with..."
-            For criminal law: "Those who break this law face...", "The justice system responds with..."
-            For constitutional law: "When this right is violated, the remedy is..."]
-            • [Specific consequences told as a story]
-            • [Amounts/penalties presented as "the price they pay"]
+        **⚠️ The Consequences:**
+        [Tell the story of consequences:
+        For tax: "Those who don't comply face a journey through tax penalties...", "The tax department responds with..."
+        For criminal law: "Those who break this law face...", "The justice system responds with..."
+        For constitutional law: "When this right is violated, the remedy is..."]
+        • [Specific consequences told as a story]
+        • [Amounts/penalties presented as "the price they pay"]
 
-            **💡 The Bigger Picture:**
-            • [Key insight: "What makes this law special is..." or "The genius of this provision lies in..."]
-            • [Important takeaway: "The real impact on society is..." or "For taxpayers/citizens, this means..."]
-            • [Practical wisdom: "The smart approach is..." or "To stay compliant/protected..."]
+        **💡 The Bigger Picture:**
+        • [Key insight: "What makes this law special is..." or "The genius of this provision lies in..."]
+        • [Important takeaway: "The real impact on society is..." or "For taxpayers/citizens, this means..."]
+        • [Practical wisdom: "The smart approach is..." or "To stay compliant/protected..."]
 
-            STORYTELLING RULES:
-            - Write like you're explaining to a friend over coffee
-            - Use engaging transitions between sections
-            - Include specific legal references but explain them simply
-            - Make it memorable with vivid descriptions
-            - For tax queries, focus on practical compliance and benefits
-            - For criminal law, focus on justice and protection
-            - For constitutional law, focus on rights and freedoms
-            - If this is a follow-up question, reference previous topics naturally
-            - Build on previous conversation when relevant
-            - Keep the narrative flowing naturally
-            - Maximum 350 words to allow for storytelling
-            - Use phrases like "Here's the interesting part...", "What's fascinating is...", "The law works like this..."
-            - For follow-ups, use phrases like "Building on what we discussed...", "Related to our previous topic...", "This connects to..."
-            """
-            
-            # Generate response using LLM
-            response_text = self.llm.invoke(comprehensive_prompt).content
-            
-            # Clean up any potential HTML tags from the response
-            import re
-            response_text = re.sub(r'<[^>]+>', '', response_text)  # Remove any HTML tags
-            
-            # Format only the most relevant sources (top 3-5)
-            sources = []
-            unique_files = set()
+        STORYTELLING RULES:
+        - Write like you're explaining to a friend over coffee
+        - Use engaging transitions between sections
+        - Include specific legal references but explain them simply
+        - Make it memorable with vivid descriptions
+        - For tax queries, focus on practical compliance and benefits
+        - For criminal law, focus on justice and protection
+        - For constitutional law, focus on rights and freedoms
+        - If this is a follow-up question, reference previous topics naturally
+        - Build on previous conversation when relevant
+        - Keep the narrative flowing naturally
+        - Maximum 350 words to allow for storytelling
+        - Use phrases like "Here's the interesting part...", "What's fascinating is...", "The law works like this..."
+        - For follow-ups, use phrases like "Building on what we discussed...", "Related to our previous topic...", "This connects to..."
+        """
+    
+    def _clean_response(self, response_text: str) -> str:
+        """Clean up any potential HTML tags from the response"""
+        return re.sub(r'<[^>]+>', '', response_text)
+    
+    def _format_sources(self, top_docs: List[Dict]) -> List[Dict]:
+        """Format only the most relevant sources (top 3-5)"""
+        sources = []
+        unique_files = set()
+        
+        for doc in top_docs[:5]:  # Limit to top 5 sources
+            file_name = doc['metadata'].get('file_name', 'Unknown')
+            doc_type = doc['metadata'].get('document_type', 'Unknown')
             
-            for doc in top_docs[:5]:  # Limit to top 5 sources
-                file_name = doc['metadata'].get('file_name', 'Unknown')
-                doc_type = doc['metadata'].get('document_type', 'Unknown')
+            # Avoid duplicate files in sources
+            if file_name not in unique_files:
+                unique_files.add(file_name)
                 
-                # Avoid duplicate files in sources
-                if file_name not in unique_files:
-                    unique_files.add(file_name)
-                    
-                    # Extract key information from content
-                    content_preview = doc['content'][:150].replace('\n', ' ').strip()
-                    if len(doc['content']) > 150:
-                        content_preview += "..."
-                    
-                    source_info = {
-                        "content": content_preview,
-                        "metadata": {
-                            "file_name": file_name,
-                            "document_type": doc_type.replace('_', ' ').title(),
-                            "page_number": doc['metadata'].get('page_number', 'N/A')
-                        }
+                # Extract key information from content
+                content_preview = doc['content'][:150].replace('\n', ' ').strip()
+                if len(doc['content']) > 150:
+                    content_preview += "..."
+                
+                source_info = {
+                    "content": content_preview,
+                    "metadata": {
+                        "file_name": file_name,
+                        "document_type": doc_type.replace('_', ' ').title(),
+                        "page_number": doc['metadata'].get('page_number', 'N/A')
                     }
-                    sources.append(source_info)
-            
-            # Save this exchange to context history
-            self.context_manager.add_exchange(question, response_text, sources)
-            
-            return {
-                "answer": response_text,
-                "sources": sources,
-                "session_id": self.context_manager.current_session_id,
-                "is_follow_up": is_follow_up
-            }
-            
-        except Exception as e:
-            print(f"Error in comprehensive query processing: {str(e)}")
-            return {
-                "answer": f"I apologize, but I encountered an error while processing your question: {str(e)}",
-                "sources": []
-            }
+                }
+                sources.append(source_info)
+        
+        return sources
     
     def start_new_conversation(self) -> str:
         """Start a new conversation session"""
-        return self.context_manager.start_new_session()
+        return self.sessions.create().current_session_id
     
     def load_conversation(self, session_id: str) -> bool:
-        """Load an existing conversation session"""
-        return self.context_manager.load_session(session_id)
+        """Load an existing conversation session into the session cache"""
+        return self.sessions.get(session_id) is not None
+    
+    async def aload_conversation(self, session_id: str) -> bool:
+        """Async version of load_conversation"""
+        return await asyncio.to_thread(self.load_conversation, session_id)
+    
+    def get_conversation_history(self, session_id: str) -> Optional[List[Dict]]:
+        """Get a session's recent conversation history, or None if it does not exist"""
+        return self.sessions.get_history(session_id)
     
-    def get_conversation_history(self) -> List[Dict]:
-        """Get current conversation history"""
-        return self.context_manager.current_context
+    def get_recent_sessions(self, limit: int = 10, offset: int = 0) -> List[Dict]:
+        """Get a page of recent conversation sessions"""
+        return self.sessions.get_recent_sessions(limit, offset)
     
-    def get_recent_sessions(self, limit: int = 10) -> List[Dict]:
-        """Get list of recent conversation sessions"""
-        return self.context_manager.get_recent_sessions(limit)
+    def get_session_cache_stats(self) -> Dict:
+        """Get session cache counters"""
+        return self.sessions.get_stats()
     
     def clear_old_conversations(self, days_old: int = 30):
         """Clear old conversation sessions"""
-        self.context_manager.clear_old_sessions(days_old)
\ No newline at end of file
+        self.sessions.clear_old_sessions(days_old)
\ No newline at end of file
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from backend import metrics
+from backend.config import Config
+from backend.context_manager import ContextManager
+from backend.session_store import get_session_store
+
+
+class SessionCache:
+    """Bounded LRU of loaded conversation sessions, one ContextManager per session.
+
+    Each request works on its own session object, so concurrent requests
+    never share conversation state. Sessions stay in memory between
+    requests and are written through to the session store on every
+    exchange; an evicted session is simply reloaded from the store. The
+    cache is per worker process, and a session may be continued in any
+    gunicorn worker. Hits are served from memory without touching the store;
+    at most every SESSION_CACHE_REVALIDATE seconds a hit is checked against
+    the timestamp of the store's newest exchange of the session (a primary-key
+    lookup with SQLite) and reloaded if another worker has added to it, so a
+    cached session is at most that many seconds behind.
+    """
+
+    def __init__(self, context_dir: str = "context_history", capacity: int = None):
+        self.context_dir = context_dir
+        self.capacity = capacity or Config.SESSION_CACHE_SIZE
+        os.makedirs(context_dir, exist_ok=True)
+        self.store = get_session_store(context_dir)
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, ContextManager]" = OrderedDict()
+        # When each cached session was last confirmed against the store (monotonic seconds)
+        self._checked: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _new_session(self) -> ContextManager:
+        return ContextManager(self.context_dir, store=self.store)
+
+    def _is_current(self, session: ContextManager) -> bool:
+        """Whether no other worker has added to the session since it was cached"""
+        cached = max((exchange["timestamp"] for exchange in session.current_context), default=None)
+        try:
+            return self.store.latest_timestamp(session.current_session_id) == cached
+        except Exception as e:
+            print(f"Error checking cached session {session.current_session_id}: {str(e)}")
+            return False
+
+    def _cached(self, session_id: str) -> Optional[ContextManager]:
+        """The cached session if it is still current; a stale one is dropped so the caller reloads it"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                due = time.monotonic() - self._checked.get(session_id, 0.0) >= Config.SESSION_CACHE_REVALIDATE
+        if session is None:
+            return None
+        if due:
+            if not self._is_current(session):
+                with self._lock:
+                    if self._sessions.get(session_id) is session:
+                        del self._sessions[session_id]
+                        self._checked.pop(session_id, None)
+                    self.stale += 1
+                metrics.increment("session_cache_stale")
+                return None
+            with self._lock:
+                self._checked[session_id] = time.monotonic()
+        with self._lock:
+            self.hits += 1
+        metrics.increment("session_cache_hit")
+        return session
+
+    def _insert(self, session: ContextManager) -> ContextManager:
+        """Cache session unless a concurrent request already cached the same id"""
+        with self._lock:
+            existing = self._sessions.get(session.current_session_id)
+            if existing is not None:
+                self._sessions.move_to_end(session.current_session_id)
+                return existing
+            self._sessions[session.current_session_id] = session
+            # Just loaded or created, so current as of now
+            self._checked[session.current_session_id] = time.monotonic()
+            while len(self._sessions) > self.capacity:
+                evicted, _ = self._sessions.popitem(last=False)
+                self._checked.pop(evicted, None)
+        return session
+
+    def get(self, session_id: str) -> Optional[ContextManager]:
+        """Return the session, loading it from the store on a cache miss; None if it does not exist"""
+        session = self._cached(session_id)
+        if session is not None:
+            return session
+
+        with self._lock:
+            self.misses += 1
+        metrics.increment("session_cache_miss")
+        session = self._new_session()
+        if not session.load_session(session_id):
+            return None
+        return self._insert(session)
+
+    def create(self, session_id: str = None) -> ContextManager:
+        """Start a new, empty session and cache it"""
+        session = self._new_session()
+        session.start_new_session(session_id)
+        return self._insert(session)
+
+    def get_or_create(self, session_id: str = None) -> ContextManager:
+        """Session for a request: the named one if known, otherwise a new one (keeping the given id)"""
+        if not session_id:
+            return self.create()
+        return self.get(session_id) or self.create(session_id)
+
+    async def aget_or_create(self, session_id: str = None) -> ContextManager:
+        """Async version of get_or_create; store reads (loads and hit revalidation) run in a worker thread"""
+        return await asyncio.to_thread(self.get_or_create, session_id)
+
+    def get_history(self, session_id: str) -> Optional[List[Dict]]:
+        """Recent exchanges of a session, or None if it does not exist"""
+        session = self.get(session_id)
+        return list(session.current_context) if session is not None else None
+
+    def get_recent_sessions(self, limit: int = 10, offset: int = 0) -> List[Dict]:
+        return self._new_session().get_recent_sessions(limit, offset)
+
+    def clear_old_sessions(self, days_old: int = 30):
+        self._new_session().clear_old_sessions(days_old)
+        # Expired sessions must not live on in the cache
+        with self._lock:
+            self._sessions.clear()
+            self._checked.clear()
+
+    def close(self):
+        """Persist anything still queued and release the session store"""
+        self.store.close()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cached_sessions": len(self._sessions),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
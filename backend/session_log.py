@@ -0,0 +1,416 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from backend import metrics
+from backend.config import Config
+from backend.session_store import _session_summary
+
+
+class _Segment:
+    """An append-only JSONL file of exchanges, exclusively locked by the process writing it"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        # Created and locked under a name recover() skips, so no other worker can take it for abandoned
+        # before the lock is held; the lock stays with the file across the rename
+        temp_path = os.path.join(os.path.dirname(path), f".{self.name}.tmp")
+        self.file = open(temp_path, 'a', encoding='utf-8')
+        try:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.rename(temp_path, path)
+        except Exception:
+            self.file.close()
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self.last_seq = 0
+
+    def size(self) -> int:
+        return self.file.tell()
+
+    def close(self):
+        try:
+            self.file.close()
+        except Exception:
+            pass
+
+
+def _read_segment(path: str) -> List[Dict]:
+    """Read a segment's records, ignoring a torn last line from a crash mid-write"""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+class WriteBehindSessionStore:
+    """Session store that takes exchanges off the request path.
+
+    append_exchange only queues the exchange in memory. A background flusher
+    appends queued exchanges in batches to this process's JSONL log segment
+    (fsync per SESSION_LOG_FSYNC), and periodically rolls the segment and
+    compacts it into the base store (SQLite or JSON) in one batch. Reads of a
+    session overlay exchanges that have not been compacted yet: this
+    process's queue, and the segments other live workers have flushed (read
+    incrementally), so a follow-up routed to another worker sees every
+    flushed exchange without waiting for compaction. On startup,
+    segments left behind by processes that died before compacting are
+    replayed into the base store; segments are flock'ed by their writer, so
+    other live gunicorn workers' segments are never touched.
+    """
+
+    def __init__(self, base, log_dir: str):
+        self.base = base
+        self.log_dir = log_dir
+        self.flush_interval = Config.SESSION_FLUSH_INTERVAL
+        self.flush_batch = Config.SESSION_FLUSH_BATCH
+        self.fsync_policy = Config.SESSION_LOG_FSYNC
+        self.compact_interval = Config.SESSION_COMPACT_INTERVAL
+        self.segment_max_bytes = Config.SESSION_SEGMENT_MAX_BYTES
+        os.makedirs(log_dir, exist_ok=True)
+
+        self._lock = threading.Lock()      # queue and overlay
+        self._io_lock = threading.Lock()   # segment writes and compaction
+        self._wakeup = threading.Event()
+        self._seq = 0
+        self._queue: List[Dict] = []
+        self._pending: Dict[str, List[Dict]] = {}
+        # Sessions replaced by save(): their exchanges up to this seq are not compacted
+        self._superseded: Dict[str, int] = {}
+        self._segment_counter = 0
+        self._segment: Optional[_Segment] = None
+        self._closed_segments: List[_Segment] = []
+        # Other processes' uncompacted segments: name -> (bytes read, exchanges by session)
+        self._tail_lock = threading.Lock()
+        self._tails: Dict[str, Tuple[int, Dict[str, List[Dict]]]] = {}
+        self._last_compaction = time.monotonic()
+        self._last_fsync = time.monotonic()
+        self._stopped = False
+
+        self.recover()
+        self._start_flusher()
+        atexit.register(self.close)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start_flusher(self):
+        self._thread = threading.Thread(target=self._run, name="session-log-flusher", daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        """A forked child (e.g. gunicorn --preload) starts its own log and base store connection;
+        the parent keeps persisting its own queue"""
+        self.base.reopen()
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._queue = []
+        self._pending = {}
+        self._superseded = {}
+        # The parent's segments are another process's now
+        self._tail_lock = threading.Lock()
+        self._tails = {}
+        for segment in [self._segment] + self._closed_segments:
+            if segment is not None:
+                segment.close()
+        self._segment = None
+        self._closed_segments = []
+        self._start_flusher()
+
+    # Request path
+
+    def append_exchange(self, session_id: str, exchange: Dict, exchanges: List[Dict] = None):
+        """Queue one exchange; persisted by the background flusher"""
+        with self._lock:
+            self._seq += 1
+            record = {"seq": self._seq, "session_id": session_id, "exchange": exchange}
+            self._queue.append(record)
+            self._pending.setdefault(session_id, []).append(record)
+            queued = len(self._queue)
+        if queued >= self.flush_batch:
+            self._wakeup.set()
+
+    def load(self, session_id: str, limit: int = None) -> Optional[List[Dict]]:
+        # Overlay first: a segment compacted after it is read is in the base store by the time that is read
+        pending = self._unapplied(session_id).get(session_id, [])
+        exchanges = self.base.load(session_id, limit)
+        if exchanges is None and not pending:
+            return None
+        # An exchange compacted between the two reads shows up in both
+        stored = {(exchange["timestamp"], exchange["user_question"]) for exchange in exchanges or []}
+        exchanges = (exchanges or []) + [exchange for exchange in pending
+                                         if (exchange["timestamp"], exchange["user_question"]) not in stored]
+        exchanges.sort(key=lambda exchange: exchange["timestamp"])
+        return exchanges[-limit:] if limit else exchanges
+    
+    def latest_timestamp(self, session_id: str) -> Optional[str]:
+        """Newest exchange's timestamp in the overlay or the base store (reads other workers' new log bytes)"""
+        pending = self._unapplied(session_id).get(session_id)
+        latest = self.base.latest_timestamp(session_id)
+        if pending and (latest is None or pending[-1]["timestamp"] > latest):
+            latest = pending[-1]["timestamp"]
+        return latest
+    
+    def _own_segment(self, name: str) -> bool:
+        return name.startswith(f"segment-{os.getpid()}-")
+    
+    def _read_other_segments(self) -> List[Dict[str, List[Dict]]]:
+        """Exchanges by session in the segments other processes have flushed but not compacted.
+        
+        Only bytes appended since the last call are read, and only up to the
+        last complete line, so a segment being written is never misread.
+        """
+        try:
+            names = sorted(name for name in os.listdir(self.log_dir)
+                           if name.startswith("segment-") and name.endswith(".jsonl") and not self._own_segment(name))
+        except FileNotFoundError:
+            names = []
+        with self._tail_lock:
+            for name in list(self._tails):
+                if name not in names:
+                    # Compacted (and so in the base store) or replayed
+                    del self._tails[name]
+            for name in names:
+                offset, by_session = self._tails.get(name, (0, {}))
+                try:
+                    with open(os.path.join(self.log_dir, name), 'rb') as f:
+                        f.seek(offset)
+                        data = f.read()
+                except FileNotFoundError:
+                    self._tails.pop(name, None)
+                    continue
+                complete = data.rfind(b"\n") + 1
+                for line in data[:complete].splitlines():
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    by_session.setdefault(record["session_id"], []).append(record["exchange"])
+                self._tails[name] = (offset + complete, by_session)
+            return [by_session for _, by_session in self._tails.values()]
+    
+    def _unapplied(self, session_id: str = None) -> Dict[str, List[Dict]]:
+        """Exchanges not in the base store yet, by session and in time order (one session's, if given)"""
+        unapplied: Dict[str, List[Dict]] = {}
+        for by_session in self._read_other_segments():
+            for key, exchanges in by_session.items():
+                if session_id is None or key == session_id:
+                    unapplied.setdefault(key, []).extend(exchanges)
+        with self._lock:
+            for key, records in self._pending.items():
+                if session_id is None or key == session_id:
+                    unapplied.setdefault(key, []).extend(record["exchange"] for record in records)
+        for exchanges in unapplied.values():
+            exchanges.sort(key=lambda exchange: exchange["timestamp"])
+        return unapplied
+
+    # Whole-store views: the base store plus the uncompacted overlay, leaving compaction to the flusher
+
+    def save(self, session_id: str, exchanges: List[Dict]):
+        """Replace the session; this process's uncompacted exchanges of it are superseded, not appended later"""
+        with self._lock:
+            self._superseded[session_id] = self._seq
+            self._pending.pop(session_id, None)
+        self.base.save(session_id, exchanges)
+
+    def list_recent(self, limit: int = 10, offset: int = 0) -> List[Dict]:
+        unapplied = self._unapplied()
+        if not unapplied:
+            return self.base.list_recent(limit, offset)
+        # Uncompacted exchanges only move sessions up, so the base store's first offset + limit suffice
+        sessions = {summary["session_id"]: summary for summary in self.base.list_recent(limit + offset, 0)}
+        sessions.update(self.base.summaries(list(unapplied)))
+        for session_id, exchanges in unapplied.items():
+            summary = sessions.get(session_id)
+            if summary is None:
+                sessions[session_id] = _session_summary(
+                    session_id, exchanges[0]["timestamp"], exchanges[-1]["timestamp"], len(exchanges),
+                    exchanges[0]["user_question"]
+                )
+                continue
+            newer = [exchange for exchange in exchanges if exchange["timestamp"] > summary["last_updated"]]
+            if newer:
+                sessions[session_id] = dict(summary, last_updated=newer[-1]["timestamp"],
+                                            total_exchanges=summary["total_exchanges"] + len(newer))
+        ordered = sorted(sessions.values(), key=lambda summary: summary["last_updated"], reverse=True)
+        return ordered[offset:offset + limit]
+
+    def delete_older_than(self, cutoff: datetime) -> int:
+        # A session with uncompacted exchanges has just been used, whatever its stored last_updated says
+        return self.base.delete_older_than(cutoff, keep=list(self._unapplied()))
+
+    def recent_questions(self, since: datetime) -> List[Tuple[str, str]]:
+        since_text = since.isoformat()
+        unapplied = [(exchange["timestamp"], exchange["user_question"])
+                     for exchanges in self._unapplied().values() for exchange in exchanges
+                     if exchange["timestamp"] >= since_text]
+        questions = self.base.recent_questions(since)
+        stored = set(questions)
+        return questions + [question for question in unapplied if question not in stored]
+
+    # Background flushing and compaction
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if (time.monotonic() - self._last_compaction >= self.compact_interval
+                        or (self._segment is not None and self._segment.size() >= self.segment_max_bytes)):
+                    self.compact()
+            except Exception as e:
+                print(f"Error persisting session log: {str(e)}")
+
+    def _new_segment(self) -> _Segment:
+        self._segment_counter += 1
+        name = f"segment-{os.getpid()}-{int(time.time() * 1000)}-{self._segment_counter}.jsonl"
+        return _Segment(os.path.join(self.log_dir, name))
+
+    def flush(self):
+        """Append queued exchanges to the current log segment"""
+        with self._io_lock:
+            with self._lock:
+                batch, self._queue = self._queue, []
+            if not batch:
+                return
+            with metrics.stage("session_log_flush"):
+                try:
+                    if self._segment is None:
+                        self._segment = self._new_segment()
+                    written = self._segment.size()
+                    try:
+                        self._segment.file.write(
+                            "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+                        self._segment.file.flush()
+                    except Exception:
+                        # Cut a partial write off so the retried batch is not logged twice
+                        self._segment.file.truncate(written)
+                        raise
+                except Exception:
+                    # Queued again ahead of newer exchanges; the next flush retries
+                    with self._lock:
+                        self._queue = batch + self._queue
+                    raise
+                self._segment.last_seq = batch[-1]["seq"]
+                now = time.monotonic()
+                if self.fsync_policy == "batch" or (
+                        self.fsync_policy == "interval" and now - self._last_fsync >= self.flush_interval * 10):
+                    os.fsync(self._segment.file.fileno())
+                    self._last_fsync = now
+            metrics.increment("session_log_records", len(batch))
+
+    def compact(self):
+        """Roll the current segment and apply all closed segments to the base store"""
+        with self._io_lock:
+            self._last_compaction = time.monotonic()
+            if self._segment is not None:
+                if self.fsync_policy != "off":
+                    os.fsync(self._segment.file.fileno())
+                self._closed_segments.append(self._segment)
+                self._segment = None
+            if not self._closed_segments:
+                return
+
+            with metrics.stage("session_log_compaction"):
+                while self._closed_segments:
+                    segment = self._closed_segments[0]
+                    self.base.apply_log(segment.name, self._live_records(_read_segment(segment.path)))
+                    os.remove(segment.path)
+                    segment.close()
+                    self._closed_segments.pop(0)
+                    self._release_pending(segment.last_seq)
+
+    def _live_records(self, records: List[Dict]) -> List[Dict]:
+        with self._lock:
+            return [record for record in records
+                    if record["seq"] > self._superseded.get(record["session_id"], 0)]
+
+    def _release_pending(self, applied_seq: int):
+        """Drop overlay entries that are now visible through the base store"""
+        with self._lock:
+            for session_id in [key for key, seq in self._superseded.items() if seq <= applied_seq]:
+                del self._superseded[session_id]
+            for session_id in list(self._pending):
+                remaining = [record for record in self._pending[session_id] if record["seq"] > applied_seq]
+                if remaining:
+                    self._pending[session_id] = remaining
+                else:
+                    del self._pending[session_id]
+
+    def drain(self):
+        """Persist everything queued so far into the base store"""
+        self.flush()
+        self.compact()
+
+    def recover(self):
+        """Replay segments left behind by processes that exited without compacting"""
+        replayed = 0
+        for name in sorted(os.listdir(self.log_dir)):
+            if name.startswith(".segment-") and name.endswith(".jsonl.tmp"):
+                self._remove_abandoned_temp(os.path.join(self.log_dir, name))
+                continue
+            if not (name.startswith("segment-") and name.endswith(".jsonl")):
+                continue
+            path = os.path.join(self.log_dir, name)
+            try:
+                f = open(path, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            try:
+                # A live writer holds its segment's lock
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            try:
+                if os.path.exists(path):
+                    self.base.apply_log(name, _read_segment(path))
+                    os.remove(path)
+                    replayed += 1
+            except Exception as e:
+                print(f"Error replaying session log {name}: {str(e)}")
+            finally:
+                f.close()
+        if replayed:
+            print(f"Recovered {replayed} session log segments")
+
+    @staticmethod
+    def _remove_abandoned_temp(path: str):
+        """Remove a segment a process died creating; nothing is written before it is renamed"""
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.remove(path)
+        except OSError:
+            pass  # still being created
+        finally:
+            f.close()
+
+    def close(self):
+        """Stop the flusher and compact everything still queued"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout=self.flush_interval * 2)
+        try:
+            self.drain()
+        except Exception as e:
+            print(f"Error persisting session log: {str(e)}")
+        self.base.close()
@@ -0,0 +1,401 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from backend.blocking import run_blocking
+from backend.config import Config
+
+
+def _session_summary(session_id: str, created_at: str, last_updated: str, total_exchanges: int, preview: str) -> Dict:
+    return {
+        "session_id": session_id,
+        "created_at": created_at,
+        "last_updated": last_updated,
+        "total_exchanges": total_exchanges,
+        "preview": preview[:100] if preview else "Empty session"
+    }
+
+
+class JSONSessionStore:
+    """One session_<id>.json file per session, rewritten on every exchange"""
+
+    def __init__(self, context_dir: str):
+        self.context_dir = context_dir
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.context_dir, f"session_{session_id}.json")
+
+    def save(self, session_id: str, exchanges: List[Dict]):
+        """Write the whole session document"""
+        session_data = {
+            "session_id": session_id,
+            "created_at": exchanges[0]["timestamp"] if exchanges else datetime.now().isoformat(),
+            "last_updated": datetime.now().isoformat(),
+            "total_exchanges": len(exchanges),
+            "exchanges": exchanges
+        }
+        with open(self._path(session_id), 'w', encoding='utf-8') as f:
+            json.dump(session_data, f, indent=2, ensure_ascii=False)
+
+    def append_exchange(self, session_id: str, exchange: Dict, exchanges: List[Dict]):
+        """Record a new exchange; the JSON format can only rewrite the whole document"""
+        self.save(session_id, exchanges)
+
+    def apply_log(self, segment_name: str, records: List[Dict]):
+        """Append logged exchanges; exchanges already in a session document are skipped on replay"""
+        by_session: Dict[str, List[Dict]] = {}
+        for record in records:
+            by_session.setdefault(record["session_id"], []).append(record["exchange"])
+        for session_id, new_exchanges in by_session.items():
+            exchanges = self.load(session_id) or []
+            seen = {(exchange["timestamp"], exchange["user_question"]) for exchange in exchanges}
+            exchanges.extend(exchange for exchange in new_exchanges
+                             if (exchange["timestamp"], exchange["user_question"]) not in seen)
+            self.save(session_id, exchanges)
+
+    def load(self, session_id: str, limit: int = None) -> Optional[List[Dict]]:
+        file_path = self._path(session_id)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            exchanges = json.load(f)["exchanges"]
+        return exchanges[-limit:] if limit else exchanges
+
+    def latest_timestamp(self, session_id: str) -> Optional[str]:
+        """Timestamp of the session's newest exchange, or None; reads the whole session file"""
+        exchanges = self.load(session_id)
+        if not exchanges:
+            return None
+        return max(exchange["timestamp"] for exchange in exchanges)
+
+    def _iter_sessions(self):
+        for filename in os.listdir(self.context_dir):
+            if filename.startswith("session_") and filename.endswith(".json"):
+                file_path = os.path.join(self.context_dir, filename)
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    yield file_path, json.load(f)
+
+    def list_recent(self, limit: int = 10, offset: int = 0) -> List[Dict]:
+        sessions = [
+            _session_summary(
+                data["session_id"], data["created_at"], data["last_updated"], data["total_exchanges"],
+                data["exchanges"][0]["user_question"] if data["exchanges"] else ""
+            )
+            for _, data in self._iter_sessions()
+        ]
+        sessions.sort(key=lambda x: x["last_updated"], reverse=True)
+        return sessions[offset:offset + limit]
+
+    def summaries(self, session_ids: List[str]) -> Dict[str, Dict]:
+        """list_recent entries of the given sessions that exist"""
+        found = {}
+        for session_id in session_ids:
+            file_path = self._path(session_id)
+            if os.path.exists(file_path):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                found[session_id] = _session_summary(
+                    data["session_id"], data["created_at"], data["last_updated"], data["total_exchanges"],
+                    data["exchanges"][0]["user_question"] if data["exchanges"] else ""
+                )
+        return found
+
+    def recent_questions(self, since: datetime) -> List[Tuple[str, str]]:
+        """(timestamp, question) of every exchange at or after since"""
+        since_text = since.isoformat()
+        return [
+            (exchange["timestamp"], exchange["user_question"])
+            for _, data in self._iter_sessions() if data["last_updated"] >= since_text
+            for exchange in data["exchanges"] if exchange["timestamp"] >= since_text
+        ]
+
+    def reopen(self):
+        pass
+
+    def close(self):
+        pass
+
+    def delete_older_than(self, cutoff: datetime, keep: Iterable[str] = ()) -> int:
+        """Delete sessions last updated before cutoff, except those in keep"""
+        keep = set(keep)
+        removed = 0
+        for file_path, data in list(self._iter_sessions()):
+            if datetime.fromisoformat(data["last_updated"]) < cutoff and data["session_id"] not in keep:
+                os.remove(file_path)
+                removed += 1
+        return removed
+
+
+# Connections inherited across a fork, kept so they are never garbage-collected (and so closed) in the child
+_inherited_connections: List[sqlite3.Connection] = []
+
+
+class SQLiteSessionStore:
+    """Sessions in one SQLite database (WAL mode), indexed by session id and last_updated.
+
+    Appending an exchange inserts one row and bumps the session summary, so
+    the cost does not grow with conversation length; listing and retention
+    use the last_updated index instead of reading every session.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            last_updated TEXT NOT NULL,
+            total_exchanges INTEGER NOT NULL DEFAULT 0,
+            preview TEXT,
+            latest_exchange TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_last_updated ON sessions(last_updated);
+        CREATE TABLE IF NOT EXISTS exchanges (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_exchanges_session ON exchanges(session_id, seq);
+        CREATE TABLE IF NOT EXISTS applied_log_segments (
+            segment TEXT PRIMARY KEY,
+            applied_at TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # One connection per process, serialized by a lock; other gunicorn workers
+        # use their own connections and WAL lets their reads proceed during writes
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "latest_exchange" in columns:
+            return
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+            if "latest_exchange" not in columns:
+                # Databases from before the newest exchange's timestamp was kept per session
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN latest_exchange TEXT")
+                self._conn.execute(
+                    """
+                    UPDATE sessions SET latest_exchange = (
+                        SELECT MAX(json_extract(data, '$.timestamp')) FROM exchanges
+                        WHERE exchanges.session_id = sessions.session_id
+                    )
+                    """
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def reopen(self):
+        """Open a connection of this process's own after a fork (SQLite connections must not cross one).
+
+        The inherited connection is kept referenced but never used or closed:
+        closing it in the child could checkpoint or unlink the parent's WAL.
+        """
+        _inherited_connections.append(self._conn)
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _upsert_session(self, session_id: str, created_at: str, last_updated: str, added: int, preview: str,
+                        latest_exchange: Optional[str]):
+        self._conn.execute(
+            """
+            INSERT INTO sessions (session_id, created_at, last_updated, total_exchanges, preview, latest_exchange)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                last_updated = excluded.last_updated,
+                total_exchanges = sessions.total_exchanges + excluded.total_exchanges,
+                latest_exchange = MAX(COALESCE(sessions.latest_exchange, ''), excluded.latest_exchange)
+            """,
+            (session_id, created_at, last_updated, added, preview, latest_exchange)
+        )
+
+    def _fetch(self, sql: str, params=(), one: bool = False):
+        """Run a query on the blocking pool: SQLite waits on disk and WAL checkpoints in native code"""
+        def run():
+            cursor = self._conn.execute(sql, params)
+            return cursor.fetchone() if one else cursor.fetchall()
+        # The lock stays with the calling greenlet; only the SQLite work runs on the pool
+        with self._lock:
+            return run_blocking(run)
+
+    def _transaction(self, fn: Callable[[], Any]) -> Any:
+        """Run fn in one write transaction on the blocking pool"""
+        def run():
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        with self._lock:
+            return run_blocking(run)
+
+    def save(self, session_id: str, exchanges: List[Dict], created_at: str = None, last_updated: str = None):
+        """Replace a session's exchanges wholesale (used by migration and explicit saves)"""
+        now = datetime.now().isoformat()
+        created_at = created_at or (exchanges[0]["timestamp"] if exchanges else now)
+        preview = exchanges[0]["user_question"] if exchanges else ""
+
+        def write():
+            self._conn.execute("DELETE FROM exchanges WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._upsert_session(session_id, created_at, last_updated or now, len(exchanges), preview,
+                                 max((exchange["timestamp"] for exchange in exchanges), default=None))
+            self._conn.executemany(
+                "INSERT INTO exchanges (session_id, data) VALUES (?, ?)",
+                [(session_id, json.dumps(exchange, ensure_ascii=False)) for exchange in exchanges]
+            )
+        self._transaction(write)
+
+    def append_exchange(self, session_id: str, exchange: Dict, exchanges: List[Dict] = None):
+        """Append one exchange: one row insert plus a summary update"""
+        timestamp = exchange.get("timestamp") or datetime.now().isoformat()
+
+        def write():
+            self._upsert_session(session_id, timestamp, timestamp, 1, exchange.get("user_question", ""), timestamp)
+            self._conn.execute(
+                "INSERT INTO exchanges (session_id, data) VALUES (?, ?)",
+                (session_id, json.dumps(exchange, ensure_ascii=False))
+            )
+        self._transaction(write)
+
+    def apply_log(self, segment_name: str, records: List[Dict]):
+        """Append a write-behind log segment in one transaction; a segment is applied at most once"""
+        def write():
+            already_applied = self._conn.execute(
+                "SELECT 1 FROM applied_log_segments WHERE segment = ?", (segment_name,)
+            ).fetchone()
+            if already_applied is not None:
+                return
+            for record in records:
+                exchange = record["exchange"]
+                timestamp = exchange.get("timestamp") or datetime.now().isoformat()
+                self._upsert_session(record["session_id"], timestamp, timestamp, 1,
+                                     exchange.get("user_question", ""), timestamp)
+                self._conn.execute(
+                    "INSERT INTO exchanges (session_id, data) VALUES (?, ?)",
+                    (record["session_id"], json.dumps(exchange, ensure_ascii=False))
+                )
+            self._conn.execute(
+                "INSERT INTO applied_log_segments (segment, applied_at) VALUES (?, ?)",
+                (segment_name, datetime.now().isoformat())
+            )
+        self._transaction(write)
+
+    def load(self, session_id: str, limit: int = None) -> Optional[List[Dict]]:
+        """Most recent `limit` exchanges in order, or None if the session does not exist"""
+        def read():
+            if self._conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is None:
+                return None
+            return self._conn.execute(
+                """
+                SELECT data FROM (
+                    SELECT seq, data FROM exchanges WHERE session_id = ? ORDER BY seq DESC LIMIT ?
+                ) ORDER BY seq
+                """,
+                (session_id, limit if limit else -1)
+            ).fetchall()
+        with self._lock:
+            rows = run_blocking(read)
+        return [json.loads(row[0]) for row in rows] if rows is not None else None
+
+    def latest_timestamp(self, session_id: str) -> Optional[str]:
+        """Timestamp of the session's newest exchange, or None; a primary-key lookup of its summary row"""
+        row = self._fetch("SELECT latest_exchange FROM sessions WHERE session_id = ?", (session_id,), one=True)
+        return row[0] if row and row[0] else None
+
+    def list_recent(self, limit: int = 10, offset: int = 0) -> List[Dict]:
+        rows = self._fetch(
+            """
+            SELECT session_id, created_at, last_updated, total_exchanges, preview
+            FROM sessions ORDER BY last_updated DESC LIMIT ? OFFSET ?
+            """,
+            (limit, offset)
+        )
+        return [_session_summary(*row) for row in rows]
+
+    def summaries(self, session_ids: List[str]) -> Dict[str, Dict]:
+        """list_recent entries of the given sessions that exist"""
+        if not session_ids:
+            return {}
+        rows = self._fetch(
+            f"""
+            SELECT session_id, created_at, last_updated, total_exchanges, preview
+            FROM sessions WHERE session_id IN ({",".join("?" * len(session_ids))})
+            """,
+            list(session_ids)
+        )
+        return {row[0]: _session_summary(*row) for row in rows}
+
+    def recent_questions(self, since: datetime) -> List[Tuple[str, str]]:
+        """(timestamp, question) of every exchange at or after since"""
+        since_text = since.isoformat()
+        rows = self._fetch(
+            """
+            SELECT json_extract(data, '$.timestamp'), json_extract(data, '$.user_question') FROM exchanges
+            WHERE session_id IN (SELECT session_id FROM sessions WHERE last_updated >= ?)
+              AND json_extract(data, '$.timestamp') >= ?
+            """,
+            (since_text, since_text)
+        )
+        return [(timestamp, question) for timestamp, question in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def delete_older_than(self, cutoff: datetime, keep: Iterable[str] = ()) -> int:
+        """Delete sessions last updated before cutoff, except those in keep"""
+        cutoff_text = cutoff.isoformat()
+        keep = list(keep)
+        kept = f" AND session_id NOT IN ({','.join('?' * len(keep))})" if keep else ""
+
+        def write():
+            self._conn.execute(
+                "DELETE FROM exchanges WHERE session_id IN "
+                f"(SELECT session_id FROM sessions WHERE last_updated < ?{kept})",
+                [cutoff_text] + keep
+            )
+            removed = self._conn.execute(f"DELETE FROM sessions WHERE last_updated < ?{kept}",
+                                         [cutoff_text] + keep).rowcount
+            self._conn.execute("DELETE FROM applied_log_segments WHERE applied_at < ?", (cutoff_text,))
+            return removed
+        return self._transaction(write)
+
+
+def get_session_store(context_dir: str):
+    """Create the session store selected by Config.SESSION_BACKEND, behind the write-behind log if enabled"""
+    if Config.SESSION_BACKEND == "json":
+        store = JSONSessionStore(context_dir)
+    else:
+        store = SQLiteSessionStore(os.path.join(context_dir, "sessions.db"))
+    if Config.SESSION_WRITE_BEHIND:
+        from backend.session_log import WriteBehindSessionStore
+        store = WriteBehindSessionStore(store, os.path.join(context_dir, "session_log"))
+    return store
+
+
+def migrate_json_sessions(context_dir: str, store: SQLiteSessionStore) -> int:
+    """Copy every session_<id>.json in context_dir into store, keeping its timestamps"""
+    migrated = 0
+    for _, data in JSONSessionStore(context_dir)._iter_sessions():
+        store.save(data["session_id"], data["exchanges"], data["created_at"], data["last_updated"])
+        migrated += 1
+    return migrated
@@ -0,0 +1,135 @@
+import asyncio
+import re
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from backend import metrics
+
+# Words that say nothing about what a question is asking, shared by everything that compares
+# questions or matches them against chunks
+STOPWORDS = frozenset({
+    "the", "and", "for", "are", "what", "which", "who", "whom", "how", "does", "did", "can", "with",
+    "from", "that", "this", "there", "their", "about", "into", "explain", "tell", "please", "give",
+    "describe", "is", "of", "in", "on", "to", "me", "a", "an", "was", "were", "do", "any", "under"
+})
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question so trivially different phrasings share a key"""
+    normalized = re.sub(r'\s+', ' ', question.strip().lower())
+    return normalized.rstrip('?.! ')
+
+
+class _Call:
+    """A single in-flight computation that followers wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one in-flight computation.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running (followers) wait and receive the same result
+    or exception. Only threading primitives are used, so under gunicorn's
+    gevent worker (which monkey-patches threading) followers block only
+    their own greenlet.
+
+    A follower waits at most timeout seconds, and takes the leader's result
+    only if accept(result) holds; otherwise it runs its own fn. Either way
+    it is counted as a "fallback".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.fallbacks = 0
+
+    def _fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+        metrics.record_coalescing("fallback")
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None,
+           accept: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Run fn once for all concurrent callers sharing key"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.followers += 1
+                is_leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                is_leader = True
+        metrics.record_coalescing("leader" if is_leader else "follower")
+
+        if not is_leader:
+            if not call.event.wait(timeout):
+                self._fallback()
+                return fn()
+            if call.error is not None:
+                raise call.error
+            if accept is not None and not accept(call.result):
+                self._fallback()
+                return fn()
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def ado(self, key: str, coro_fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None,
+                  accept: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Async version of do() for callers on a single event loop"""
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None:
+                self.followers += 1
+                role = "follower"
+            else:
+                task = asyncio.ensure_future(coro_fn())
+                self._tasks[key] = task
+                self.leaders += 1
+                role = "leader"
+                task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        metrics.record_coalescing(role)
+
+        if role == "leader":
+            return await asyncio.shield(task)
+        try:
+            # Shield so a cancelled or timed-out follower does not cancel everyone else's result
+            result = await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self._fallback()
+            return await coro_fn()
+        if accept is not None and not accept(result):
+            self._fallback()
+            return await coro_fn()
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return coalescing counters and the ratio of requests served by another's computation"""
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "fallbacks": self.fallbacks,
+                "in_flight": len(self._calls) + len(self._tasks),
+                "coalescing_ratio": round(self.followers / total, 4) if total else 0.0
+            }
@@ -1,56 +1,358 @@
+import asyncio
+import inspect
+import os
+import uuid
 import chromadb
-from typing import List
+import numpy as np
+from typing import Dict, List, Optional, Tuple
 from langchain_community.vectorstores import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from backend import metrics
 from backend.config import Config
+from backend.admission import AdmissionRejected, ConcurrencyLimiter, get_limiter, priority, INGESTION
+from backend.blocking import run_blocking
+from backend.chunk_store import ChunkStore
+from backend.embeddings import LEGACY_IDENTITY, check_compatible, create_embeddings, embedding_identity
+from backend.query_cache import TTLCache
 from chromadb.config import Settings
 
+class LimitedEmbeddings(Embeddings):
+    """Embeddings wrapper that routes every upstream call through a limiter.
+
+    The upstream (gRPC) call itself runs on the blocking pool, the limiter
+    slot is held by the caller. Query embeddings are kept in query_cache (if given), so repeated and
+    pre-warmed questions skip the upstream call and the limiter entirely.
+    """
+
+    def __init__(self, embeddings: Embeddings, limiter: ConcurrencyLimiter, query_cache: Optional[TTLCache] = None):
+        self.embeddings = embeddings
+        self.limiter = limiter
+        self.query_cache = query_cache
+        # Gemini embeds queries and documents differently; batched queries keep the query task type
+        accepts_task_type = "task_type" in inspect.signature(embeddings.embed_documents).parameters
+        self._query_batch_kwargs = {"task_type": "retrieval_query"} if accepts_task_type else {}
+
+    @property
+    def identity(self) -> Dict:
+        return embedding_identity(self.embeddings)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.limiter.slot(), metrics.stage("embedding"):
+            return run_blocking(self.embeddings.embed_documents, texts)
+
+    def _cached_query(self, text: str) -> Optional[List[float]]:
+        return self.query_cache.get(text) if self.query_cache is not None else None
+
+    def _cache_query(self, text: str, embedding: List[float]):
+        if self.query_cache is not None:
+            self.query_cache.put(text, embedding)
+
+    def embed_query(self, text: str) -> List[float]:
+        embedding = self._cached_query(text)
+        if embedding is None:
+            with self.limiter.slot(), metrics.stage("embedding"):
+                embedding = run_blocking(self.embeddings.embed_query, text)
+            self._cache_query(text, embedding)
+        return embedding
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many search queries in one upstream call (cached queries are not sent)"""
+        embeddings = [self._cached_query(text) for text in texts]
+        missing = [text for text, embedding in zip(texts, embeddings) if embedding is None]
+        if missing:
+            with self.limiter.slot(), metrics.stage("embedding"):
+                fresh = iter(run_blocking(self.embeddings.embed_documents, missing, **self._query_batch_kwargs))
+            for i, text in enumerate(texts):
+                if embeddings[i] is None:
+                    embeddings[i] = next(fresh)
+                    self._cache_query(text, embeddings[i])
+        return embeddings
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        async with self.limiter.aslot():
+            with metrics.stage("embedding"):
+                return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        embedding = self._cached_query(text)
+        if embedding is None:
+            async with self.limiter.aslot():
+                with metrics.stage("embedding"):
+                    embedding = await self.embeddings.aembed_query(text)
+            self._cache_query(text, embedding)
+        return embedding
+
+
 class VectorStore:
-    def __init__(self):
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model=Config.EMBEDDING_MODEL,
-            google_api_key=Config.GOOGLE_API_KEY
-        )
+    """Chroma index of embeddings and small metadata, with chunk text in a separate chunk store.
+
+    Searches return hits with empty page_content; text is loaded with
+    get_texts / hydrate only for the chunks that are actually used.
+    """
+
+    # Bumped when the on-disk layout changes (2: chunk text moved out of Chroma, 3: embedding backend recorded,
+    # 4: chunking mode recorded)
+    INDEX_FORMAT = 4
+    # Chunks embedded and written per upsert
+    ADD_BATCH_SIZE = 500
+
+    def __init__(self, embeddings: Optional[Embeddings] = None, persist_directory: Optional[str] = None):
+        if embeddings is None:
+            embeddings = create_embeddings()
+        # All embedding calls share this worker's embedding limiter and query embedding cache;
+        # an already wrapped instance (another store's) is shared as is, cache included
+        if isinstance(embeddings, LimitedEmbeddings):
+            self.embeddings = embeddings
+        else:
+            self.embeddings = LimitedEmbeddings(
+                embeddings, get_limiter("embedding"),
+                TTLCache("query_embedding", Config.QUERY_EMBEDDING_CACHE_SIZE, Config.QUERY_CACHE_TTL)
+            )
+        self.persist_directory = persist_directory or Config.CHROMA_DB_PATH
         self.vector_store = None
+        # Bumped whenever this process changes the index, so cached retrievals of an older index are not reused
+        self.generation = 0
         self.setup_vector_store()
+        self.embedding_info = self.check_embeddings()
+        self.chunking = self.check_chunking()
     
     def is_empty(self) -> bool:
         """Check if vector store is empty"""
         try:
             # A more reliable way to check for emptiness is to get the item count.
-            return self.vector_store._collection.count() == 0
+            return self.count() == 0
         except Exception as e:
             print(f"Could not get collection count, assuming it's empty. Error: {e}")
             return True
     
     def setup_vector_store(self):
-        """Initialize ChromaDB vector store"""
+        """Initialize ChromaDB vector store and the chunk text store next to it"""
         try:
             self.vector_store = Chroma(
                 collection_name=Config.COLLECTION_NAME,
                 embedding_function=self.embeddings,
-                persist_directory=Config.CHROMA_DB_PATH,
-                client_settings=Settings(anonymized_telemetry=False)
+                persist_directory=self.persist_directory,
+                client_settings=Settings(anonymized_telemetry=False, is_persistent=True)
             )
+            os.makedirs(self.persist_directory, exist_ok=True)
+            self.chunk_store = ChunkStore(os.path.join(self.persist_directory, "chunks.db"))
             print("Vector store initialized successfully")
         except Exception as e:
             print(f"Error initializing vector store: {str(e)}")
             raise
     
-    def add_documents(self, documents: List[Document]):
-        """Add documents to vector store"""
+    def check_embeddings(self) -> Optional[Dict]:
+        """The embedding backend recorded for this index, after checking that ours matches it.
+        
+        Vectors of different backends, models or dimensions cannot be
+        compared, so a mismatch raises ValueError instead of returning
+        meaningless hits. An empty index records ours on its first write.
+        """
+        recorded = self.chunk_store.get_info("embeddings")
+        if recorded is None:
+            if self.is_empty():
+                return None
+            recorded = LEGACY_IDENTITY
+        check_compatible(recorded, self.embeddings.identity, f"Index {self.persist_directory}")
+        return recorded
+    
+    def check_chunking(self) -> str:
+        """Chunking mode of this index: "standard", or "parent_child" when search hits are children
+        whose parent_id names the parent text to put in the prompt (indexes that record none are standard)"""
+        return self.chunk_store.get_info("chunking") or "standard"
+    
+    def _record_chunking(self, mode: str):
+        """Record the chunking mode on the first write; an index holds chunks of one mode only"""
+        if mode == self.chunking:
+            return
+        if not self.is_empty():
+            raise ValueError(f"Index {self.persist_directory} holds {self.chunking} chunks, not {mode}; "
+                             f"rebuild the index or set CHUNKING_MODE to match")
+        self.chunk_store.set_info("chunking", mode)
+        self.chunking = mode
+    
+    def _record_embeddings(self, dimension: int):
+        """Record the backend and dimension on the first write; later writes must match them"""
+        current = dict(self.embeddings.identity, dimension=dimension)
+        if self.embedding_info is None:
+            self.chunk_store.set_info("embeddings", current)
+            self.embedding_info = current
+        else:
+            check_compatible(self.embedding_info, current, f"Index {self.persist_directory}")
+    
+    def close(self):
+        """Release the chunk store and the Chroma client; the store cannot be used afterwards"""
+        self.chunk_store.close()
+        client = getattr(self.vector_store, "_client", None)
+        if client is None:
+            return
+        try:
+            from chromadb.api.client import SharedSystemClient
+            client._system.stop()
+            # chromadb keeps one system per path; forget it so the path can be opened afresh
+            SharedSystemClient._identifer_to_system.pop(getattr(client, "_identifier", None), None)
+        except Exception as e:
+            print(f"Error closing Chroma client for {self.persist_directory}: {str(e)}")
+    
+    def count(self) -> int:
+        """Number of chunks in the index"""
+        return run_blocking(self.vector_store._collection.count)
+    
+    def _query_collection(self, query_embeddings: List[List[float]], n_results: int, include: List[str]) -> Dict:
+        """Nearest neighbours per query embedding, in Chroma's query result layout"""
+        return run_blocking(
+            self.vector_store._collection.query, query_embeddings=query_embeddings, n_results=n_results, include=include
+        )
+    
+    def _get_collection(self, ids: List[str], include: List[str]) -> Dict:
+        """Chunks by id, in Chroma's get result layout"""
+        return run_blocking(self.vector_store._collection.get, ids=ids, include=include)
+    
+    @staticmethod
+    def chunk_id(doc: Document) -> Optional[str]:
+        """Stable id from the source file's hash and the chunk's position in it (None if the chunk has no source file).
+        
+        Parent chunks of parent-child chunking are stored under their parent_id.
+        """
+        if doc.metadata.get("chunk_role") == "parent":
+            return doc.metadata["parent_id"]
+        file_hash = doc.metadata.get("file_hash")
+        position = doc.metadata.get("file_chunk_index")
+        if file_hash is None or position is None:
+            return None
+        return f"{file_hash[:16]}-{position}"
+    
+    def pending_files(self, file_paths: List[str]) -> List[str]:
+        """Files that are not fully indexed yet, including any an interrupted run left partway.
+        
+        An index built before progress was recorded has no checkpoints to go
+        by; it is taken as complete, as the old is_empty() check did.
+        """
+        from backend.document_processor import file_sha256
+        
+        progress = self.chunk_store.get_progress()
+        if not progress and not self.is_empty():
+            return []
+        pending = []
+        for path in file_paths:
+            recorded = progress.get(run_blocking(file_sha256, path))
+            if recorded is None or recorded[1] < recorded[0]:
+                pending.append(path)
+        return pending
+    
+    def _write_batch(self, ids: List[str], batch: List[Document]):
+        texts = [doc.page_content for doc in batch]
+        embeddings = self.embeddings.embed_documents(texts)
+        self._record_embeddings(len(embeddings[0]))
+        # Text first, so a chunk the index can return always has its body
+        self.chunk_store.put_many(zip(ids, texts))
+        # Chroma gets embeddings and metadata only, no documents; upserts make a repeated batch harmless
+        run_blocking(
+            self.vector_store._collection.upsert, ids=ids, embeddings=embeddings,
+            metadatas=[doc.metadata or {"chunk_index": i} for i, doc in enumerate(batch)]
+        )
+        # Every batch is searchable at once, so cached retrievals of the previous index are stale
+        self.generation += 1
+    
+    def _delete_stale_parents(self, file_hash: str, parents: int, recorded_parents: Optional[int]):
+        """Drop the parent texts of a file past its new parent count (parents live in the chunk store only)"""
+        prefix = f"{file_hash[:16]}-p"
+        if recorded_parents is None:
+            # Recorded before parents were counted: find them by id
+            stale = [chunk_id for chunk_id in self.chunk_store.ids_with_prefix(prefix)
+                     if chunk_id[len(prefix):].isdigit() and int(chunk_id[len(prefix):]) >= parents]
+        else:
+            stale = [f"{prefix}{position}" for position in range(parents, recorded_parents)]
+        if stale:
+            self.chunk_store.delete_many(stale)
+
+    def _add_file(self, file_hash: str, chunks: List[Document], recorded: Optional[Tuple[int, int, Optional[int]]],
+                  parents: int = 0) -> int:
+        """Index one file's chunks from its last checkpoint on; returns the number of chunks written.
+        
+        parents is the number of parent chunks the file now has (parent-child chunking).
+        """
+        chunks = sorted(chunks, key=lambda doc: doc.metadata["file_chunk_index"])
+        file_name = chunks[0].metadata.get("file_name", file_hash[:16])
+        total = len(chunks)
+        done = 0
+        if recorded is not None:
+            recorded_total, indexed, recorded_parents = recorded
+            if recorded_total == total:
+                done = indexed
+            elif recorded_total > total:
+                # Re-chunked with other settings: drop chunks past the new end, the rest are overwritten
+                stale = [f"{file_hash[:16]}-{position}" for position in range(total, recorded_total)]
+                run_blocking(self.vector_store._collection.delete, ids=stale)
+                self.chunk_store.delete_many(stale)
+            if recorded_parents != parents:
+                self._delete_stale_parents(file_hash, parents, recorded_parents)
+                if done >= total:
+                    self.chunk_store.set_progress(file_hash, file_name, total, done, parents)
+        if done >= total:
+            print(f"{file_name} is already indexed ({total} chunks). Skipping.")
+            return 0
+        if done:
+            print(f"Resuming {file_name} at chunk {done}/{total}")
+        self.chunk_store.set_progress(file_hash, file_name, total, done, parents)
+        for start in range(done, total, self.ADD_BATCH_SIZE):
+            batch = chunks[start:start + self.ADD_BATCH_SIZE]
+            self._write_batch([self.chunk_id(doc) for doc in batch], batch)
+            # Recorded only after the batch is in both stores; a crash before this just repeats the batch
+            self.chunk_store.set_progress(file_hash, file_name, total, start + len(batch), parents)
+        return total - done
+    
+    def add_documents(self, documents: List[Document]) -> int:
+        """Add documents to vector store; returns the number of chunks written.
+        
+        Chunks of a source file get stable ids and are written in batches,
+        each followed by a checkpoint, so a run that stopped partway (crash,
+        embedding quota) resumes after the last completed batch without
+        duplicating or losing chunks. Documents without a source file hash
+        are added once, under random ids.
+        
+        Parent chunks (parent-child chunking) only go into the chunk store,
+        ahead of the children that point at them; the count is of children.
+        """
         try:
             if not documents:
                 print("No documents to add")
-                return
+                return 0
+            
+            parents = [doc for doc in documents if doc.metadata.get("chunk_role") == "parent"]
+            self._record_chunking("parent_child" if parents else "standard")
+            if parents:
+                # Not embedded, so cheap to rewrite whole on a resumed run
+                self.chunk_store.put_many((doc.metadata["parent_id"], doc.page_content) for doc in parents)
+            
+            by_file = {}
+            parent_counts = {}
+            untracked = []
+            for doc in documents:
+                if doc.metadata.get("chunk_role") == "parent":
+                    if doc.metadata.get("file_hash"):
+                        parent_counts[doc.metadata["file_hash"]] = parent_counts.get(doc.metadata["file_hash"], 0) + 1
+                    continue
+                if self.chunk_id(doc) is None:
+                    untracked.append(doc)
+                else:
+                    by_file.setdefault(doc.metadata["file_hash"], []).append(doc)
+            progress = self.chunk_store.get_progress(list(by_file))
             
-            # Add documents to vector store
-            self.vector_store.add_documents(documents)
+            added = 0
+            # Ingestion waits behind interactive queries
+            with priority(INGESTION):
+                for file_hash, chunks in by_file.items():
+                    added += self._add_file(file_hash, chunks, progress.get(file_hash), parent_counts.get(file_hash, 0))
+                for start in range(0, len(untracked), self.ADD_BATCH_SIZE):
+                    batch = untracked[start:start + self.ADD_BATCH_SIZE]
+                    self._write_batch([str(uuid.uuid4()) for _ in batch], batch)
+                    added += len(batch)
             
-            # Persist the vector store
-            self.vector_store.persist()
-            print(f"Added {len(documents)} documents to vector store")
+            print(f"Added {added} documents to vector store")
+            return added
             
         except Exception as e:
             print(f"Error adding documents to vector store: {str(e)}")
@@ -59,39 +361,232 @@ class VectorStore:
     def similarity_search(self, query: str, k: int = 8) -> List[Document]:
         """Search for similar documents with enhanced retrieval"""
         try:
+            # Embed separately so embedding and search time are measured apart
+            embedding = self.embeddings.embed_query(query)
+            
             # Use MMR for diverse results
-            results = self.vector_store.max_marginal_relevance_search(
-                query, 
-                k=k, 
-                fetch_k=k*3,  # Fetch more candidates
-                lambda_mult=0.6  # Balance relevance vs diversity
-            )
+            with metrics.stage("vector_search"):
+                results = self.mmr_search_by_vector(
+                    embedding, 
+                    k=k, 
+                    fetch_k=k*3,  # Fetch more candidates
+                    lambda_mult=0.6  # Balance relevance vs diversity
+                )
             return results
+        except AdmissionRejected:
+            raise
         except Exception as e:
             print(f"Error during similarity search: {str(e)}")
             # Fallback to regular similarity search
             try:
-                results = self.vector_store.similarity_search(query, k=k)
-                return results
+                return self.search_by_vector(self.embeddings.embed_query(query), k=k)
+            except AdmissionRejected:
+                raise
+            except:
+                return []
+    
+    async def asimilarity_search(self, query: str, k: int = 8) -> List[Document]:
+        """Async similarity search: awaits the query embedding and runs the Chroma search in a worker thread"""
+        try:
+            embedding = await self.embeddings.aembed_query(query)
+            with metrics.stage("vector_search"):
+                return await asyncio.to_thread(
+                    self.mmr_search_by_vector,
+                    embedding,
+                    k=k,
+                    fetch_k=k*3,
+                    lambda_mult=0.6
+                )
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"Error during async similarity search: {str(e)}")
+            try:
+                embedding = await self.embeddings.aembed_query(query)
+                return await asyncio.to_thread(self.search_by_vector, embedding, k=k)
+            except AdmissionRejected:
+                raise
             except:
                 return []
     
+    def similarity_search_with_similarity(self, query: str, k: int = 8) -> List[Tuple[Document, float]]:
+        """Plain top-k search returning cosine similarity in [0, 1] for each hit"""
+        try:
+            embedding = self.embeddings.embed_query(query)
+            with metrics.stage("vector_search"):
+                results = self.search_by_vector(embedding, k=k)
+            self.hydrate(results)
+            return [(doc, doc.metadata["similarity"]) for doc in results]
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"Error during similarity search with similarity: {str(e)}")
+            return []
+    
+    async def asimilarity_search_with_similarity(self, query: str, k: int = 8) -> List[Tuple[Document, float]]:
+        """Async version of similarity_search_with_similarity"""
+        try:
+            embedding = await self.embeddings.aembed_query(query)
+            with metrics.stage("vector_search"):
+                results = await asyncio.to_thread(self.search_by_vector, embedding, k=k)
+            await self.ahydrate(results)
+            return [(doc, doc.metadata["similarity"]) for doc in results]
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"Error during async similarity search with similarity: {str(e)}")
+            return []
+    
+    @staticmethod
+    def _distance_to_similarity(distance: float) -> float:
+        # Chroma's default space is squared L2; for unit-length embeddings cos = 1 - d / 2
+        return max(0.0, min(1.0, 1.0 - distance / 2))
+    
+    @staticmethod
+    def _to_document(chunk_id: str, text: str, metadata: Optional[Dict], similarity: float) -> Document:
+        """Build a search hit that carries its Chroma id and similarity to the query in its metadata"""
+        metadata = dict(metadata or {})
+        metadata["chunk_id"] = chunk_id
+        metadata["similarity"] = similarity
+        return Document(page_content=text, metadata=metadata)
+    
+    def search_by_vector(self, embedding: List[float], k: int = 8) -> List[Document]:
+        """Top-k search by embedding; hits carry chunk_id and similarity metadata but no text"""
+        results = self._query_collection(
+            query_embeddings=[embedding], n_results=k, include=["metadatas", "distances"]
+        )
+        return [
+            self._to_document(chunk_id, "", metadata, self._distance_to_similarity(distance))
+            for chunk_id, metadata, distance in zip(
+                results["ids"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+    
+    def mmr_search_by_vector(self, embedding: List[float], k: int = 8, fetch_k: int = 24,
+                             lambda_mult: float = 0.6) -> List[Document]:
+        """MMR search by embedding (as Chroma's own) whose hits carry chunk_id and similarity metadata but no text"""
+        return self.mmr_search_by_vectors([embedding], k, fetch_k, lambda_mult)[0]
+    
+    def mmr_search_by_vectors(self, embeddings: List[List[float]], k: int = 8, fetch_k: int = 24,
+                              lambda_mult: float = 0.6) -> List[List[Document]]:
+        """MMR search for several embeddings in one Chroma query"""
+        results = self._query_collection(
+            query_embeddings=embeddings, n_results=fetch_k,
+            include=["metadatas", "distances", "embeddings"]
+        )
+        hits = []
+        for q, embedding in enumerate(embeddings):
+            if not results["ids"][q]:
+                hits.append([])
+                continue
+            selected = maximal_marginal_relevance(
+                np.array(embedding, dtype=np.float32), results["embeddings"][q], k=k, lambda_mult=lambda_mult
+            )
+            hits.append([
+                self._to_document(
+                    results["ids"][q][i], "", results["metadatas"][q][i],
+                    self._distance_to_similarity(results["distances"][q][i])
+                )
+                for i in selected
+            ])
+        return hits
+    
+    def batch_similarity_search(self, queries: List[str], k: int = 8) -> Dict[str, List[Document]]:
+        """MMR search for many queries: embeddings in large batched calls, searches grouped per Chroma query"""
+        hits = {}
+        batch_size = Config.EMBEDDING_BATCH_SIZE
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            embeddings = self.embeddings.embed_queries(batch)
+            with metrics.stage("vector_search"):
+                for query, docs in zip(batch, self.mmr_search_by_vectors(embeddings, k=k, fetch_k=k*3, lambda_mult=0.6)):
+                    hits[query] = docs
+        return hits
+    
+    def get_by_ids(self, chunk_ids: List[str]) -> List[Document]:
+        """Fetch chunk metadata by id without embedding anything; ids no longer in the index are skipped"""
+        if not chunk_ids:
+            return []
+        try:
+            with metrics.stage("vector_fetch"):
+                results = self._get_collection(ids=chunk_ids, include=["metadatas"])
+            found = dict(zip(results["ids"], results["metadatas"]))
+            return [self._to_document(chunk_id, "", found[chunk_id], 0.0) for chunk_id in chunk_ids if chunk_id in found]
+        except Exception as e:
+            print(f"Error fetching chunks by id: {str(e)}")
+            return []
+    
+    async def aget_by_ids(self, chunk_ids: List[str]) -> List[Document]:
+        """Async version of get_by_ids"""
+        return await asyncio.to_thread(self.get_by_ids, chunk_ids)
+    
+    def get_texts(self, chunk_ids: List[str]) -> Dict[str, str]:
+        """Chunk texts by id from the chunk store; ids that are not found are left out"""
+        if not chunk_ids:
+            return {}
+        with metrics.stage("chunk_hydration"):
+            texts = self.chunk_store.get_many(chunk_ids)
+            legacy = [chunk_id for chunk_id in chunk_ids if chunk_id not in texts]
+            if legacy:
+                # Indexes built before the chunk store keep their text in Chroma
+                try:
+                    results = self._get_collection(ids=legacy, include=["documents"])
+                    texts.update((chunk_id, text) for chunk_id, text in zip(results["ids"], results["documents"]) if text)
+                except Exception as e:
+                    print(f"Error fetching chunk texts from vector store: {str(e)}")
+        return texts
+    
+    def hydrate(self, documents: List[Document]) -> List[Document]:
+        """Fill in page_content of search hits in place"""
+        missing = [doc.metadata["chunk_id"] for doc in documents if not doc.page_content and doc.metadata.get("chunk_id")]
+        if missing:
+            texts = self.get_texts(missing)
+            for doc in documents:
+                if not doc.page_content:
+                    doc.page_content = texts.get(doc.metadata.get("chunk_id"), "")
+        return documents
+    
+    async def ahydrate(self, documents: List[Document]) -> List[Document]:
+        """Async version of hydrate"""
+        return await asyncio.to_thread(self.hydrate, documents)
+    
     def similarity_search_with_score(self, query: str, k: int = 8) -> List[tuple]:
-        """Search for similar documents with relevance scores"""
+        """Search for similar documents with their (hydrated) text and Chroma distance"""
         try:
-            results = self.vector_store.similarity_search_with_score(query, k=k)
-            return results
+            embedding = self.embeddings.embed_query(query)
+            results = self._query_collection(
+                query_embeddings=[embedding], n_results=k, include=["metadatas", "distances"]
+            )
+            docs = self.hydrate([
+                self._to_document(chunk_id, "", metadata, self._distance_to_similarity(distance))
+                for chunk_id, metadata, distance in zip(
+                    results["ids"][0], results["metadatas"][0], results["distances"][0]
+                )
+            ])
+            return list(zip(docs, results["distances"][0]))
         except Exception as e:
             print(f"Error during similarity search with score: {str(e)}")
             return []
-    
-    def get_retriever(self, k: int = 12):
-        """Get retriever for RAG chain with diverse results"""
-        return self.vector_store.as_retriever(
-            search_type="mmr",  # Maximum Marginal Relevance for diversity
-            search_kwargs={
-                "k": k,
-                "fetch_k": k * 2,  # Fetch more candidates for diversity
-                "lambda_mult": 0.7  # Balance between relevance and diversity
-            }
-        )
\ No newline at end of file
+
+
+def open_vector_store(embeddings: Optional[Embeddings] = None) -> VectorStore:
+    """The index this deployment serves: the artifact at INDEX_ARTIFACT_PATH if set, otherwise
+    the current index snapshot (INDEX_SNAPSHOTS) or the Chroma index in CHROMA_DB_PATH"""
+    if Config.INDEX_ARTIFACT_PATH:
+        from backend.index_artifact import ArtifactVectorStore
+        return ArtifactVectorStore(Config.INDEX_ARTIFACT_PATH, embeddings=embeddings)
+    if Config.INDEX_SNAPSHOTS:
+        from backend.index_snapshots import SnapshotVectorStore
+        return SnapshotVectorStore(Config.INDEX_SNAPSHOT_DIR, embeddings=embeddings)
+    return VectorStore(embeddings=embeddings)
+
+
+def open_index_writer(embeddings: Optional[Embeddings] = None):
+    """Where start-up indexing writes: the next index snapshot (INDEX_SNAPSHOTS) or the live Chroma index.
+
+    Both offer pending_files() and add_documents().
+    """
+    if Config.INDEX_SNAPSHOTS:
+        from backend.index_snapshots import SnapshotWriter
+        return SnapshotWriter(Config.INDEX_SNAPSHOT_DIR, embeddings=embeddings)
+    return VectorStore(embeddings=embeddings)
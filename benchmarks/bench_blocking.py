@@ -0,0 +1,159 @@
+"""Concurrency of RAGChain.query under gevent, with and without the blocking pool.
+
+Patches the process with gevent (as gunicorn's gevent worker does) and runs
+concurrent queries against stand-ins that wait inside native code, like the
+Gemini gRPC client: gevent cannot switch away from these waits. With
+BLOCKING_POOL_SIZE=0 the calls run inline and the queries serialize; through
+the pool they interleave. A heartbeat greenlet measures how long the worker
+could not serve anything else (e.g. /api/health) while the queries ran.
+
+    python -m benchmarks.bench_blocking --concurrency 8 --output blocking.json
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+import contextlib
+import sys
+import tempfile
+import time
+from typing import Any, Iterator, List, Optional
+
+import gevent
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk
+
+from benchmarks.common import BUNDLED_PDFS, open_cached_index, percentiles, report_header, write_report
+from benchmarks.stand_ins import FakeChatModel, HashingEmbeddings
+
+native_sleep = monkey.get_original("time", "sleep")
+
+
+class NativeWaitEmbeddings(HashingEmbeddings):
+    """HashingEmbeddings that first wait `latency` seconds in native code, like a gRPC call"""
+
+    def __init__(self, dimension: int = 384, latency: float = 0.0):
+        super().__init__(dimension)
+        self.latency = latency
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        native_sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        native_sleep(self.latency)
+        return super().embed_query(text)
+
+
+class NativeWaitChatModel(FakeChatModel):
+    """FakeChatModel whose stream waits in native code between chunks, like a gRPC stream"""
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._answer_tokens(messages)):
+            native_sleep(self.first_token_latency if i == 0 else self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def run_mode(pool_size: int, questions: List[str], vector_store_factory, llm, session_dir: str) -> dict:
+    from backend.config import Config
+    from backend.rag_chain import RAGChain
+    from backend.session_cache import SessionCache
+
+    Config.BLOCKING_POOL_SIZE = pool_size
+    # Fresh components per mode so no cache carries over between them
+    rag_chain = RAGChain(llm=llm, vector_store=vector_store_factory(), sessions=SessionCache(session_dir))
+
+    start = time.perf_counter()
+    rag_chain.query(questions[0])
+    single = time.perf_counter() - start
+
+    latencies, gaps = [], []
+    running = [True]
+
+    def heartbeat(tick: float = 0.01):
+        last = time.perf_counter()
+        while running[0]:
+            gevent.sleep(tick)
+            now = time.perf_counter()
+            gaps.append(now - last - tick)
+            last = now
+
+    def one(question: str):
+        rag_chain.query(question)
+        # From the common start: inline, later queries wait for earlier ones before they even begin
+        latencies.append(time.perf_counter() - start)
+
+    monitor = gevent.spawn(heartbeat)
+    start = time.perf_counter()
+    gevent.joinall([gevent.spawn(one, question) for question in questions[1:]])
+    wall = time.perf_counter() - start
+    running[0] = False
+    monitor.join()
+    rag_chain.sessions.close()
+    concurrent = len(questions) - 1
+    return {
+        "blocking_pool_size": pool_size,
+        "single_query_seconds": round(single, 3),
+        "concurrent_queries": concurrent,
+        "wall_seconds": round(wall, 3),
+        # 1.0 = fully serialized; close to the number of queries = fully interleaved
+        "interleaving": round(single * concurrent / wall, 2) if wall else None,
+        "latency": percentiles(latencies),
+        "max_event_loop_stall_ms": round(max(gaps, default=0.0) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="Queries started at once")
+    parser.add_argument("--pool-size", type=int, default=24, help="BLOCKING_POOL_SIZE of the offloaded run")
+    parser.add_argument("--embedding-latency", type=float, default=0.1, help="Native wait per embedding call (s)")
+    parser.add_argument("--llm-first-token", type=float, default=0.5, help="Native wait before the first chunk (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0, help="Fake LLM token rate")
+    parser.add_argument("--llm-answer-tokens", type=int, default=50, help="Fake LLM answer length")
+    parser.add_argument("--embedding-dim", type=int, default=384, help="Hashing embedder dimension")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    from backend.blocking import self_check
+    from backend.config import Config
+    from backend.vector_store import VectorStore
+
+    # Distinct questions, so coalescing and the caches cannot hide the upstream calls
+    questions = [f"What does section {100 + i} of the Bharatiya Nyaya Sanhita provide?" for i in range(args.concurrency + 1)]
+    llm = NativeWaitChatModel(
+        first_token_latency=args.llm_first_token,
+        tokens_per_second=args.llm_tokens_per_second,
+        answer_tokens=args.llm_answer_tokens
+    )
+
+    # Backend progress prints go to stderr so stdout stays machine-readable
+    with contextlib.redirect_stdout(sys.stderr), tempfile.TemporaryDirectory() as session_dir:
+        Config.BLOCKING_POOL_SIZE = args.pool_size
+        check = self_check()
+        _, index_info = open_cached_index(HashingEmbeddings(args.embedding_dim), BUNDLED_PDFS, "query", args.embedding_dim)
+
+        def vector_store_factory():
+            embeddings = NativeWaitEmbeddings(args.embedding_dim, args.embedding_latency)
+            return VectorStore(embeddings=embeddings, persist_directory=index_info["path"])
+
+        modes = [run_mode(pool_size, questions, vector_store_factory, llm, session_dir)
+                 for pool_size in (0, args.pool_size)]
+
+    report = report_header("blocking", {
+        "concurrency": args.concurrency,
+        "embedding_latency": args.embedding_latency,
+        "llm_first_token": args.llm_first_token,
+        "llm_tokens_per_second": args.llm_tokens_per_second,
+        "llm_answer_tokens": args.llm_answer_tokens,
+        "embedding_dim": args.embedding_dim
+    })
+    report.update({"index": index_info, "self_check": check, "inline": modes[0], "offloaded": modes[1]})
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
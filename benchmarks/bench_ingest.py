@@ -0,0 +1,158 @@
+"""Offline ingestion throughput benchmark.
+
+Runs DocumentProcessor.load_pdf, split_documents and VectorStore.add_documents
+over the bundled PDFs into a fresh Chroma index per run, with a hashing
+embedder in place of Gemini. Prints a JSON report with per-stage time,
+pages/s, chunks/s, bytes/s and peak memory, to compare across commits.
+
+    python -m benchmarks.bench_ingest --runs 3 --output ingest.json
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from benchmarks.common import BUNDLED_PDFS, peak_rss_mb, percentiles, report_header, write_report
+from benchmarks.stand_ins import HashingEmbeddings
+
+
+def rate(amount: float, seconds: float):
+    return round(amount / seconds, 1) if seconds else None
+
+
+def run_once(pdfs: List[str], embedding_dim: int, batch_size: int) -> Dict:
+    """One full ingestion into a temporary index; returns counts and per-stage seconds"""
+    from backend import metrics
+    from backend.document_processor import DocumentProcessor
+    from backend.vector_store import VectorStore
+
+    embedding_seconds = []
+    lock = threading.Lock()
+
+    def observe(stage, seconds):
+        if stage == "embedding":
+            with lock:
+                embedding_seconds.append(seconds)
+
+    processor = DocumentProcessor()
+    files = []
+    documents = []
+    start = time.perf_counter()
+    for pdf in pdfs:
+        loaded = time.perf_counter()
+        pages = processor.load_pdf(pdf)
+        files.append({
+            "file": os.path.basename(pdf),
+            "bytes": os.path.getsize(pdf),
+            "pages": len(pages),
+            "load_seconds": round(time.perf_counter() - loaded, 3)
+        })
+        documents.extend(pages)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks = processor.split_documents(documents)
+    split_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        vector_store = VectorStore(embeddings=HashingEmbeddings(embedding_dim), persist_directory=persist_directory)
+        vector_store.ADD_BATCH_SIZE = batch_size
+        metrics.add_observer(observe)
+        start = time.perf_counter()
+        try:
+            vector_store.add_documents(chunks)
+        finally:
+            metrics.remove_observer(observe)
+        index_seconds = time.perf_counter() - start
+        indexed = vector_store.count()
+        vector_store.chunk_store.close()
+
+    embed_seconds = sum(embedding_seconds)
+    # Parent chunks (parent-child chunking) are stored but not embedded
+    parents = sum(1 for chunk in chunks if chunk.metadata.get("chunk_role") == "parent")
+    return {
+        "files": files,
+        "pages": len(documents),
+        "bytes": sum(f["bytes"] for f in files),
+        "text_chars": sum(len(doc.page_content) for doc in documents),
+        "chunks": len(chunks) - parents,
+        "parents": parents,
+        "indexed": indexed,
+        "stages": {
+            "load": load_seconds,
+            "split": split_seconds,
+            "embed": embed_seconds,
+            # Chunk store and Chroma writes: add_documents minus the embedder calls
+            "store": max(0.0, index_seconds - embed_seconds)
+        },
+        "total_seconds": load_seconds + split_seconds + index_seconds
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", nargs="+", default=BUNDLED_PDFS, help="PDFs to ingest (default: the bundled ones)")
+    parser.add_argument("--runs", type=int, default=1, help="Full ingestions, each into a fresh index")
+    parser.add_argument("--embedding-dim", type=int, default=384, help="Hashing embedder dimension")
+    parser.add_argument("--batch-size", type=int, default=None, help="Chunks per upsert (default: VectorStore.ADD_BATCH_SIZE)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    from backend.config import Config
+    from backend.vector_store import VectorStore
+
+    batch_size = args.batch_size or VectorStore.ADD_BATCH_SIZE
+    # Backend progress prints go to stderr so stdout stays machine-readable
+    with contextlib.redirect_stdout(sys.stderr):
+        runs = [run_once(args.pdfs, args.embedding_dim, batch_size) for _ in range(args.runs)]
+
+    stage_samples = defaultdict(list)
+    for run in runs:
+        for stage, seconds in run["stages"].items():
+            stage_samples[stage].append(seconds)
+    totals = [run["total_seconds"] for run in runs]
+    # Throughput from the median run; every run ingests the same corpus
+    median = sorted(runs, key=lambda run: run["total_seconds"])[len(runs) // 2]
+    stages = median["stages"]
+
+    report = report_header("ingest", {
+        "runs": args.runs,
+        "pdfs": [os.path.basename(pdf) for pdf in args.pdfs],
+        "chunk_size": Config.CHUNK_SIZE,
+        "chunk_overlap": Config.CHUNK_OVERLAP,
+        "chunking": Config.CHUNKING_MODE,
+        "batch_size": batch_size,
+        "embedding_dim": args.embedding_dim
+    })
+    report.update({
+        "files": median["files"],
+        "pages": median["pages"],
+        "bytes": median["bytes"],
+        "text_chars": median["text_chars"],
+        "chunks": median["chunks"],
+        "parents": median["parents"],
+        "indexed": median["indexed"],
+        "total": percentiles(totals),
+        "stages": {stage: percentiles(samples) for stage, samples in stage_samples.items()},
+        "throughput": {
+            "pages_per_second": rate(median["pages"], median["total_seconds"]),
+            "chunks_per_second": rate(median["chunks"], median["total_seconds"]),
+            "bytes_per_second": rate(median["bytes"], median["total_seconds"]),
+            "load_pages_per_second": rate(median["pages"], stages["load"]),
+            "load_bytes_per_second": rate(median["bytes"], stages["load"]),
+            "split_chunks_per_second": rate(median["chunks"], stages["split"]),
+            "embed_chunks_per_second": rate(median["chunks"], stages["embed"]),
+            "store_chunks_per_second": rate(median["chunks"], stages["store"])
+        },
+        "peak_rss_mb": peak_rss_mb()
+    })
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
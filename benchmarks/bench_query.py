@@ -0,0 +1,168 @@
+"""Offline end-to-end benchmark of RAGChain.query.
+
+Runs the real retrieval, prompt assembly and session code against a Chroma
+index of the bundled PDFs built with a hashing embedder, and a fake LLM
+with configurable latency and token rate. Prints a JSON report with
+per-stage and end-to-end p50/p95/p99 latency, throughput and peak memory.
+
+The benchmark questions carry no session, so the per-worker answer, retrieval
+and query-embedding caches and query coalescing would turn every pass after
+the first (warm-up included) into cache hits; they are off unless --caches or
+--coalescing turn them back on.
+
+    python -m benchmarks.bench_query --iterations 3 --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import (
+    BUNDLED_PDFS, open_cached_index, peak_rss_mb, percentiles, report_header, write_report
+)
+from benchmarks.stand_ins import FakeChatModel, HashingEmbeddings
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.json")
+
+
+def load_questions(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_sync(rag_chain, questions, concurrency):
+    latencies = []
+
+    def one(question):
+        # Without a session id every benchmark question starts a fresh, context-free conversation
+        start = time.perf_counter()
+        rag_chain.query(question)
+        latencies.append(time.perf_counter() - start)
+
+    if concurrency <= 1:
+        for question in questions:
+            one(question)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, questions))
+    return latencies
+
+
+def run_async(rag_chain, questions, concurrency):
+    latencies = []
+
+    async def main():
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def one(question):
+            async with semaphore:
+                start = time.perf_counter()
+                await rag_chain.aquery(question)
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one(question) for question in questions))
+
+    asyncio.run(main())
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="JSON list of {corpus, question}")
+    parser.add_argument("--iterations", type=int, default=1, help="Passes over the question set")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed warm-up queries")
+    parser.add_argument("--concurrency", type=int, default=1, help="Queries in flight at once")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync", help="query() or aquery()")
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="Fake LLM time to first token (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0, help="Fake LLM token rate")
+    parser.add_argument("--llm-answer-tokens", type=int, default=250, help="Fake LLM answer length")
+    parser.add_argument("--embedding-dim", type=int, default=384, help="Hashing embedder dimension")
+    parser.add_argument("--caches", action="store_true",
+                        help="Keep the answer, retrieval and query-embedding caches (default: sized 0)")
+    parser.add_argument("--coalescing", action="store_true", help="Keep query coalescing on (default: off)")
+    parser.add_argument("--trace-memory", action="store_true", help="Also report tracemalloc peak (slower)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    from backend import metrics
+    from backend.config import Config
+    from backend.rag_chain import RAGChain
+    from backend.session_cache import SessionCache
+
+    # Read when the vector store and RAGChain build their caches, so set before either exists
+    if not args.caches:
+        Config.ANSWER_CACHE_SIZE = Config.RETRIEVAL_CACHE_SIZE = Config.QUERY_EMBEDDING_CACHE_SIZE = 0
+    Config.QUERY_COALESCING = args.coalescing
+
+    questions = load_questions(args.questions)
+    stage_samples = defaultdict(list)
+    stage_lock = threading.Lock()
+
+    def observe(stage, seconds):
+        with stage_lock:
+            stage_samples[stage].append(seconds)
+
+    # Backend progress prints go to stderr so stdout stays machine-readable
+    with contextlib.redirect_stdout(sys.stderr), tempfile.TemporaryDirectory() as session_dir:
+        embeddings = HashingEmbeddings(args.embedding_dim)
+        vector_store, index_info = open_cached_index(embeddings, BUNDLED_PDFS, "query", args.embedding_dim)
+        llm = FakeChatModel(
+            first_token_latency=args.llm_first_token,
+            tokens_per_second=args.llm_tokens_per_second,
+            answer_tokens=args.llm_answer_tokens
+        )
+        rag_chain = RAGChain(llm=llm, vector_store=vector_store, sessions=SessionCache(session_dir))
+        run = run_async if args.mode == "async" else run_sync
+
+        run(rag_chain, [q["question"] for q in questions[:args.warmup]], 1)
+
+        workload = [q["question"] for q in questions] * args.iterations
+        if args.trace_memory:
+            tracemalloc.start()
+        metrics.add_observer(observe)
+        start = time.perf_counter()
+        latencies = run(rag_chain, workload, args.concurrency)
+        wall_time = time.perf_counter() - start
+        metrics.remove_observer(observe)
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+        if args.trace_memory:
+            tracemalloc.stop()
+        rag_chain.sessions.close()
+
+    report = report_header("query", {
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "iterations": args.iterations,
+        "questions": len(questions),
+        "llm_first_token": args.llm_first_token,
+        "llm_tokens_per_second": args.llm_tokens_per_second,
+        "llm_answer_tokens": args.llm_answer_tokens,
+        "embedding_dim": args.embedding_dim,
+        "answer_cache_size": Config.ANSWER_CACHE_SIZE,
+        "retrieval_cache_size": Config.RETRIEVAL_CACHE_SIZE,
+        "query_embedding_cache_size": Config.QUERY_EMBEDDING_CACHE_SIZE,
+        "query_coalescing": Config.QUERY_COALESCING
+    })
+    report.update({
+        "index": index_info,
+        "queries": len(latencies),
+        "wall_seconds": round(wall_time, 3),
+        "throughput_qps": round(len(latencies) / wall_time, 3) if wall_time else None,
+        "end_to_end": percentiles(latencies),
+        "stages": {stage: percentiles(samples) for stage, samples in sorted(stage_samples.items())},
+        "peak_rss_mb": peak_rss_mb(),
+        "tracemalloc_peak_mb": round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None
+    })
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Worker start-up profile: import cost of app.py, boot to first /api/health, and warm-up time.
+
+Each measurement runs in a fresh interpreter so module caches start cold.
+The import profile comes from `python -X importtime` and lists the modules
+that dominate importing the app, so regressions (a heavy import creeping back
+into module scope) show up by name.
+
+    python -m benchmarks.bench_startup --runs 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import PROJECT_ROOT, percentiles, report_header, write_report
+
+_BOOT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+client = app.app.test_client()
+response = client.get('/api/health')
+health = time.perf_counter() - start
+warm_up = None
+if {warm_up}:
+    warm_start = time.perf_counter()
+    app.rag_chain.get()
+    app.document_processor.get()
+    warm_up = time.perf_counter() - warm_start
+print(json.dumps({{"status": response.status_code, "boot_to_health": health, "warm_up": warm_up}}))
+"""
+
+
+def _env(mode: str, chroma_dir: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    # Snapshots go inside the temporary index directory, so they are removed with it
+    env.update({"WARM_UP": mode, "CHROMA_DB_PATH": chroma_dir, "INDEX_SNAPSHOT_DIR": os.path.join(chroma_dir, "snapshots"),
+                "PYTHONPATH": PROJECT_ROOT})
+    return env
+
+
+def import_profile(mode: str, chroma_dir: str, top: int) -> dict:
+    """Parse -X importtime output for `import app` into totals and the heaviest modules"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=PROJECT_ROOT, env=_env(mode, chroma_dir), capture_output=True, text=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000
+        })
+    # Top-level entries (depth 0) partition the total import time
+    total_ms = sum(m["cumulative_ms"] for m in modules if m["depth"] == 0)
+    app_entry = next((m for m in modules if m["module"] == "app"), None)
+    direct = [m for m in modules if m["depth"] == 1] if app_entry else []
+    return {
+        "total_ms": round(total_ms, 1),
+        "app_cumulative_ms": app_entry["cumulative_ms"] if app_entry else None,
+        "modules_imported": len(modules),
+        "heaviest_app_imports": sorted(direct, key=lambda m: m["cumulative_ms"], reverse=True)[:top],
+        "heaviest_self": sorted(modules, key=lambda m: m["self_ms"], reverse=True)[:top]
+    }
+
+
+def boot(mode: str, chroma_dir: str, warm_up: bool) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", _BOOT_SCRIPT.format(warm_up=warm_up)],
+        cwd=PROJECT_ROOT, env=_env(mode, chroma_dir), capture_output=True, text=True
+    )
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"Boot run failed: {result.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh-interpreter boots per mode")
+    parser.add_argument("--modes", default="lazy,eager", help="Comma-separated WARM_UP modes to compare")
+    parser.add_argument("--top", type=int, default=15, help="Modules listed in the import profile")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    results = {}
+    # An empty index keeps Chroma's open cost comparable across machines
+    with tempfile.TemporaryDirectory() as chroma_dir:
+        for mode in modes:
+            print(f"Profiling WARM_UP={mode}...", file=sys.stderr)
+            runs = [boot(mode, chroma_dir, warm_up=(mode == "lazy")) for _ in range(args.runs)]
+            results[mode] = {
+                "boot_to_health": percentiles([run["boot_to_health"] for run in runs]),
+                "warm_up": percentiles([run["warm_up"] for run in runs if run["warm_up"] is not None]),
+                "import_profile": import_profile(mode, chroma_dir, args.top)
+            }
+
+    report = report_header("startup", {"runs": args.runs, "modes": modes})
+    report["modes"] = results
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Shared helpers for the offline benchmarks"""
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Config.validate() wants a key before Gemini clients are built; the benchmarks never call Gemini
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+CACHE_DIR = os.path.join(PROJECT_ROOT, ".bench_cache")
+BUNDLED_PDFS = [
+    os.path.join(PROJECT_ROOT, name)
+    for name in ("a2023-45.pdf", "250883_english_01042024.pdf", "Finance_Bill.pdf", "20240716890312078.pdf")
+]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 (linear interpolation) plus mean/min/max, in seconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        position = (len(ordered) - 1) * q
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    return {
+        "count": len(ordered),
+        "p50": round(pick(0.50), 6),
+        "p95": round(pick(0.95), 6),
+        "p99": round(pick(0.99), 6),
+        "mean": round(sum(ordered) / len(ordered), 6),
+        "min": round(ordered[0], 6),
+        "max": round(ordered[-1], 6)
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def report_header(benchmark: str, config: Dict) -> Dict:
+    return {
+        "benchmark": benchmark,
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "config": config
+    }
+
+
+def write_report(report: Dict, output: Optional[str]):
+    """Write the machine-readable report to a file, or stdout when no path is given"""
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Wrote report to {output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+def corpus_key(pdfs: List[str], *parts) -> str:
+    """Cache key for an index built from these PDFs with these settings"""
+    digest = hashlib.sha256()
+    for pdf in sorted(pdfs):
+        digest.update(os.path.basename(pdf).encode("utf-8"))
+        digest.update(str(os.path.getsize(pdf)).encode("utf-8"))
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def build_index(vector_store, pdfs: List[str]) -> Dict:
+    """Parse, chunk and index the PDFs into vector_store; returns counts and timings"""
+    from backend.document_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    start = time.perf_counter()
+    documents = processor.process_documents(pdfs)
+    processed = time.perf_counter()
+    vector_store.add_documents(documents)
+    return {
+        "chunks": len(documents),
+        "processing_seconds": round(processed - start, 3),
+        "indexing_seconds": round(time.perf_counter() - processed, 3)
+    }
+
+
+def open_cached_index(embeddings, pdfs: List[str], name: str, *key_parts):
+    """Open (building on first use) a Chroma index of the PDFs under .bench_cache"""
+    from backend.config import Config
+    from backend.vector_store import VectorStore
+
+    chunking = [Config.CHUNKING_MODE]
+    if Config.CHUNKING_MODE == "parent_child":
+        chunking += [Config.CHILD_CHUNK_SIZE, Config.CHILD_CHUNK_OVERLAP]
+    key = corpus_key(pdfs, name, Config.CHUNK_SIZE, Config.CHUNK_OVERLAP, *chunking, VectorStore.INDEX_FORMAT, *key_parts)
+    persist_directory = os.path.join(CACHE_DIR, f"{name}_{key}")
+    vector_store = VectorStore(embeddings=embeddings, persist_directory=persist_directory)
+    info = {"path": persist_directory, "cached": True}
+    if vector_store.is_empty():
+        print(f"Building benchmark index in {persist_directory} (cached for later runs)...", file=sys.stderr)
+        info.update(build_index(vector_store, pdfs))
+        info["cached"] = False
+    return vector_store, info
@@ -0,0 +1,252 @@
+"""Chunking-strategy evaluation: retrieval recall versus prompt cost.
+
+For each combination of chunk size, overlap and splitter in the grid, re-chunks
+the bundled PDFs, indexes them into a fresh Chroma index with a local embedder
+and runs every question of a gold set (questions paired with the provision
+that answers them) through RAGChain's multi-query retrieval, top-document
+selection and prompt assembly, without calling an LLM. Prints a JSON report
+with recall@k and MRR of the gold provision among the documents that go into
+the prompt, index build time, index size and average prompt characters per
+setting.
+
+A prompt document contains the provision when it comes from the gold file
+and holds every evidence phrase (case, punctuation and line breaks ignored).
+Gold entries whose evidence is not in the parsed PDF text at all are listed
+under "unmatched" and left out of the scores.
+
+    LOCAL_EMBEDDING_MODEL_PATH=models/all-MiniLM-L6-v2 \\
+        python -m benchmarks.eval_chunking --chunk-sizes 1000,2000,4000,8000 --output chunking.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.common import BUNDLED_PDFS, peak_rss_mb, report_header, write_report
+from benchmarks.stand_ins import FakeChatModel
+
+GOLD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gold_provisions.json")
+SPLITTERS = ("recursive", "fixed", "parent_child")
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD_PATTERN.findall(text.lower()))
+
+
+def load_gold(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_list(value: str, cast) -> List:
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+@contextlib.contextmanager
+def chunking_config(**settings):
+    """Config values DocumentProcessor and RAGChain read, set for the duration of one setting"""
+    from backend.config import Config
+
+    saved = {name: getattr(Config, name) for name in settings}
+    for name, value in settings.items():
+        setattr(Config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(Config, name, value)
+
+
+def match_gold(gold: List[Dict], pages) -> Tuple[List[Dict], List[Dict]]:
+    """Gold entries whose evidence occurs in the parsed text of their file, and those that do not"""
+    corpus = {}
+    for page in pages:
+        corpus.setdefault(page.metadata["file_name"], []).append(page.page_content)
+    corpus = {file_name: normalize(" ".join(texts)) for file_name, texts in corpus.items()}
+    scored, unmatched = [], []
+    for entry in gold:
+        text = corpus.get(entry["file"])
+        if text is None:
+            unmatched.append({"provision": entry["provision"], "file": entry["file"], "reason": "file not ingested"})
+        elif not all(normalize(phrase) in text for phrase in entry["evidence"]):
+            unmatched.append({"provision": entry["provision"], "file": entry["file"], "reason": "evidence not in text"})
+        else:
+            scored.append(entry)
+    return scored, unmatched
+
+
+def gold_rank(entry: Dict, top_docs: List[Dict]):
+    """1-based position of the first prompt document holding the provision, or None"""
+    phrases = [normalize(phrase) for phrase in entry["evidence"]]
+    for rank, doc in enumerate(top_docs, 1):
+        if doc["metadata"].get("file_name") != entry["file"]:
+            continue
+        content = normalize(doc["content"])
+        if all(phrase in content for phrase in phrases):
+            return rank
+    return None
+
+
+def evaluate(pages, gold: List[Dict], embeddings, chunk_size: int, overlap: int, splitter: str,
+             ks: List[int], session_dir: str) -> Dict:
+    """Chunk, index and query one setting; returns its scores and costs"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    from backend import metrics
+    from backend.document_processor import DocumentProcessor
+    from backend.rag_chain import RAGChain
+    from backend.session_cache import SessionCache
+    from backend.vector_store import VectorStore
+
+    searches = []
+
+    def observe(stage, seconds):
+        if stage == "vector_search":
+            searches.append(seconds)
+
+    mode = "parent_child" if splitter == "parent_child" else "standard"
+    with chunking_config(CHUNK_SIZE=chunk_size, CHUNK_OVERLAP=overlap, CHUNKING_MODE=mode), \
+            tempfile.TemporaryDirectory() as persist_directory:
+        processor = DocumentProcessor()
+        if splitter == "fixed":
+            # Fixed-length windows that ignore paragraph and sentence boundaries
+            processor.text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size, chunk_overlap=overlap, length_function=len, separators=[""]
+            )
+        start = time.perf_counter()
+        chunks = processor.split_documents(pages)
+        vector_store = VectorStore(embeddings=embeddings, persist_directory=persist_directory)
+        vector_store.add_documents(chunks)
+        build_seconds = time.perf_counter() - start
+
+        rag_chain = RAGChain(llm=FakeChatModel(), vector_store=vector_store, sessions=SessionCache(session_dir))
+        ranks, prompt_chars, context_chars, prompt_docs, missed = [], [], [], [], []
+        metrics.add_observer(observe)
+        try:
+            for entry in gold:
+                # The same steps as RAGChain._answer_from_documents up to the LLM call
+                retrieved = rag_chain.multi_query_retrieval(entry["question"])
+                top_docs = rag_chain._hydrate(rag_chain._select_top_docs(retrieved))
+                prompt = rag_chain._build_prompt(entry["question"], top_docs, "", False)
+                rank = gold_rank(entry, top_docs)
+                ranks.append(rank)
+                if rank is None:
+                    missed.append(entry["provision"])
+                prompt_chars.append(len(prompt))
+                context_chars.append(sum(len(doc["content"]) for doc in top_docs))
+                prompt_docs.append(len(top_docs))
+        finally:
+            metrics.remove_observer(observe)
+        rag_chain.sessions.close()
+        vector_store.close()
+        index_bytes = directory_bytes(persist_directory)
+
+    parents = sum(1 for chunk in chunks if chunk.metadata.get("chunk_role") == "parent")
+    count = len(gold) or 1
+    return {
+        "splitter": splitter,
+        "chunk_size": chunk_size,
+        "chunk_overlap": overlap,
+        "chunks": len(chunks) - parents,
+        "parents": parents,
+        "recall": {f"@{k}": round(sum(1 for rank in ranks if rank is not None and rank <= k) / count, 4) for k in ks},
+        "mrr": round(sum(1 / rank for rank in ranks if rank is not None) / count, 4),
+        "build_seconds": round(build_seconds, 3),
+        "index_bytes": index_bytes,
+        "avg_prompt_chars": round(sum(prompt_chars) / count, 1),
+        "avg_context_chars": round(sum(context_chars) / count, 1),
+        "avg_prompt_docs": round(sum(prompt_docs) / count, 2),
+        "avg_searches": round(len(searches) / count, 2),
+        "missed": missed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gold", default=GOLD_PATH, help="JSON list of {question, file, provision, evidence}")
+    parser.add_argument("--pdfs", nargs="+", default=BUNDLED_PDFS, help="PDFs to index (default: the bundled ones)")
+    parser.add_argument("--chunk-sizes", default="1000,2000,4000,8000", help="Comma-separated chunk sizes (characters)")
+    parser.add_argument("--overlaps", default="0.125",
+                        help="Comma-separated overlaps as fractions of the chunk size (0.125 = the default 1000/8000)")
+    parser.add_argument("--splitters", default=",".join(SPLITTERS),
+                        help="Comma-separated: recursive (DocumentProcessor's), fixed (fixed-length windows), "
+                             "parent_child (the chunk size is the parent's)")
+    parser.add_argument("--child-size", type=int, default=None, help="parent_child child size (default: CHILD_CHUNK_SIZE)")
+    parser.add_argument("--child-overlap", type=int, default=None, help="parent_child child overlap (default: CHILD_CHUNK_OVERLAP)")
+    parser.add_argument("--k", default="1,3,5,10", help="Comma-separated cut-offs for recall@k")
+    parser.add_argument("--embedding-backend", choices=["local", "hashing"], default="local",
+                        help="local (LOCAL_EMBEDDING_MODEL_PATH) or hashing for a quick dry run")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    splitters = parse_list(args.splitters, str)
+    for splitter in splitters:
+        if splitter not in SPLITTERS:
+            parser.error(f"unknown splitter {splitter!r} (expected one of {', '.join(SPLITTERS)})")
+    ks = parse_list(args.k, int)
+    grid = [(size, int(size * fraction), splitter)
+            for size in parse_list(args.chunk_sizes, int)
+            for fraction in parse_list(args.overlaps, float)
+            for splitter in splitters]
+    for size, overlap, _ in grid:
+        if not 0 <= overlap < size:
+            parser.error(f"overlap {overlap} does not fit chunk size {size}")
+
+    from backend.config import Config
+    from backend.document_processor import DocumentProcessor
+    from backend.embeddings import create_embeddings, embedding_identity
+
+    child_size = args.child_size or Config.CHILD_CHUNK_SIZE
+    child_overlap = Config.CHILD_CHUNK_OVERLAP if args.child_overlap is None else args.child_overlap
+    gold = load_gold(args.gold)
+
+    # Backend progress prints go to stderr so stdout stays machine-readable
+    with contextlib.redirect_stdout(sys.stderr), tempfile.TemporaryDirectory() as session_dir, \
+            chunking_config(CHILD_CHUNK_SIZE=child_size, CHILD_CHUNK_OVERLAP=child_overlap):
+        embeddings = create_embeddings(args.embedding_backend)
+        processor = DocumentProcessor()
+        pages = [page for pdf in args.pdfs for page in processor.load_pdf(pdf)]
+        scored, unmatched = match_gold(gold, pages)
+        for entry in unmatched:
+            print(f"Gold entry {entry['provision']} ({entry['file']}) left out: {entry['reason']}", file=sys.stderr)
+        if not scored:
+            raise SystemExit("No gold entry matches the parsed PDFs; nothing to score")
+
+        settings = []
+        for i, (size, overlap, splitter) in enumerate(grid, 1):
+            print(f"[{i}/{len(grid)}] {splitter} chunks of {size} characters, overlap {overlap}", file=sys.stderr)
+            settings.append(evaluate(pages, scored, embeddings, size, overlap, splitter, ks, session_dir))
+
+    report = report_header("chunking", {
+        "pdfs": [os.path.basename(pdf) for pdf in args.pdfs],
+        "gold": os.path.basename(args.gold),
+        "k": ks,
+        "child_chunk_size": child_size,
+        "child_chunk_overlap": child_overlap,
+        "embeddings": embedding_identity(embeddings),
+        "adaptive_retrieval": Config.ADAPTIVE_RETRIEVAL
+    })
+    report.update({
+        "pages": len(pages),
+        "gold_entries": len(gold),
+        "scored": len(scored),
+        "unmatched": unmatched,
+        "settings": settings,
+        "peak_rss_mb": peak_rss_mb()
+    })
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""HTTP load test of the gunicorn deployment with stubbed Gemini backends.
+
+Boots benchmarks.stub_app:app (the real Flask app with local stand-ins for
+Gemini) under gunicorn with the repo's gunicorn.conf.py, then drives an
+open-loop mix of queries, follow-ups, recent-session listings and uploads
+at each requested rate. Arrivals follow a seeded Poisson process and do not
+wait for earlier responses, so queueing shows up as latency, not as a lower
+offered load. Prints a JSON report with the throughput/latency curve, error
+rates and per-worker peak RSS for every worker/worker-class combination.
+
+    python -m benchmarks.loadtest --workers 2,4 --worker-class gevent,sync \\
+        --rates 1,2,5,10 --duration 30 --output load.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import (
+    BUNDLED_PDFS, PROJECT_ROOT, open_cached_index, percentiles, report_header, write_report
+)
+from benchmarks.bench_query import QUESTIONS_PATH, load_questions
+from benchmarks.stand_ins import HashingEmbeddings
+
+FOLLOW_UPS = [
+    "Tell me more about this",
+    "What about the penalties?",
+    "Can you elaborate on the exceptions?",
+    "In that case, what are the remedies?"
+]
+
+
+def parse_mix(text: str):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"query", "followup", "recent", "upload"}
+    if unknown:
+        raise ValueError(f"Unknown operations in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_small_pdf(path: str, pages: int = 2):
+    """A few pages of the BNS act, so uploads exercise the real ingestion path quickly"""
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(BUNDLED_PDFS[0])
+    writer = PdfWriter()
+    for page in reader.pages[:pages]:
+        writer.add_page(page)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def worker_pids(master_pid: int):
+    """Gunicorn worker processes (children of the master), from /proc"""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == master_pid:
+                pids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+
+def rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+class Server:
+    """One gunicorn instance running the stub app"""
+
+    def __init__(self, workers: int, worker_class: str, timeout: int, index_dir: str, stub_env: dict):
+        self.port = free_port()
+        self.workdir = tempfile.mkdtemp(prefix="loadtest_")
+        chroma_dir = os.path.join(self.workdir, "chroma_db")
+        # Each server gets its own copy so uploads never touch the cached index
+        shutil.copytree(index_dir, chroma_dir)
+        env = dict(os.environ, CHROMA_DB_PATH=chroma_dir, INDEX_SNAPSHOT_DIR=os.path.join(self.workdir, "index_snapshots"),
+                   PYTHONPATH=PROJECT_ROOT, **stub_env)
+        self.log = open(os.path.join(self.workdir, "gunicorn.log"), "w")
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn",
+                "-c", os.path.join(PROJECT_ROOT, "gunicorn.conf.py"),
+                "--workers", str(workers),
+                "--worker-class", worker_class,
+                "--timeout", str(timeout),
+                "--bind", f"127.0.0.1:{self.port}",
+                "benchmarks.stub_app:app"
+            ],
+            cwd=self.workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        self.base_url = f"http://127.0.0.1:{self.port}"
+
+    def wait_ready(self, workers: int, timeout: float = 120.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited early, see {self.log.name}")
+            try:
+                with urllib.request.urlopen(f"{self.base_url}/api/health", timeout=2) as response:
+                    if response.status == 200 and len(worker_pids(self.process.pid)) >= workers:
+                        return
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass
+            time.sleep(0.5)
+        raise RuntimeError(f"gunicorn did not become ready in {timeout}s, see {self.log.name}")
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, questions, upload_pdf: str, request_timeout: float, seed: int):
+        self.base_url = base_url
+        self.questions = questions
+        self.upload_pdf = upload_pdf
+        self.request_timeout = request_timeout
+        self.random = random.Random(seed)
+        self.sessions = []
+        self.sessions_lock = threading.Lock()
+
+    def _request(self, method: str, path: str, body: bytes = None, headers: dict = None):
+        request = urllib.request.Request(f"{self.base_url}{path}", data=body, method=method, headers=headers or {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.request_timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def _post_json(self, path: str, payload: dict):
+        return self._request("POST", path, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json"})
+
+    def query(self, question: str):
+        status, body = self._post_json("/api/query", {"question": question})
+        if status == 200:
+            session_id = json.loads(body).get("session_id")
+            if session_id:
+                with self.sessions_lock:
+                    self.sessions.append(session_id)
+                    del self.sessions[:-200]
+        return status
+
+    def followup(self, question: str, session_id: str):
+        if session_id is None:
+            return self.query(question)
+        return self._post_json("/api/query", {"question": question, "session_id": session_id})[0]
+
+    def recent(self):
+        return self._request("GET", "/api/recent-sessions?limit=10")[0]
+
+    def upload(self):
+        boundary = uuid.uuid4().hex
+        with open(self.upload_pdf, "rb") as f:
+            content = f.read()
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"loadtest_{boundary[:8]}.pdf\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n"
+        ).encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode("utf-8")
+        return self._request("POST", "/api/upload-documents", body,
+                             {"Content-Type": f"multipart/form-data; boundary={boundary}"})[0]
+
+    def next_operation(self, mix: dict):
+        """Pick the next operation and its arguments up front, on the scheduler thread"""
+        names = list(mix)
+        name = self.random.choices(names, weights=[mix[n] for n in names])[0]
+        if name == "query":
+            return name, (self.random.choice(self.questions),)
+        if name == "followup":
+            with self.sessions_lock:
+                session_id = self.random.choice(self.sessions) if self.sessions else None
+            question = self.random.choice(FOLLOW_UPS) if session_id else self.random.choice(self.questions)
+            return name, (question, session_id)
+        return name, ()
+
+
+def run_step(generator: LoadGenerator, master_pid: int, rate: float, duration: float, mix: dict, max_in_flight: int):
+    """Offer `rate` requests/s for `duration` seconds, open-loop"""
+    samples = []
+    samples_lock = threading.Lock()
+    worker_peak = defaultdict(float)
+    stop_sampling = threading.Event()
+
+    def sample_memory():
+        while not stop_sampling.is_set():
+            for pid in worker_pids(master_pid):
+                value = rss_mb(pid)
+                if value is not None:
+                    worker_peak[pid] = max(worker_peak[pid], value)
+            stop_sampling.wait(0.5)
+
+    def execute(name, args, scheduled_at):
+        start = time.perf_counter()
+        try:
+            status = getattr(generator, name)(*args)
+        except Exception as e:
+            status = f"error:{type(e).__name__}"
+        end = time.perf_counter()
+        with samples_lock:
+            # Latency is measured from the scheduled send time, so client-side queueing counts too
+            samples.append((name, status, end - scheduled_at, end - start))
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    pool = ThreadPoolExecutor(max_workers=max_in_flight)
+    step_start = time.perf_counter()
+    next_arrival = step_start
+    sent = 0
+    while True:
+        next_arrival += generator.random.expovariate(rate)
+        if next_arrival - step_start >= duration:
+            break
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        name, args = generator.next_operation(mix)
+        pool.submit(execute, name, args, next_arrival)
+        sent += 1
+    pool.shutdown(wait=True)
+    elapsed = time.perf_counter() - step_start
+    stop_sampling.set()
+    sampler.join()
+
+    statuses = Counter(str(status) for _, status, _, _ in samples)
+    ok = [s for s in samples if s[1] == 200]
+    by_operation = defaultdict(list)
+    for name, status, latency, _ in ok:
+        by_operation[name].append(latency)
+    return {
+        "offered_rps": rate,
+        "sent": sent,
+        "completed": len(samples),
+        "achieved_rps": round(len(ok) / elapsed, 3),
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "rejected_429": statuses.get("429", 0),
+        "status_counts": dict(statuses),
+        "latency": percentiles([s[2] for s in ok]),
+        "latency_by_operation": {name: percentiles(values) for name, values in sorted(by_operation.items())},
+        "worker_peak_rss_mb": {str(pid): peak for pid, peak in sorted(worker_peak.items())}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="4", help="Comma-separated worker counts to test")
+    parser.add_argument("--worker-class", default="gevent", help="Comma-separated worker classes to test")
+    parser.add_argument("--timeout", type=int, default=120, help="Gunicorn worker timeout (s)")
+    parser.add_argument("--rates", default="1,2,5,10", help="Comma-separated offered loads (requests/s)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per rate step")
+    parser.add_argument("--mix", default="query=70,followup=20,recent=8,upload=2",
+                        help="Operation weights: query, followup, recent, upload")
+    parser.add_argument("--max-in-flight", type=int, default=512, help="Client-side concurrency cap")
+    parser.add_argument("--request-timeout", type=float, default=180.0, help="Client request timeout (s)")
+    parser.add_argument("--llm-first-token", type=float, default=0.5)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--llm-answer-tokens", type=int, default=250)
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    rates = [float(rate) for rate in args.rates.split(",")]
+    questions = [q["question"] for q in load_questions(QUESTIONS_PATH)]
+    stub_env = {
+        "STUB_LLM_FIRST_TOKEN": str(args.llm_first_token),
+        "STUB_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+        "STUB_LLM_ANSWER_TOKENS": str(args.llm_answer_tokens),
+        "STUB_EMBEDDING_DIM": str(args.embedding_dim),
+        # Also for the gunicorn master, which opens the index before any stub is loaded
+        "EMBEDDING_BACKEND": "hashing",
+        "HASHING_EMBEDDING_DIM": str(args.embedding_dim)
+    }
+
+    with contextlib.redirect_stdout(sys.stderr):
+        _, index_info = open_cached_index(HashingEmbeddings(args.embedding_dim), BUNDLED_PDFS, "query", args.embedding_dim)
+
+    runs = []
+    with tempfile.TemporaryDirectory() as scratch:
+        upload_pdf = os.path.join(scratch, "upload.pdf")
+        make_small_pdf(upload_pdf)
+        for worker_class in args.worker_class.split(","):
+            for workers in [int(w) for w in args.workers.split(",")]:
+                print(f"Starting gunicorn: {workers} x {worker_class}", file=sys.stderr)
+                server = Server(workers, worker_class, args.timeout, index_info["path"], stub_env)
+                try:
+                    server.wait_ready(workers)
+                    generator = LoadGenerator(server.base_url, questions, upload_pdf, args.request_timeout, args.seed)
+                    steps = []
+                    for rate in rates:
+                        print(f"  offering {rate} req/s for {args.duration}s", file=sys.stderr)
+                        steps.append(run_step(generator, server.process.pid, rate, args.duration, mix, args.max_in_flight))
+                    runs.append({"workers": workers, "worker_class": worker_class, "steps": steps})
+                finally:
+                    server.stop()
+
+    report = report_header("loadtest", {
+        "timeout": args.timeout,
+        "rates": rates,
+        "duration": args.duration,
+        "mix": mix,
+        "llm_first_token": args.llm_first_token,
+        "llm_tokens_per_second": args.llm_tokens_per_second,
+        "llm_answer_tokens": args.llm_answer_tokens,
+        "embedding_dim": args.embedding_dim,
+        "seed": args.seed
+    })
+    report["runs"] = runs
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Deterministic local stand-ins for the Gemini embedding and chat models.
+
+They let the benchmarks exercise the real RAGChain / VectorStore / Chroma
+code paths without network calls, cost or run-to-run noise from the API.
+The embedder is the app's own hashing backend (EMBEDDING_BACKEND=hashing).
+"""
+import asyncio
+import hashlib
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from backend.embeddings import HashingEmbeddings  # noqa: F401  (re-exported for the benchmarks)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers after a fixed first-token latency at a fixed token rate"""
+
+    first_token_latency: float = 0.5
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 300
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _answer_tokens(self, messages: List[BaseMessage]) -> List[str]:
+        # Deterministic answer derived from the prompt so identical prompts give identical output
+        seed = hashlib.sha256(messages[-1].content.encode("utf-8")).hexdigest()
+        return [f"token{seed[i % len(seed)]}{i} " for i in range(self.answer_tokens)]
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._answer_tokens(messages)
+        time.sleep(self.first_token_latency + self._token_delay() * (len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._answer_tokens(messages)
+        await asyncio.sleep(self.first_token_latency + self._token_delay() * (len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._answer_tokens(messages)):
+            time.sleep(self.first_token_latency if i == 0 else self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._answer_tokens(messages)):
+            await asyncio.sleep(self.first_token_latency if i == 0 else self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
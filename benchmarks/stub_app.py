@@ -0,0 +1,30 @@
+"""WSGI entry point for load tests: the real app:app with Gemini replaced by local stand-ins.
+
+    gunicorn -c gunicorn.conf.py benchmarks.stub_app:app
+
+Stand-in behaviour is configured through environment variables:
+STUB_LLM_FIRST_TOKEN (s), STUB_LLM_TOKENS_PER_SECOND, STUB_LLM_ANSWER_TOKENS
+and STUB_EMBEDDING_DIM (must match the index the server is pointed at).
+"""
+import os
+
+import benchmarks.common  # noqa: F401  (sets a placeholder GOOGLE_API_KEY)
+import backend.rag_chain
+from backend.config import Config
+from benchmarks.stand_ins import FakeChatModel
+
+
+def _fake_llm(**kwargs):
+    return FakeChatModel(
+        first_token_latency=float(os.getenv("STUB_LLM_FIRST_TOKEN", "0.5")),
+        tokens_per_second=float(os.getenv("STUB_LLM_TOKENS_PER_SECOND", "100")),
+        answer_tokens=int(os.getenv("STUB_LLM_ANSWER_TOKENS", "250"))
+    )
+
+
+# The hashing embedding backend stands in for Gemini embeddings
+Config.EMBEDDING_BACKEND = "hashing"
+Config.HASHING_EMBEDDING_DIM = int(os.getenv("STUB_EMBEDDING_DIM", "384"))
+backend.rag_chain.ChatGoogleGenerativeAI = _fake_llm
+
+from app import app  # noqa: E402
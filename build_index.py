@@ -0,0 +1,123 @@
+import argparse
+import hashlib
+import os
+import sys
+
+from backend.index_artifact import read_manifest, verify_artifact, write_artifact
+
+# Builds the read-only index artifact served when INDEX_ARTIFACT_PATH is set.
+# Build once (locally or in CI), then ship the directory with the deploy.
+
+
+def find_pdfs(project_root: str) -> list:
+    """PDFs in the project root and the uploads folder, as indexed by run_indexing.py"""
+    pdf_files = []
+    for folder in (project_root, os.path.join(project_root, 'uploads')):
+        if os.path.exists(folder):
+            pdf_files.extend(os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.lower().endswith('.pdf'))
+    return pdf_files
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunks_from_pdfs(pdf_files: list, batch_size: int = 100):
+    """Parse, split and embed the PDFs with the EMBEDDING_BACKEND embedder (with parent-child
+    chunking, the children; the parents' text is returned by parent_id)"""
+    from backend.document_processor import DocumentProcessor
+    from backend.embeddings import create_embeddings, embedding_identity
+    from backend.vector_store import VectorStore
+
+    embeddings = create_embeddings()
+    documents = DocumentProcessor().process_documents(pdf_files)
+    parent_texts = {doc.metadata["parent_id"]: doc.page_content
+                    for doc in documents if doc.metadata.get("chunk_role") == "parent"}
+    documents = [doc for doc in documents if doc.metadata.get("chunk_role") != "parent"]
+    texts = [doc.page_content for doc in documents]
+    metadatas = [doc.metadata for doc in documents]
+    # The live index's ids (source file hash and position), so both build paths and the
+    # Chroma index agree; a chunk without a source file falls back to a content hash
+    ids = [VectorStore.chunk_id(doc) or
+           hashlib.sha256(f"{doc.metadata.get('file_name')}\0{doc.metadata.get('chunk_index')}\0{doc.page_content}".encode("utf-8")).hexdigest()[:32]
+           for doc in documents]
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+        print(f"Embedded {min(start + batch_size, len(texts))}/{len(texts)} chunks")
+    sources = [{"file": os.path.basename(pdf), "bytes": os.path.getsize(pdf), "sha256": _file_sha256(pdf)}
+               for pdf in pdf_files]
+    return ids, texts, metadatas, vectors, sources, embedding_identity(embeddings), parent_texts
+
+
+def chunks_from_chroma(persist_directory: str, page_size: int = 1000):
+    """Export an existing Chroma index (no re-embedding)"""
+    from backend.vector_store import VectorStore
+
+    vector_store = VectorStore(persist_directory=persist_directory)
+    ids, metadatas, vectors = [], [], []
+    total = vector_store.count()
+    for offset in range(0, total, page_size):
+        page = vector_store.vector_store._collection.get(
+            limit=page_size, offset=offset, include=["metadatas", "embeddings"]
+        )
+        ids.extend(page["ids"])
+        metadatas.extend(page["metadatas"])
+        vectors.extend(page["embeddings"])
+    found = vector_store.get_texts(ids)
+    texts = [found.get(chunk_id, "") for chunk_id in ids]
+    parent_texts = vector_store.get_texts(sorted({meta["parent_id"] for meta in metadatas if meta.get("parent_id")}))
+    # As recorded by the index (opening it has checked that the configured backend matches)
+    identity = vector_store.embedding_info or vector_store.embeddings.identity
+    return ids, texts, metadatas, vectors, [{"chroma": os.path.abspath(persist_directory)}], identity, parent_texts
+
+
+def build(output: str, pdf_files: list = None, from_chroma: str = None, force: bool = False):
+    if from_chroma:
+        print(f"Exporting Chroma index {from_chroma}...")
+        ids, texts, metadatas, vectors, sources, identity, parent_texts = chunks_from_chroma(from_chroma)
+    else:
+        pdf_files = pdf_files or find_pdfs(os.path.dirname(os.path.abspath(__file__)))
+        if not pdf_files:
+            print("No PDF files found to index.")
+            return
+        print(f"Indexing {len(pdf_files)} PDF files...")
+        ids, texts, metadatas, vectors, sources, identity, parent_texts = chunks_from_pdfs(pdf_files)
+
+    if not ids:
+        print("No chunks to write.")
+        return
+    manifest = write_artifact(output, ids, texts, metadatas, vectors, identity["model"], sources, force=force,
+                              embedding_backend=identity["backend"], parent_texts=parent_texts)
+    size = sum(f["bytes"] for f in manifest["files"].values())
+    print(f"Wrote index artifact {manifest['version']} to {output}: "
+          f"{manifest['chunks']} chunks ({manifest['chunking']} chunking), dimension {manifest['dimension']}, {size / 1024 / 1024:.1f} MiB")
+
+
+def verify(path: str) -> bool:
+    problems = verify_artifact(path)
+    for problem in problems:
+        print(f"  {problem}")
+    if problems:
+        print(f"Index artifact {path} is corrupt")
+        return False
+    print(f"Index artifact {read_manifest(path)['version']} in {path} is intact")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a versioned, checksummed read-only index artifact")
+    parser.add_argument("--output", default="index_artifact", help="Artifact directory to write")
+    parser.add_argument("--pdf", action="append", help="PDF to index (repeatable; default: PDFs in the project root and uploads/)")
+    parser.add_argument("--from-chroma", metavar="DIR", help="Export an existing Chroma index instead of re-embedding PDFs")
+    parser.add_argument("--force", action="store_true", help="Replace an existing artifact at --output")
+    parser.add_argument("--verify", metavar="DIR", help="Check an artifact's files against its manifest and exit")
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.exit(0 if verify(args.verify) else 1)
+    build(args.output, args.pdf, args.from_chroma, args.force)
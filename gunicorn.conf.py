@@ -15,42 +15,69 @@ def on_starting(server):
     print("GUNICORN: Master process is starting. Initializing vector store...")
 
     import os
-    from backend.document_processor import DocumentProcessor
-    from backend.vector_store import VectorStore
+    import shutil
+    from backend.config import Config
 
-    # Initialize components
-    document_processor = DocumentProcessor()
-    vector_store = VectorStore()
+    if Config.METRICS_ENABLED:
+        # Workers write their metrics here so /metrics can aggregate across processes.
+        # Must be set before any process imports prometheus_client.
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = Config.METRICS_DIR
+        shutil.rmtree(Config.METRICS_DIR, ignore_errors=True)
+        os.makedirs(Config.METRICS_DIR, exist_ok=True)
 
-    if vector_store.is_empty():
-        print("GUNICORN: Vector store is empty. Starting initialization.")
+    if Config.INDEX_ARTIFACT_PATH:
+        # A prebuilt artifact is mounted by each worker as is; nothing to index here
+        print(f"GUNICORN: Serving index artifact {Config.INDEX_ARTIFACT_PATH}. Skipping initialization.")
+        return
 
-        project_root = os.path.dirname(os.path.abspath(__file__))
-        upload_folder = os.path.join(project_root, 'uploads')
+    from backend.vector_store import open_index_writer
 
-        pdf_files = []
+    # Initialize components; with INDEX_SNAPSHOTS the documents go into a new index version
+    vector_store = open_index_writer()
 
-        # Find PDFs in project root
-        for f in os.listdir(project_root):
+    project_root = os.path.dirname(os.path.abspath(__file__))
+    upload_folder = os.path.join(project_root, 'uploads')
+
+    pdf_files = []
+
+    # Find PDFs in project root
+    for f in os.listdir(project_root):
+        if f.lower().endswith('.pdf'):
+            pdf_files.append(os.path.join(project_root, f))
+
+    # Find PDFs in uploads folder
+    if os.path.exists(upload_folder):
+        for f in os.listdir(upload_folder):
             if f.lower().endswith('.pdf'):
-                pdf_files.append(os.path.join(project_root, f))
-
-        # Find PDFs in uploads folder
-        if os.path.exists(upload_folder):
-            for f in os.listdir(upload_folder):
-                if f.lower().endswith('.pdf'):
-                    pdf_files.append(os.path.join(upload_folder, f))
-
-        if pdf_files:
-            print(f"GUNICORN: Found {len(pdf_files)} PDF files for indexing.")
-            documents = document_processor.process_documents(pdf_files)
-
-            if documents:
-                vector_store.add_documents(documents)
-                print(f"GUNICORN: Successfully initialized vector store with {len(documents)} document chunks.")
-            else:
-                print("GUNICORN: Could not process any documents.")
+                pdf_files.append(os.path.join(upload_folder, f))
+
+    # A start-up that was killed or hit the embedding quota partway resumes from its last checkpoint
+    pending = vector_store.pending_files(pdf_files)
+    if pending:
+        print(f"GUNICORN: Found {len(pending)} of {len(pdf_files)} PDF files to index.")
+        from backend.document_processor import DocumentProcessor
+        documents = DocumentProcessor().process_documents(pending)
+
+        if documents:
+            vector_store.add_documents(documents)
+            print(f"GUNICORN: Successfully indexed {len(documents)} document chunks.")
         else:
-            print("GUNICORN: No PDF files found for initialization.")
+            print("GUNICORN: Could not process any documents.")
+    elif pdf_files:
+        print("GUNICORN: All PDF files are already indexed. Skipping initialization.")
     else:
-        print("GUNICORN: Vector store already contains documents. Skipping initialization.")
+        print("GUNICORN: No PDF files found for initialization.")
+
+
+def post_worker_init(worker):
+    """Check that blocking SDK calls will not stall this worker's other requests"""
+    from backend.config import Config
+    if Config.BLOCKING_SELF_CHECK:
+        from backend.blocking import self_check
+        self_check()
+
+
+def child_exit(server, worker):
+    """Remove an exited worker's live gauges from the shared metrics directory"""
+    from backend import metrics
+    metrics.mark_process_dead(worker.pid)
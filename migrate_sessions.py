@@ -0,0 +1,30 @@
+import argparse
+import os
+
+from backend.session_store import SQLiteSessionStore, migrate_json_sessions
+
+# One-off migration of context_history/session_<id>.json files into the SQLite session store.
+
+def migrate(context_dir: str, remove_json: bool = False):
+    """Copy all JSON sessions in context_dir into context_dir/sessions.db"""
+    if not os.path.isdir(context_dir):
+        print(f"Context directory not found: {context_dir}")
+        return
+
+    store = SQLiteSessionStore(os.path.join(context_dir, "sessions.db"))
+    migrated = migrate_json_sessions(context_dir, store)
+    print(f"Migrated {migrated} sessions into {store.db_path}")
+
+    if remove_json:
+        for filename in os.listdir(context_dir):
+            if filename.startswith("session_") and filename.endswith(".json"):
+                os.remove(os.path.join(context_dir, filename))
+        print("Removed migrated JSON session files")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate JSON conversation sessions into SQLite")
+    parser.add_argument("--context-dir", default="context_history", help="Directory holding session_<id>.json files")
+    parser.add_argument("--remove-json", action="store_true", help="Delete the JSON files after migrating")
+    args = parser.parse_args()
+    migrate(args.context_dir, args.remove_json)
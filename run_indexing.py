@@ -1,6 +1,6 @@
 import os
-from backend.document_processor import DocumentProcessor
-from backend.vector_store import VectorStore
+from backend.config import Config
+from backend.vector_store import open_index_writer
 
 # This script is intended to be run as a one-off task to index documents.
 
@@ -11,40 +11,47 @@ def initialize_documents():
     project_root = os.path.dirname(os.path.abspath(__file__))
     print(f"Searching for PDF documents in project root: {project_root}")
 
-    document_processor = DocumentProcessor()
-    vector_store = VectorStore()
+    if Config.INDEX_ARTIFACT_PATH:
+        print("INDEX_ARTIFACT_PATH is set; build the artifact with build_index.py instead.")
+        return
+
+    # With INDEX_SNAPSHOTS the documents go into a new index version that running workers switch to
+    vector_store = open_index_writer()
     upload_folder = os.path.join(project_root, 'uploads')
 
     try:
-        if vector_store.is_empty():
-            print("Vector store is empty. Initializing with existing PDFs...")
-            
-            pdf_files = []
-            
-            # Check project root directory for PDF files
-            for f in os.listdir(project_root):
+        pdf_files = []
+        
+        # Check project root directory for PDF files
+        for f in os.listdir(project_root):
+            if f.lower().endswith('.pdf'):
+                pdf_files.append(os.path.join(project_root, f))
+        
+        # Check uploads directory for PDF files
+        if os.path.exists(upload_folder):
+            for f in os.listdir(upload_folder):
                 if f.lower().endswith('.pdf'):
-                    pdf_files.append(os.path.join(project_root, f))
-            
-            # Check uploads directory for PDF files
-            if os.path.exists(upload_folder):
-                for f in os.listdir(upload_folder):
-                    if f.lower().endswith('.pdf'):
-                        pdf_files.append(os.path.join(upload_folder, f))
+                    pdf_files.append(os.path.join(upload_folder, f))
+        
+        if not pdf_files:
+            print("No PDF files found to index.")
+            return
+        
+        # Files a previous run finished are skipped; one it left partway resumes from its last checkpoint
+        pending = vector_store.pending_files(pdf_files)
+        if pending:
+            print(f"Found {len(pending)} of {len(pdf_files)} PDF files to index: {pending}")
+            # PDF parsing and text splitting are only needed when there is something to index
+            from backend.document_processor import DocumentProcessor
+            documents = DocumentProcessor().process_documents(pending)
             
-            if pdf_files:
-                print(f"Found {len(pdf_files)} PDF files for indexing: {pdf_files}")
-                documents = document_processor.process_documents(pdf_files)
-                
-                if documents:
-                    vector_store.add_documents(documents)
-                    print(f"Successfully indexed {len(documents)} document chunks from {len(pdf_files)} files.")
-                else:
-                    print("Could not process any documents from the PDF files.")
+            if documents:
+                vector_store.add_documents(documents)
+                print(f"Successfully indexed {len(documents)} document chunks from {len(pending)} files.")
             else:
-                print("No PDF files found to index.")
+                print("Could not process any documents from the PDF files.")
         else:
-            print("Vector store is not empty. Skipping initialization.")
+            print("All PDF files are already indexed. Skipping initialization.")
             
     except Exception as e:
         print(f"An error occurred during document initialization: {str(e)}")
@@ -0,0 +1,150 @@
+"""Concurrent requests under gevent interleave through run_blocking instead of serializing.
+
+Each scenario runs in a fresh interpreter patched by gevent, as gunicorn's
+gevent worker is: N concurrent "queries" whose stand-ins wait in native code
+(an embedding call, then a streamed answer) the way the Gemini gRPC client
+does. A heartbeat greenlet records how long the worker could not serve
+anything else.
+
+    python -m pytest tests
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("gevent")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERIES = 8
+LATENCY = 0.2  # native wait per blocking call, seconds
+CHUNKS = 3     # streamed chunks per answer
+
+SCENARIO = """
+from gevent import monkey
+monkey.patch_all()
+
+import json
+import sys
+import time
+
+import gevent
+
+from backend.blocking import iterate_blocking, run_blocking
+
+native_sleep = monkey.get_original("time", "sleep")
+queries, latency, chunks = int(sys.argv[1]), float(sys.argv[2]), int(sys.argv[3])
+
+
+def embed():
+    native_sleep(latency)
+    return [0.0]
+
+
+def stream():
+    for i in range(chunks):
+        native_sleep(latency / chunks)
+        yield str(i)
+
+
+def query():
+    run_blocking(embed)
+    return "".join(iterate_blocking(stream()))
+
+
+start = time.perf_counter()
+query()
+single = time.perf_counter() - start
+
+gaps = []
+running = [True]
+
+
+def heartbeat(tick=0.01):
+    last = time.perf_counter()
+    while running[0]:
+        gevent.sleep(tick)
+        now = time.perf_counter()
+        gaps.append(now - last - tick)
+        last = now
+
+
+beat = gevent.spawn(heartbeat)
+gevent.sleep(0)
+start = time.perf_counter()
+gevent.joinall([gevent.spawn(query) for _ in range(queries)])
+wall = time.perf_counter() - start
+running[0] = False
+beat.join()
+print(json.dumps({"single": single, "wall": wall, "max_gap": max(gaps, default=0.0)}))
+"""
+
+
+def run_scenario(pool_size: int) -> dict:
+    env = dict(os.environ, BLOCKING_POOL_SIZE=str(pool_size), PYTHONPATH=PROJECT_ROOT)
+    result = subprocess.run(
+        [sys.executable, "-c", SCENARIO, str(QUERIES), str(LATENCY), str(CHUNKS)],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_concurrent_queries_interleave_through_the_pool():
+    result = run_scenario(pool_size=24)
+    serialized = QUERIES * result["single"]
+    # Interleaved, the batch takes about one query's time; serialized it would take N of them
+    assert result["wall"] < serialized / 3, result
+    # The worker keeps serving other greenlets while the native waits run on the pool
+    assert result["max_gap"] < LATENCY / 2, result
+
+
+def test_pool_size_zero_serializes():
+    result = run_scenario(pool_size=0)
+    serialized = QUERIES * result["single"]
+    assert result["wall"] > serialized * 0.8, result
+    # Each inline native wait holds the whole worker
+    assert result["max_gap"] > LATENCY * 0.8, result
+
+
+STALLED = """
+from gevent import monkey
+monkey.patch_all()
+
+import json
+import time
+
+from backend.blocking import BlockingTimeout, iterate_blocking
+
+native_sleep = monkey.get_original("time", "sleep")
+
+
+def stalled_stream():
+    yield "first"
+    native_sleep(5)
+    yield "never"
+
+
+parts = []
+start = time.perf_counter()
+try:
+    for part in iterate_blocking(stalled_stream(), timeout=lambda: max(0.0, 0.3 - (time.perf_counter() - start))):
+        parts.append(part)
+    timed_out = False
+except BlockingTimeout:
+    timed_out = True
+print(json.dumps({"parts": parts, "timed_out": timed_out, "wall": time.perf_counter() - start}))
+"""
+
+
+def test_bounded_iteration_abandons_a_stalled_stream():
+    env = dict(os.environ, BLOCKING_POOL_SIZE="4", PYTHONPATH=PROJECT_ROOT)
+    result = subprocess.run([sys.executable, "-c", STALLED], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    result = json.loads(result.stdout.strip().splitlines()[-1])
+    assert result["timed_out"] and result["parts"] == ["first"], result
+    # The wait for the stalled chunk ends at the deadline, not when the stream resumes
+    assert result["wall"] < 2, result